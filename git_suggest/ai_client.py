@@ -1,66 +1,442 @@
+import asyncio
+import json
 import os
 import sys
-from google import genai
+import threading
+import time
+from concurrent.futures import Future
 
+from .git_utils import estimate_tokens
+from .metrics import RequestStats
+from .prompt import SYSTEM_PROMPT, build_prompt, extract_message, first_line_complete
+from .timings import TIMINGS, count, phase
 
-SYSTEM_PROMPT = """You are an expert programmer who writes concise and professional git commit messages.
-Based on the following git changes, generate a commit message.
 
-Guidelines:
-- Follow the "Conventional Commits" standard (e.g., 'feat:', 'fix:', 'docs:', 'style:', 'refactor:', 'test:').
-- The message should be a single line, 72 characters or less.
-- Do NOT include any extra text, explanations, or markdown formatting.
-- Just return the raw commit message.
-- Focus on WHAT changed and WHY, not implementation details.
+# HTTP statuses worth another attempt: timeouts, rate limits, server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
 
-EXAMPLE:
-feat: add user login endpoint
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
 
-Here are the changes:
-"""
+# Hedging waits this long before the client has seen enough requests to
+# estimate its own p95 latency
+DEFAULT_HEDGE_DELAY = 2.0
+MIN_HEDGE_SAMPLES = 10
 
+# Where the google-genai SDK sends API-key requests
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/"
 
-class GeminiClient:
-    
-    
-    def __init__(self, api_key=None, model="gemini-2.5-flash"):
+
+def is_retryable(error):
+    """Whether a failed request is worth retrying."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'code', None)
+    if not isinstance(status, int):
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # httpx/httpcore transport failures (connect, read, protocol errors)
+    return type(error).__module__.split('.')[0] in ('httpx', 'httpcore')
+
+
+class BaseClient:
+    """Provider-independent part of a model client.
+
+    Backends only implement ``_astream``, an async iterator over the text
+    chunks of a response; streaming, early termination, retries, hedging,
+    candidates and the synchronous wrappers are shared.
+    """
+
+    provider_name = 'model'
+
+    def __init__(self, model, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, hedge=False, hedge_delay=None):
+        """Initialize the request policy.
+
+        Args:
+            model: Model name to use
+            timeout: Seconds allowed per attempt (None: no limit)
+            retries: Extra attempts after a retryable failure
+            backoff: Base of the exponential wait between attempts, in seconds
+            hedge: Send a second request when the first is slower than usual
+            hedge_delay: Seconds before hedging (default: observed p95 latency)
+        """
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.stats = RequestStats()
+        self._loop = None
+
+    def _astream(self, prompt):
+        """Return an async iterator over the text chunks of the response to ``prompt``."""
+        raise NotImplementedError
+
+    def warm(self):
+        """Get ready for the first request ahead of time (e.g. open a connection).
+
+        Safe to call on a background thread before the client is used
+        elsewhere; failures are ignored and left to the request itself.
+        """
+
+    async def _attempt(self, prompt, on_token=None):
+        """One request: stream the response until its first line is complete."""
+        started = time.perf_counter()
+        stream = await self._astream(prompt)
+
+        text = ''
+        shown = ''
+        try:
+            async for chunk in stream:
+                if not text:
+                    TIMINGS.record('first token', time.perf_counter() - started, started=started)
+                text += chunk
+                if on_token:
+                    message = extract_message(text)
+                    if len(message) > len(shown) and message.startswith(shown):
+                        on_token(message[len(shown):])
+                        shown = message
+                if first_line_complete(text):
+                    break
+        finally:
+            aclose = getattr(stream, 'aclose', None)
+            if aclose:
+                await aclose()
+
+        return extract_message(text)
+
+    async def _timed_attempt(self, prompt, on_token=None):
+        self.stats.attempts += 1
+        self.stats.last_attempts += 1
+        # Every attempt, hedges included, sends the whole prompt again
+        count('bytes_sent', len(prompt.encode('utf-8')))
+        started = time.perf_counter()
+        if self.timeout:
+            message = await asyncio.wait_for(self._attempt(prompt, on_token), self.timeout)
+        else:
+            message = await self._attempt(prompt, on_token)
+        self.stats.record_latency(time.perf_counter() - started)
+        return message
+
+    async def _hedged_attempt(self, prompt, on_token=None):
+        """Race a second request against the first once it exceeds the hedge delay."""
+        delay = self.hedge_delay or self.stats.p95(MIN_HEDGE_SAMPLES) or DEFAULT_HEDGE_DELAY
+        first = asyncio.ensure_future(self._timed_attempt(prompt, on_token))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.stats.hedges += 1
+        # Only the original request echoes tokens, so output is not interleaved
+        second = asyncio.ensure_future(self._timed_attempt(prompt))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def agenerate_commit_message(self, diff_summary, on_token=None):
+        """Stream a commit message from the model, stopping after its first line.
+
+        Only the first line is ever used, so the stream is closed as soon as
+        it is complete instead of paying for tokens that would be discarded.
+        Each attempt is bounded by ``timeout``; retryable failures are retried
+        with exponential backoff, and slow attempts may be hedged.
+
+        Args:
+            diff_summary: Summary of the staged changes
+            on_token: Optional callback receiving each new piece of the message
+                as it arrives, for live display
+
+        Returns:
+            The commit message, or None on failure
+        """
+        if not diff_summary or not diff_summary.strip():
+            print("No staged changes found. Use 'git add' to stage files.", file=sys.stderr)
+            return None
+        return await self.agenerate(build_prompt(diff_summary), on_token)
+
+    async def agenerate(self, prompt, on_token=None):
+        """Send a complete ``prompt`` under the request policy and return the first line, or None."""
+        from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
+
+        request = self._hedged_attempt if self.hedge else self._timed_attempt
+        self.stats.calls += 1
+        count('model_calls')
+        count('prompt_tokens', estimate_tokens(prompt))
+        self.stats.last_attempts = 0
+        started = time.perf_counter()
+
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(self.retries + 1),
+                wait=wait_exponential(multiplier=self.backoff, max=10 * self.backoff),
+                retry=retry_if_exception(is_retryable),
+                reraise=True,
+            ):
+                with attempt:
+                    message = await request(prompt, on_token)
+            count('response_tokens', estimate_tokens(message or ''))
+            return message
+
+        except Exception as e:
+            self.stats.failures += 1
+            if isinstance(e, asyncio.TimeoutError):
+                e = f"no response within {self.timeout:g} s"
+            print(f"Error calling {self.provider_name} API: {e}", file=sys.stderr)
+            return None
+
+        finally:
+            self.stats.last_seconds = time.perf_counter() - started
+            count('attempts', self.stats.last_attempts)
+            TIMINGS.record('model request', self.stats.last_seconds, started=started)
+
+    def generate_commit_message(self, diff_summary, on_token=None):
+        """Synchronous wrapper around ``agenerate_commit_message``."""
+        return self.run(self.agenerate_commit_message(diff_summary, on_token))
+
+    async def agenerate_candidates(self, diff_summary, count):
+        """Request ``count`` messages concurrently and return the distinct ones."""
+        results = await asyncio.gather(
+            *(self.agenerate_commit_message(diff_summary) for _ in range(count))
+        )
+        return _unique(results)
+
+    def generate_candidates(self, diff_summary, count):
+        """Synchronous wrapper around ``agenerate_candidates``."""
+        return self.run(self.agenerate_candidates(diff_summary, count))
+
+    async def agenerate_many(self, prompts, concurrency=4):
+        """Answer several prompts with at most ``concurrency`` requests in flight.
+
+        Returns the answers in the order of ``prompts``, None for failures.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(prompt):
+            async with semaphore:
+                return await self.agenerate(prompt)
+
+        return list(await asyncio.gather(*(one(prompt) for prompt in prompts)))
+
+    def generate_many(self, prompts, concurrency=4):
+        """Synchronous wrapper around ``agenerate_many``."""
+        return self.run(self.agenerate_many(prompts, concurrency))
+
+    def run(self, coroutine):
+        """Run ``coroutine`` on the client's event loop and return its result."""
+        # One loop for the client's lifetime: async HTTP pools are bound to
+        # the loop they were first used on.
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coroutine)
+
+    def close(self):
+        """Release the event loop used by the synchronous API."""
+        # A loop still busy on another thread (a prefetch) is left to exit with it
+        if self._loop is not None and not self._loop.is_closed() and not self._loop.is_running():
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
+
+class GeminiClient(BaseClient):
+    """Google Gemini backend, through the google-genai SDK."""
+
+    provider_name = 'Gemini'
+
+    def __init__(self, api_key=None, model="gemini-2.5-flash", **policy):
         """Initialize Gemini client.
         
         Args:
             api_key: Google Gemini API key
             model: Model name to use (default: gemini-2.5-flash)
+            **policy: Timeout, retry and hedging options (see ``BaseClient``)
         """
+        super().__init__(model, **policy)
         self.api_key = api_key or os.getenv("api_key")
         if not self.api_key:
             raise ValueError("API key not provided. Set 'api_key' environment variable or pass it to the constructor.")
         
-        self.model = model
-        self.client = genai.Client(api_key=self.api_key)
-    
-    def generate_commit_message(self, diff_summary):
-   
-        if not diff_summary or not diff_summary.strip():
-            print("No staged changes found. Use 'git add' to stage files.", file=sys.stderr)
-            return None
+        # Imported here: the SDK pulls in pydantic, httpx and websockets,
+        # which runs that never reach the API should not pay for.
+        with phase('import google-genai'):
+            import httpx
+            from google import genai
+        # The SDK's requests go through this pool, which ``warm`` can open early
+        self._http = httpx.AsyncClient(timeout=None)
+        self.client = genai.Client(api_key=self.api_key, http_options={'httpx_async_client': self._http})
 
+    def warm(self):
+        """Open the pooled connection (TCP and TLS) the request will reuse."""
         try:
-            
-            prompt = f"{SYSTEM_PROMPT}\n\n{diff_summary}"
-
-           
-            response = self.client.models.generate_content(
-                model=self.model, 
-                contents=prompt,
-            )
-
-            
-            message = response.text.strip().replace("`", "").replace("**", "")
-            
-            
-            message = message.split('\n')[0]
-            
-            return message
+            with phase('connection warm-up'):
+                self.run(self._http.head(GEMINI_BASE_URL))
+        except Exception:
+            pass
 
-        except Exception as e:
-            print(f"Error calling Gemini API: {e}", file=sys.stderr)
-            return None
+    async def _astream(self, prompt):
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model,
+            contents=prompt,
+        )
+        return _texts(stream)
+
+    def close(self):
+        if self._loop is not None and not self._loop.is_closed() and not self._loop.is_running():
+            self.run(self._http.aclose())
+        super().close()
+
+
+class OpenAIClient(BaseClient):
+    """Backend for any OpenAI-compatible ``/chat/completions`` endpoint.
+
+    Works with hosted APIs as well as local servers (llama.cpp, vLLM,
+    Ollama, or ``git_suggest.fake_server`` for offline benchmarks).
+    """
+
+    provider_name = 'OpenAI-compatible'
+
+    def __init__(self, api_key=None, model="gpt-4o-mini", base_url="https://api.openai.com/v1", **policy):
+        """Initialize the client.
+
+        Args:
+            api_key: Bearer token; optional for local servers
+            model: Model name sent with each request
+            base_url: API root, e.g. ``http://127.0.0.1:8765/v1``
+            **policy: Timeout, retry and hedging options (see ``BaseClient``)
+        """
+        super().__init__(model, **policy)
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        with phase('import httpx'):
+            import httpx
+        headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+        self._http = httpx.AsyncClient(base_url=self.base_url, headers=headers, timeout=None)
+
+    def warm(self):
+        """Open the pooled connection (TCP and TLS) the request will reuse."""
+        try:
+            with phase('connection warm-up'):
+                self.run(self._http.head('/models'))
+        except Exception:
+            pass
+
+    async def _astream(self, prompt):
+        return self._events(prompt)
+
+    async def _events(self, prompt):
+        payload = {
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'stream': True,
+        }
+        async with self._http.stream('POST', '/chat/completions', json=payload) as response:
+            response.raise_for_status()
+            lines = response.aiter_lines()
+            try:
+                async for line in lines:
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    choices = json.loads(data).get('choices') or [{}]
+                    content = (choices[0].get('delta') or {}).get('content')
+                    if content:
+                        yield content
+            finally:
+                await lines.aclose()
+
+    def close(self):
+        if self._loop is not None and not self._loop.is_closed() and not self._loop.is_running():
+            self.run(self._http.aclose())
+        super().close()
+
+
+def create_client(config, api_key=None):
+    """Build the client for the provider selected in ``config``.
+
+    Raises:
+        ValueError: For an unknown provider or a missing API key
+    """
+    provider = config.get_provider()
+    model = config.get('model', 'gemini-2.5-flash')
+    policy = config.get_request_policy()
+    if provider == 'gemini':
+        return GeminiClient(api_key, model=model, **policy)
+    if provider == 'openai':
+        return OpenAIClient(api_key, model=model, base_url=config.get('base_url') or "https://api.openai.com/v1",
+                            **policy)
+    raise ValueError(f"Unknown provider '{provider}'. Choose 'gemini' or 'openai'.")
+
+
+async def _texts(stream):
+    try:
+        async for chunk in stream:
+            yield chunk.text or ''
+    finally:
+        aclose = getattr(stream, 'aclose', None)
+        if aclose:
+            await aclose()
+
+
+def _unique(messages):
+    """Drop empty and duplicate messages, keeping the original order."""
+    seen = set()
+    unique = []
+    for message in messages:
+        if message and message not in seen:
+            seen.add(message)
+            unique.append(message)
+    return unique
+
+
+class CandidateGenerator:
+    """Serves batches of distinct candidate messages for interactive mode.
+
+    As soon as a batch is handed out, the next one is requested in the
+    background, so regenerating usually returns immediately.
+    """
+
+    def __init__(self, client, diff_summary, count):
+        self.client = client
+        self.diff_summary = diff_summary
+        self.count = count
+        self._seen = set()
+        self._pending = self._prefetch()
+
+    def _prefetch(self):
+        future = Future()
+
+        def work():
+            try:
+                future.set_result(self.client.generate_candidates(self.diff_summary, self.count))
+            except BaseException as e:
+                future.set_exception(e)
+
+        # A daemon thread never holds up exit once the user has committed
+        threading.Thread(target=work, daemon=True).start()
+        return future
+
+    def next_batch(self):
+        """Return the next batch, preferring messages not shown before."""
+        batch = self._pending.result()
+        self._pending = self._prefetch()
+
+        fresh = [message for message in batch if message not in self._seen]
+        self._seen.update(fresh)
+        return fresh or batch
@@ -0,0 +1,183 @@
+"""Batch mode: generate messages for many repositories or commits in one process.
+
+One model client (and so one HTTP connection pool) serves every item.
+Diffs are collected on a bounded thread pool while model calls for earlier
+items are already in flight. Results are written to stdout as JSON lines.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+from .exclude import ExclusionRules
+from .git_backend import select_backend
+from .git_utils import get_staged_diff_summary, list_commits
+from .metrics import percentile
+
+
+DEFAULT_JOBS = 8
+
+
+def build_items(repos=None, revision_range=None, cwd=None):
+    """Expand the command line into work items.
+
+    Each item is a dict with ``repo`` and, for ``--range``, the ``commit``
+    and ``parent`` to diff.
+    """
+    if revision_range:
+        repo = os.path.abspath(cwd or os.getcwd())
+        return [
+            {'repo': repo, 'commit': commit, 'parent': parent}
+            for commit, parent in list_commits(revision_range, cwd=repo)
+        ]
+    return [{'repo': os.path.abspath(repo)} for repo in repos]
+
+
+class BatchRunner:
+    """Runs diff collection and generation for a list of items."""
+
+    def __init__(self, client, config, jobs=DEFAULT_JOBS, output=None):
+        self.client = client
+        self.config = config
+        self.jobs = jobs
+        self.output = output or sys.stdout
+        self.exclude = ExclusionRules.from_config(config)
+        self.results = []
+
+    def _summarize(self, item):
+        revisions = [item['parent'], item['commit']] if 'commit' in item else None
+        return get_staged_diff_summary(
+            stream=self.config.get('stream_diff', True),
+            max_lines=self.config.get('max_diff_lines', 300),
+            token_budget=self.config.get_token_budget(),
+            revisions=revisions,
+            cwd=item['repo'],
+            exclude=self.exclude,
+            symbols=self.config.get('symbols', True),
+            normalize=self.config.get('normalize', True),
+        )
+
+    async def _process(self, item, pool, semaphore):
+        loop = asyncio.get_running_loop()
+        result = dict(item)
+        started = time.perf_counter()
+
+        async with semaphore:
+            diff_started = time.perf_counter()
+            try:
+                summary = await loop.run_in_executor(pool, self._summarize, item)
+            except OSError as e:
+                summary = None
+                result['error'] = str(e)
+            result['diff_seconds'] = round(time.perf_counter() - diff_started, 4)
+
+            if summary is None:
+                result.setdefault('error', 'git diff failed')
+            else:
+                model_started = time.perf_counter()
+                message = await self.client.agenerate_commit_message(summary)
+                result['model_seconds'] = round(time.perf_counter() - model_started, 4)
+                if message:
+                    result['message'] = message
+                else:
+                    result['error'] = 'no message generated'
+
+        result['seconds'] = round(time.perf_counter() - started, 4)
+        self.results.append(result)
+        print(json.dumps(result), file=self.output, flush=True)
+
+    async def _run_all(self, items):
+        semaphore = asyncio.Semaphore(self.jobs)
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            await asyncio.gather(*(self._process(item, pool, semaphore) for item in items))
+
+    def run(self, items):
+        """Process ``items`` and return the wall time in seconds."""
+        started = time.perf_counter()
+        self.client.run(self._run_all(items))
+        return time.perf_counter() - started
+
+    def print_stats(self, elapsed, file=None):
+        """Print throughput and latency percentiles for the finished run."""
+        file = file or sys.stderr
+        latencies = [result['seconds'] for result in self.results]
+        failed = sum(1 for result in self.results if 'error' in result)
+        throughput = len(self.results) / elapsed if elapsed else 0.0
+
+        print(f"Processed {len(self.results)} items in {elapsed:.2f} s "
+              f"({throughput:.2f} items/s, {failed} failed)", file=file)
+        if latencies:
+            print(f"Latency: p50 {percentile(latencies, 50):.2f} s, "
+                  f"p90 {percentile(latencies, 90):.2f} s, "
+                  f"max {max(latencies):.2f} s", file=file)
+
+
+def main(argv=None):
+    """Entry point for ``git-suggest batch``."""
+    parser = argparse.ArgumentParser(
+        prog='git-suggest batch',
+        description='Generate commit messages for many repositories or commits, as JSON lines'
+    )
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        '--repos',
+        nargs='+',
+        metavar='PATH',
+        help='Repositories whose staged changes should be described'
+    )
+    target.add_argument(
+        '--range',
+        dest='revision_range',
+        metavar='A..B',
+        help='Describe every commit in this range of the current repository'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f'Items processed concurrently (default: {DEFAULT_JOBS})'
+    )
+    parser.add_argument(
+        '--config', '-c',
+        type=str,
+        help='Path to custom configuration file'
+    )
+    args = parser.parse_args(argv)
+
+    config = Config(args.config)
+    api_key = config.get_api_key()
+    if not api_key and config.get_provider() == 'gemini':
+        print("Error: API key not found.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        select_backend(config.get('git_backend', 'auto'))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        items = build_items(args.repos, args.revision_range)
+    except subprocess.CalledProcessError as e:
+        print(f"Error listing commits: {e.stderr}", file=sys.stderr)
+        sys.exit(1)
+
+    from .ai_client import create_client
+    try:
+        client = create_client(config, api_key)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    runner = BatchRunner(client, config, jobs=max(1, args.jobs))
+    elapsed = runner.run(items)
+    runner.print_stats(elapsed)
+    client.close()
+
+    if any('error' in result for result in runner.results):
+        sys.exit(1)
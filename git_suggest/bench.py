@@ -0,0 +1,939 @@
+"""Benchmarks for the git-suggest diff pipeline.
+
+Run with ``python -m git_suggest.bench``. Synthetic repositories of the
+sizes given with ``--sizes`` are staged and timed stage by stage (git,
+parse, summarize, prompt, a mocked model), together with peak memory and
+import time, and a synthetic history is described by ``batch`` with one and
+with several worker threads. With ``--e2e`` full CLI runs are timed against a local fake
+model server, and the time to the first model request is compared with and
+without the concurrent pipeline. ``--json`` writes every number for later
+``--compare`` runs.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from . import git_utils
+from .ai_client import BaseClient
+from .diff_model import parse_diff
+from .exclude import NULL_OID
+from .git_backend import Pygit2Backend, SubprocessBackend, _diff_command
+from .fake_server import DEFAULT_MESSAGE, TOKEN, start_server
+from .normalize import normalize_diff
+from .prompt import build_prompt
+from .version import __version__
+
+
+# Named sizes for --sizes: (files, total lines)
+SIZE_PRESETS = {
+    'tiny': (1, 10),
+    'small': (10, 1000),
+    'medium': (100, 10000),
+    'large': (1000, 100000),
+    'wide': (5000, 100000),
+}
+
+
+class ForkCounter:
+    """Context manager counting how many subprocesses are spawned."""
+
+    def __init__(self):
+        self.count = 0
+        self._original = None
+
+    def __enter__(self):
+        self._original = subprocess.Popen
+        counter = self
+        original = self._original
+
+        class CountingPopen(original):
+            def __init__(self, *args, **kwargs):
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen
+        return self
+
+    def __exit__(self, *exc):
+        subprocess.Popen = self._original
+        return False
+
+
+def _git(repo, *args):
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+def parse_size(text):
+    """Parse a ``--sizes`` entry: a preset name or ``FILESxLINES`` (total lines)."""
+    if text in SIZE_PRESETS:
+        return SIZE_PRESETS[text]
+    try:
+        files, lines = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid size {text!r}: use FILESxLINES or one of {', '.join(SIZE_PRESETS)}"
+        )
+    return max(files, 1), max(lines, 1)
+
+
+def make_synthetic_repo(files=50, lines_per_file=200, path=None):
+    """Create a repository with ``files`` modified files staged for commit.
+
+    Args:
+        files: Number of files to create and modify
+        lines_per_file: Number of lines in each file
+        path: Directory to create the repository in (default: a temp dir)
+
+    Returns:
+        Path of the repository
+    """
+    repo = path or tempfile.mkdtemp(prefix="git-suggest-bench-")
+    os.makedirs(repo, exist_ok=True)
+    _git(repo, "init", "-q")
+    _git(repo, "config", "user.email", "bench@example.com")
+    _git(repo, "config", "user.name", "bench")
+    _git(repo, "config", "commit.gpgsign", "false")
+
+    for n in range(files):
+        directory = os.path.join(repo, f"pkg{n % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{n}.py"), "w") as f:
+            for i in range(lines_per_file):
+                f.write(f"value_{i} = {i}\n")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "initial")
+
+    for n in range(files):
+        with open(os.path.join(repo, f"pkg{n % 10}", f"module_{n}.py"), "w") as f:
+            for i in range(lines_per_file):
+                if i % 4 == 0:
+                    f.write(f"def changed_{i}():\n    return {i * 2}\n")
+                else:
+                    f.write(f"value_{i} = {i}\n")
+    _git(repo, "add", "-A")
+    return repo
+
+
+def make_history_repo(commits=40, files=5, path=None):
+    """Create a repository of ``commits`` commits, each rewriting ``files`` Python modules.
+
+    Every commit changes classes and methods, so describing the history
+    extracts symbols from both versions of every file.
+    """
+    repo = path or tempfile.mkdtemp(prefix="git-suggest-bench-")
+    os.makedirs(repo, exist_ok=True)
+    _git(repo, "init", "-q")
+    _git(repo, "config", "user.email", "bench@example.com")
+    _git(repo, "config", "user.name", "bench")
+    _git(repo, "config", "commit.gpgsign", "false")
+
+    for c in range(commits):
+        for n in range(files):
+            with open(os.path.join(repo, f"module_{n}.py"), "w") as f:
+                # Distinct in every file, so normalization sees no mass edit
+                for i in range(100 + c):
+                    f.write(f"class Handler{n}_{i}:\n"
+                            f"    def handle(self, request):\n"
+                            f"        if request:\n"
+                            f"            return [item for item in request if item != {c * files + n}]\n"
+                            f"        return {{'status': ({i}, {c})}}\n")
+        _git(repo, "add", "-A")
+        _git(repo, "commit", "-q", "-m", f"commit {c}")
+    return repo
+
+
+def make_wide_repo(files=1000, changed=10, path=None):
+    """Create a repository of ``files`` small files, ``changed`` of them modified and staged.
+
+    The shape of a large codebase with a small change: forking git, which
+    reads the whole index every time, costs the most compared to the work.
+    """
+    repo = path or tempfile.mkdtemp(prefix="git-suggest-bench-")
+    os.makedirs(repo, exist_ok=True)
+    _git(repo, "init", "-q")
+    _git(repo, "config", "user.email", "bench@example.com")
+    _git(repo, "config", "user.name", "bench")
+    _git(repo, "config", "commit.gpgsign", "false")
+
+    for n in range(files):
+        directory = os.path.join(repo, f"pkg{n % 50}", f"sub{n % 7}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{n}.py"), "w") as f:
+            f.write(f"def function_{n}():\n    return {n}\n")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "initial")
+
+    for n in range(0, files, max(files // max(changed, 1), 1))[:changed]:
+        with open(os.path.join(repo, f"pkg{n % 50}", f"sub{n % 7}", f"module_{n}.py"), "a") as f:
+            f.write(f"\n\ndef added_{n}(value):\n    return value * {n}\n")
+    _git(repo, "add", "-A")
+    return repo
+
+
+def _split_combined_diff(output):
+    """Split ``git diff --raw --stat --patch`` output into its three sections.
+
+    Returns a ``(name_status, stats, full_diff)`` tuple whose parts are
+    identical to what ``--name-status``, ``--stat`` and a plain patch would
+    have produced as separate invocations.
+    """
+    name_status = []
+    stats = []
+    pos = 0
+    length = len(output)
+
+    while pos < length:
+        end = output.find('\n', pos)
+        if end == -1:
+            end = length
+        line = output[pos:end]
+
+        if line.startswith(':'):
+            # ":100644 100644 abc1234 def5678 M\tpath" -> "M\tpath"
+            name_status.append(line.split(' ', 4)[4])
+        elif line.startswith(' '):
+            stats.append(line)
+        else:
+            break
+        pos = end + 1
+
+    # Git separates the stat block from the patch with a blank line
+    if stats and output.startswith('\n', pos):
+        pos += 1
+
+    name_status = ''.join(f"{line}\n" for line in name_status)
+    stats = ''.join(f"{line}\n" for line in stats)
+    return name_status, stats, output[pos:]
+
+
+def collect_staged_diff():
+    """Collect name-status, stats and the full patch of staged changes with one git call."""
+    result = subprocess.run(
+        _diff_command(),
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        check=True
+    )
+    return _split_combined_diff(result.stdout)
+
+
+def legacy_collect_staged_diff():
+    """The original three-subprocess collection path, kept for comparison."""
+    outputs = []
+    for extra in (["--name-status"], ["--stat"], []):
+        result = subprocess.run(
+            ["git", "diff", "--staged", "--src-prefix=a/", "--dst-prefix=b/", *extra],
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            check=True
+        )
+        outputs.append(result.stdout)
+    return tuple(outputs)
+
+
+def make_synthetic_diff(lines=100000, files=100):
+    """Build combined ``--raw --stat --patch`` output of roughly ``lines`` lines."""
+    per_file = max(lines // files, 8)
+    raw, stat, patch = [], [], []
+    for n in range(files):
+        path = f"src/pkg{n % 10}/module_{n}.py"
+        raw.append(f":100644 100644 {n:07x} {n + 1:07x} M\t{path}")
+        stat.append(f" {path} | {per_file} +++---")
+        patch.append(f"diff --git a/{path} b/{path}")
+        patch.append(f"index {n:07x}..{n + 1:07x} 100644")
+        patch.append(f"--- a/{path}")
+        patch.append(f"+++ b/{path}")
+        for start in range(1, per_file, 8):
+            patch.append(f"@@ -{start},7 +{start},7 @@ class Module{n}:")
+            patch.append(f" import os")
+            patch.append(f"-    value_{start} = {start}")
+            patch.append(f"+    value_{start} = {start + 1}")
+            patch.append(f"+def handler_{start}(request):")
+            patch.append(f"+    return request.value")
+            patch.append(f"     # unchanged context line")
+            patch.append(f"-    return None")
+    stat.append(f" {files} files changed")
+    return '\n'.join(raw + stat + [''] + patch + [''])
+
+
+def legacy_summarize(full_diff):
+    """The original flat-line summarizer, kept for comparison."""
+    lines = full_diff.split('\n')
+    total_lines = len(lines)
+    important_lines = []
+    for i, line in enumerate(lines):
+        if line.startswith('diff --git') or line.startswith('+++') or line.startswith('---') or line.startswith('@@'):
+            important_lines.append(line)
+            continue
+        if any(keyword in line for keyword in ['import ', 'export ', 'from ', 'require(']):
+            important_lines.append(line)
+            continue
+        if any(keyword in line for keyword in ['function ', 'class ', 'def ', 'const ', 'let ', 'var ', 'async ', 'interface ', 'type ']):
+            important_lines.append(line)
+            for j in range(i + 1, min(i + 3, total_lines)):
+                if lines[j].strip():
+                    important_lines.append(lines[j])
+            continue
+        if (line.startswith('+') or line.startswith('-')) and not line.startswith('+++') and not line.startswith('---'):
+            if len(important_lines) < 200 or i % 3 == 0:
+                important_lines.append(line)
+    return '\n'.join(important_lines[:250])
+
+
+def _best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_parse_summarize(lines=100000, repeat=5):
+    """Compare the flat-line summarizer with parsing into the diff model."""
+    output = make_synthetic_diff(lines)
+    patch = output[output.index('diff --git'):]
+
+    def model():
+        return git_utils.summarize_diff(parse_diff(output.split('\n')))
+
+    return {
+        'lines': output.count('\n'),
+        'legacy': {'seconds': _best_of(lambda: legacy_summarize(patch), repeat)},
+        'model': {'seconds': _best_of(model, repeat)},
+    }
+
+
+# Modules that must never be imported just to start the CLI
+HEAVY_MODULES = ('google.genai', 'pydantic', 'httpx', 'websockets', 'yaml')
+
+
+def bench_import_time(module='git_suggest.cli'):
+    """Measure the cumulative import time of ``module`` with ``-X importtime``.
+
+    Returns the time in milliseconds and which heavy modules got imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    cumulative = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, total, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            cumulative = int(total)
+
+    heavy = sorted(name for name in imported if name.startswith(HEAVY_MODULES))
+    return {'milliseconds': cumulative / 1000, 'heavy_modules': heavy}
+
+
+def _cli_env():
+    """Environment running this checkout's ``git_suggest`` in a child process."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env.get('PYTHONPATH')])
+    )
+    return env
+
+
+def bench_end_to_end(repo, latency=0.3, tokens_per_second=50.0, repeat=3):
+    """Time full ``git-suggest --dry-run`` runs against a local fake model server.
+
+    Needs httpx (installed with google-genai) for the OpenAI-compatible backend.
+    """
+    server = start_server(latency=latency, tokens_per_second=tokens_per_second)
+    config_dir = tempfile.mkdtemp(prefix="git-suggest-bench-config-")
+    config_path = os.path.join(config_dir, "gitcommit.yml")
+    with open(config_path, "w") as f:
+        f.write(f"provider: openai\nmodel: fake\nbase_url: {server.url}\ncache: false\n")
+
+    command = [sys.executable, "-m", "git_suggest", "--dry-run", "--config", config_path]
+    timings = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = subprocess.run(command, cwd=repo, env=_cli_env(), capture_output=True, text=True)
+            timings.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                return {'error': result.stderr.strip()}
+    finally:
+        server.shutdown()
+        shutil.rmtree(config_dir, ignore_errors=True)
+
+    return {
+        'seconds': min(timings),
+        'model_latency': latency,
+        'tokens_per_second': tokens_per_second,
+        'requests': server.requests,
+        'tokens_sent': server.tokens_sent,
+        'message': result.stdout.strip(),
+    }
+
+
+def bench_time_to_first_request(repo, handshake=0.1, latency=0.3, repeat=3):
+    """Compare the time from starting the CLI to its model request arriving, with and without ``pipeline``.
+
+    ``handshake`` delays every new connection to the fake server like the
+    TCP and TLS handshakes of a remote API, which the pipelined run hides
+    behind the diff and its summary. Runs alternate so drift affects both.
+    """
+    server = start_server(latency=latency, handshake=handshake)
+    config_dir = tempfile.mkdtemp(prefix="git-suggest-bench-config-")
+    commands = {}
+    for name, pipeline in (('sequential', 'false'), ('pipelined', 'true')):
+        config_path = os.path.join(config_dir, f"{name}.yml")
+        with open(config_path, "w") as f:
+            f.write(f"provider: openai\nmodel: fake\nbase_url: {server.url}\ncache: false\n"
+                    f"daemon: false\npipeline: {pipeline}\n")
+        commands[name] = [sys.executable, "-m", "git_suggest", "--dry-run", "--config", config_path]
+
+    env = _cli_env()
+    timings = {name: [] for name in commands}
+    try:
+        for _ in range(repeat):
+            for name, command in commands.items():
+                seen = len(server.request_times)
+                start = time.time()
+                result = subprocess.run(command, cwd=repo, env=env, capture_output=True, text=True)
+                if result.returncode != 0 or len(server.request_times) == seen:
+                    return {'error': result.stderr.strip() or "no request reached the server"}
+                timings[name].append(server.request_times[seen] - start)
+    finally:
+        server.shutdown()
+        shutil.rmtree(config_dir, ignore_errors=True)
+
+    results = {name: {'seconds': min(values)} for name, values in timings.items()}
+    results['handshake'] = handshake
+    results['speedup'] = results['sequential']['seconds'] / results['pipelined']['seconds']
+    return results
+
+
+class MockClient(BaseClient):
+    """Deterministic stand-in for a model: streams a canned message, no network.
+
+    Built on ``BaseClient`` so streaming, early termination and the request
+    policy are exercised exactly as with a real provider.
+    """
+
+    provider_name = 'mock'
+
+    def __init__(self, message=DEFAULT_MESSAGE):
+        super().__init__('mock', timeout=None, retries=0)
+        self.message = message
+        self.prompt_chars = 0
+
+    async def _astream(self, prompt):
+        self.prompt_chars += len(prompt)
+        return self._chunks()
+
+    async def _chunks(self):
+        for token in TOKEN.findall(self.message):
+            yield token
+
+
+def bench_pipeline(files, lines, repeat=3, path=None):
+    """Time each stage of one run on a synthetic repository of ``files`` files and ``lines`` lines.
+
+    The model is a ``MockClient``, so the numbers only depend on this
+    machine and the code under test.
+    """
+    repo = make_synthetic_repo(files, max(lines // files, 1), path)
+    cwd = os.getcwd()
+    os.chdir(repo)
+    client = MockClient()
+    try:
+        git_seconds = _best_of(lambda: subprocess.run(_diff_command(), capture_output=True, check=True),
+                               repeat)
+        output = subprocess.run(_diff_command(), capture_output=True, text=True, check=True).stdout
+        lines_out = output.split('\n')
+
+        parse_seconds = _best_of(lambda: parse_diff(lines_out), repeat)
+        diff = parse_diff(lines_out)
+        summarize_seconds = _best_of(lambda: git_utils.summarize_diff(diff), repeat)
+        summary = git_utils.summarize_diff(diff)
+        prompt = build_prompt(summary)
+
+        model_seconds = _best_of(lambda: client.generate_commit_message(summary), repeat)
+
+        def full_run():
+            return client.generate_commit_message(git_utils.get_staged_diff_summary(stream=True))
+        total_seconds = _best_of(full_run, repeat)
+
+        tracemalloc.start()
+        full_run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        message = full_run()
+    finally:
+        client.close()
+        os.chdir(cwd)
+        if path is None:
+            shutil.rmtree(repo, ignore_errors=True)
+
+    return {
+        'files': files,
+        'lines': lines,
+        'diff_lines': len(lines_out),
+        'diff_bytes': len(output.encode('utf-8')),
+        'git_seconds': git_seconds,
+        'parse_seconds': parse_seconds,
+        'summarize_seconds': summarize_seconds,
+        'model_seconds': model_seconds,
+        'total_seconds': total_seconds,
+        'peak_bytes': peak,
+        'prompt_chars': len(prompt),
+        'prompt_tokens': git_utils.estimate_tokens(prompt),
+        'message': message,
+    }
+
+
+def _flatten(results, prefix=''):
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(results, list):
+        for item in results:
+            name = f"{item.get('files')}x{item.get('lines')}" if isinstance(item, dict) else ''
+            flat.update(_flatten(item, f"{prefix}{name}."))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix.rstrip('.')] = results
+    return flat
+
+
+def compare(results, baseline, threshold=0.10, file=None):
+    """Print how each timing and size metric moved against ``baseline``.
+
+    Returns the names of the metrics that got worse by more than ``threshold``.
+    """
+    file = file or sys.stdout
+    current = _flatten(results)
+    previous = _flatten(baseline)
+    regressions = []
+    print(f"Compared with baseline (changes over {threshold:.0%} flagged):", file=file)
+    for name in sorted(current.keys() & previous.keys()):
+        if not name.endswith(('seconds', 'bytes', 'milliseconds', 'tokens', 'chars')) or not previous[name]:
+            continue
+        change = current[name] / previous[name] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  <-- slower/larger'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = '  (better)'
+        print(f"  {name:<48} {previous[name]:>14.6g} -> {current[name]:<14.6g} {change:+.1%}{flag}", file=file)
+    return regressions
+
+
+def _environment():
+    git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    return {
+        'git_suggest': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'git': git_version,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def _measure(func, repeat):
+    timings = []
+    with ForkCounter() as forks:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+    return result, min(timings), forks.count // repeat
+
+
+# Git operations of one run, as timed by bench_backends
+BACKEND_STAGES = ('write_tree', 'head', 'diff', 'read_blobs', 'commit')
+
+
+def _bench_backend(backend, repeat):
+    diff = parse_diff(backend.diff_lines())
+    oids = [oid for file in diff.files for oid in (file.old_oid, file.new_oid) if oid and oid != NULL_OID]
+    stages = {
+        'write_tree': backend.write_tree,
+        'head': backend.head,
+        'diff': lambda: parse_diff(backend.diff_lines()),
+        'read_blobs': lambda: backend.read_blobs(oids),
+    }
+    results = {}
+    for stage, func in stages.items():
+        _, seconds, forks = _measure(func, repeat)
+        results[f'{stage}_seconds'] = seconds
+        results[f'{stage}_forks'] = forks
+    return results, git_utils.summarize_diff(diff)
+
+
+def _bench_commits(backend, repo, repeat):
+    # A chain of commits, each of a change staged outside the measurement
+    timings = []
+    for n in range(repeat):
+        with open(os.path.join(repo, "CHANGES"), "a") as f:
+            f.write(f"{backend.name} {n}\n")
+        _git(repo, "add", "CHANGES")
+        with ForkCounter() as forks:
+            start = time.perf_counter()
+            success, output = backend.commit("bench: commit the staged change")
+            timings.append(time.perf_counter() - start)
+        if not success:
+            return {'error': output.strip()}
+    return {'commit_seconds': min(timings), 'commit_forks': forks.count}
+
+
+def bench_backends(files=1000, changed=10, repeat=5):
+    """Time the git operations of a run with the subprocess and the pygit2 backend.
+
+    Both backends work on the same synthetic repository (see
+    ``make_wide_repo``) and must produce the same summary.
+    """
+    repo = make_wide_repo(files, changed)
+    cwd = os.getcwd()
+    os.chdir(repo)
+    results = {'files': files, 'changed': changed}
+    summaries = []
+    try:
+        backends = [SubprocessBackend(), Pygit2Backend.open()]
+        if backends[1] is None:
+            results['pygit2'] = {'error': 'pygit2 (1.14 or later) is not installed'}
+            backends.pop()
+        # Read-only stages first, so both backends see the same staged change
+        for backend in backends:
+            results[backend.name], summary = _bench_backend(backend, repeat)
+            summaries.append(summary)
+        for backend in backends:
+            commits = _bench_commits(backend, repo, repeat)
+            if 'error' in commits:
+                results[backend.name] = commits
+                continue
+            entry = results[backend.name]
+            entry.update(commits)
+            entry['total_seconds'] = sum(entry[f'{stage}_seconds'] for stage in BACKEND_STAGES)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(repo, ignore_errors=True)
+
+    results['identical'] = len(set(summaries)) <= 1
+    if 'error' not in results['pygit2']:
+        results['pygit2']['import_milliseconds'] = bench_import_time('pygit2')['milliseconds']
+    return results
+
+
+def bench_batch(commits=40, jobs=8):
+    """Describe a synthetic history with ``git-suggest batch`` on one thread and on ``jobs``.
+
+    The model is a ``MockClient``. Both runs start from an empty symbol
+    cache, so every file is parsed again on the worker threads, and must
+    finish without errors and send the same prompts.
+    """
+    from .batch import BatchRunner, build_items
+    from .config import Config
+
+    repo = make_history_repo(commits)
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    results = {'commits': commits}
+    prompt_chars = {}
+    try:
+        items = build_items(revision_range='HEAD', cwd=repo)
+        for name, workers in (('threaded', jobs), ('single', 1)):
+            os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix="git-suggest-bench-cache-", dir=repo)
+            client = MockClient()
+            runner = BatchRunner(client, Config(), jobs=workers, output=io.StringIO())
+            try:
+                seconds = runner.run(items)
+            except Exception as e:
+                results[name] = {'jobs': workers, 'error': f"{type(e).__name__}: {e}"}
+                continue
+            finally:
+                client.close()
+            errors = [result['error'] for result in runner.results if 'error' in result]
+            results[name] = {'jobs': workers, 'seconds': seconds, 'failed': len(errors)}
+            if errors:
+                results[name]['error'] = errors[0]
+            prompt_chars[name] = client.prompt_chars
+    finally:
+        if cache_home is None:
+            os.environ.pop('XDG_CACHE_HOME', None)
+        else:
+            os.environ['XDG_CACHE_HOME'] = cache_home
+        shutil.rmtree(repo, ignore_errors=True)
+
+    results['identical'] = (len(prompt_chars) == 2 and len(set(prompt_chars.values())) == 1
+                            and not any('error' in results[name] for name in ('threaded', 'single')))
+    return results
+
+
+def bench_diff_collection(repo, repeat=5):
+    """Compare the single-pass diff collection against the legacy path."""
+    cwd = os.getcwd()
+    os.chdir(repo)
+    try:
+        legacy, legacy_time, legacy_forks = _measure(legacy_collect_staged_diff, repeat)
+        single, single_time, single_forks = _measure(collect_staged_diff, repeat)
+    finally:
+        os.chdir(cwd)
+
+    return {
+        'identical': legacy == single,
+        'legacy': {'forks': legacy_forks, 'seconds': legacy_time},
+        'single_pass': {'forks': single_forks, 'seconds': single_time},
+    }
+
+
+def bench_summary_memory(repo):
+    """Compare peak Python memory of buffered and streaming summarization."""
+    cwd = os.getcwd()
+    os.chdir(repo)
+    results = {}
+    try:
+        for name, stream in (('buffered', False), ('streaming', True)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            summary = git_utils.get_staged_diff_summary(stream=stream)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name] = {'peak_bytes': peak, 'seconds': elapsed, 'summary': summary}
+    finally:
+        os.chdir(cwd)
+
+    results['identical'] = results['buffered'].pop('summary') == results['streaming'].pop('summary')
+    return results
+
+
+def check_reindented_return():
+    """A re-indent moving ``return`` into a loop changes behaviour: normalization must keep it."""
+    lines = [
+        ':100644 100644 1111111111111111111111111111111111111111 2222222222222222222222222222222222222222 M\ta.py',
+        ' a.py | 2 +-',
+        ' 1 file changed, 1 insertion(+), 1 deletion(-)',
+        '',
+        'diff --git a/a.py b/a.py',
+        'index 1111111..2222222 100644',
+        '--- a/a.py',
+        '+++ b/a.py',
+        '@@ -1,4 +1,4 @@',
+        ' def f(xs):',
+        '     for x in xs:',
+        '         print(x)',
+        '-    return 1',
+        '+        return 1',
+        '',
+    ]
+    diff = normalize_diff(parse_diff(lines))
+    return [file.path for file in diff.files] == ['a.py'] and not diff.collapsed
+
+
+def check_mnemonic_prefix():
+    """With ``diff.mnemonicPrefix`` set, every backend must still match patches to their files."""
+    repo = make_synthetic_repo(files=2, lines_per_file=8)
+    try:
+        _git(repo, "config", "diff.mnemonicPrefix", "true")
+        outputs = []
+        for backend in (SubprocessBackend(repo), Pygit2Backend.open(repo)):
+            if backend is None:
+                continue
+            lines = backend.diff_lines()
+            files = parse_diff(lines).files
+            if len(files) != 2 or not all(file.hunks and file.status != '?' for file in files):
+                return False
+            outputs.append(lines)
+        return all(lines == outputs[0] for lines in outputs)
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+
+# Cases that once went wrong; each returns True when handled correctly
+REGRESSION_CHECKS = (
+    check_reindented_return,
+    check_mnemonic_prefix,
+)
+
+
+def check_regressions():
+    """Run ``REGRESSION_CHECKS``; returns ``{name: passed}``."""
+    return {check.__name__[len('check_'):]: bool(check()) for check in REGRESSION_CHECKS}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the git-suggest diff pipeline')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=None, metavar='SIZE',
+                        help=f"Repositories to time stage by stage: FILESxLINES or {', '.join(SIZE_PRESETS)} "
+                             "(default: small medium)")
+    parser.add_argument('--files', type=int, default=200, help='Staged files for the legacy comparisons')
+    parser.add_argument('--lines', type=int, default=200, help='Lines per file for the legacy comparisons')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions per measurement')
+    parser.add_argument('--diff-lines', type=int, default=100000, help='Lines of the synthetic diff to summarize')
+    parser.add_argument('--import-budget-ms', type=float, default=100, help='Fail if importing the CLI takes longer')
+    parser.add_argument('--backend-files', nargs='+', type=int, default=[1000, 10000], metavar='FILES',
+                        help='Repository sizes (files) for the git backend comparison')
+    parser.add_argument('--backend-changed', type=int, default=10,
+                        help='Staged files in the git backend comparison')
+    parser.add_argument('--batch-commits', type=int, default=40,
+                        help='Commits described by the batch comparison (0 to skip it)')
+    parser.add_argument('--batch-jobs', type=int, default=8, help='Worker threads of the threaded batch run')
+    parser.add_argument('--e2e', action='store_true', help='Also time full CLI runs against a local fake model server')
+    parser.add_argument('--latency', type=float, default=0.3, help='Fake server time to first token (with --e2e)')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help='Fake server token rate (with --e2e)')
+    parser.add_argument('--handshake', type=float, default=0.1,
+                        help='Fake server connection set-up time for the time-to-first-request comparison (with --e2e)')
+    parser.add_argument('--json', metavar='PATH', help="Write all results as JSON ('-' for stdout)")
+    parser.add_argument('--compare', metavar='PATH', help='Compare with the JSON results of an earlier run')
+    args = parser.parse_args(argv)
+
+    # With JSON on stdout, the human-readable report goes to stderr
+    out = sys.stderr if args.json == '-' else sys.stdout
+    sizes = args.sizes or [SIZE_PRESETS['small'], SIZE_PRESETS['medium']]
+    results = {'environment': _environment(), 'repeat': args.repeat}
+
+    results['pipeline'] = []
+    for files, lines in sizes:
+        stages = bench_pipeline(files, lines, args.repeat)
+        results['pipeline'].append(stages)
+        print(f"Pipeline ({files} files, {lines} lines -> {stages['diff_lines']} diff lines, "
+              f"best of {args.repeat}):", file=out)
+        for stage in ('git', 'parse', 'summarize', 'model', 'total'):
+            print(f"  {stage:<12} {stages[f'{stage}_seconds'] * 1000:.1f} ms", file=out)
+        print(f"  peak memory  {stages['peak_bytes'] / 1024:.0f} KiB; prompt ~{stages['prompt_tokens']} tokens",
+              file=out)
+
+    repo = make_synthetic_repo(args.files, args.lines)
+    try:
+        result = bench_diff_collection(repo, args.repeat)
+        memory = bench_summary_memory(repo)
+        e2e = bench_end_to_end(repo, args.latency, args.tokens_per_second, args.repeat) if args.e2e else None
+        first_request = (bench_time_to_first_request(repo, args.handshake, args.latency, args.repeat)
+                         if args.e2e else None)
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+    results.update(diff_collection=result, summary_memory=memory)
+
+    print(f"Diff collection ({args.files} files x {args.lines} lines, best of {args.repeat}):", file=out)
+    for name in ('legacy', 'single_pass'):
+        print(f"  {name:<12} forks={result[name]['forks']}  {result[name]['seconds'] * 1000:.1f} ms", file=out)
+    print(f"  identical output: {result['identical']}", file=out)
+
+    print("Summary memory:", file=out)
+    for name in ('buffered', 'streaming'):
+        print(f"  {name:<12} peak={memory[name]['peak_bytes'] / 1024:.0f} KiB  "
+              f"{memory[name]['seconds'] * 1000:.1f} ms", file=out)
+    print(f"  identical output: {memory['identical']}", file=out)
+
+    parse = bench_parse_summarize(args.diff_lines, args.repeat)
+    results['parse_summarize'] = parse
+    print(f"Parse + summarize ({parse['lines']} line diff, best of {args.repeat}):", file=out)
+    for name in ('legacy', 'model'):
+        print(f"  {name:<12} {parse[name]['seconds'] * 1000:.1f} ms", file=out)
+
+    if e2e:
+        results['end_to_end'] = e2e
+        print(f"End to end (fake server, {args.latency * 1000:.0f} ms latency, "
+              f"{args.tokens_per_second:.0f} tok/s):", file=out)
+        if 'error' in e2e:
+            print(f"  failed: {e2e['error']}", file=out)
+        else:
+            print(f"  git-suggest --dry-run {e2e['seconds'] * 1000:.1f} ms "
+                  f"({e2e['tokens_sent']} tokens streamed over {e2e['requests']} requests)", file=out)
+
+    if first_request:
+        results['time_to_first_request'] = first_request
+        print(f"Time to first request (fake server, {args.handshake * 1000:.0f} ms handshake, "
+              f"best of {args.repeat}):", file=out)
+        if 'error' in first_request:
+            print(f"  failed: {first_request['error']}", file=out)
+        else:
+            for name in ('sequential', 'pipelined'):
+                print(f"  {name:<12} {first_request[name]['seconds'] * 1000:.1f} ms", file=out)
+            print(f"  speedup      {first_request['speedup']:.2f}x", file=out)
+
+    results['backends'] = []
+    backends_identical = True
+    for files in args.backend_files:
+        backends = bench_backends(files, args.backend_changed, args.repeat)
+        results['backends'].append(backends)
+        backends_identical = backends_identical and backends['identical']
+        print(f"Git backends ({files} files, {args.backend_changed} staged, best of {args.repeat}):", file=out)
+        for name in ('subprocess', 'pygit2'):
+            entry = backends.get(name, {})
+            if 'error' in entry:
+                print(f"  {name:<12} {entry['error']}", file=out)
+                continue
+            stages = '  '.join(
+                f"{stage}={entry[f'{stage}_seconds'] * 1000:.1f}ms/{entry[f'{stage}_forks']}f"
+                for stage in BACKEND_STAGES
+            )
+            print(f"  {name:<12} total {entry['total_seconds'] * 1000:.1f} ms  {stages}", file=out)
+        if 'import_milliseconds' in backends['pygit2']:
+            print(f"  (import pygit2 once per run: {backends['pygit2']['import_milliseconds']:.1f} ms)", file=out)
+        print(f"  identical output: {backends['identical']}", file=out)
+
+    batch_ok = True
+    if args.batch_commits:
+        batch = bench_batch(args.batch_commits, args.batch_jobs)
+        results['batch'] = batch
+        batch_ok = batch['identical']
+        print(f"Batch ({args.batch_commits} commits, mocked model):", file=out)
+        for name in ('threaded', 'single'):
+            entry = batch[name]
+            if 'error' in entry:
+                print(f"  {name:<12} -j {entry['jobs']} failed: {entry['error']}", file=out)
+            else:
+                print(f"  {name:<12} -j {entry['jobs']} {entry['seconds'] * 1000:.1f} ms", file=out)
+        print(f"  identical output: {batch['identical']}", file=out)
+
+    regressions = check_regressions()
+    results['regressions'] = regressions
+    print("Regression checks:", file=out)
+    for name, passed in regressions.items():
+        print(f"  {name:<24} {'ok' if passed else 'FAILED'}", file=out)
+
+    imports = bench_import_time()
+    results['import'] = imports
+    within_budget = imports['milliseconds'] <= args.import_budget_ms and not imports['heavy_modules']
+    print("Import time:", file=out)
+    print(f"  git_suggest.cli {imports['milliseconds']:.1f} ms (budget {args.import_budget_ms:.0f} ms)", file=out)
+    if imports['heavy_modules']:
+        print(f"  heavy modules imported eagerly: {', '.join(imports['heavy_modules'])}", file=out)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f), file=out)
+
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}", file=out)
+
+    if not (result['identical'] and memory['identical'] and backends_identical and batch_ok
+            and all(regressions.values()) and within_budget):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""On-disk cache of generated commit messages."""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from .prompt import PROMPT_VERSION
+
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 500
+
+
+def get_cache_dir():
+    """Return the git-suggest cache directory (``$XDG_CACHE_HOME/git-suggest``)."""
+    base = os.getenv('XDG_CACHE_HOME')
+    if not base and sys.platform == 'win32':
+        base = os.getenv('LOCALAPPDATA')
+    if not base:
+        base = Path.home() / '.cache'
+    return Path(base) / 'git-suggest'
+
+
+def make_key(*parts):
+    """Build a cache key from the given parts (tree OID, model, prompt version...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def message_key(config, tree, head):
+    """Cache key of the message for staged ``tree`` on top of commit ``head``."""
+    return make_key(tree, head, config.get('model', 'gemini-2.5-flash'), PROMPT_VERSION, config.fingerprint())
+
+
+class ResponseCache:
+    """Persistent key/value store with TTL and size based eviction.
+
+    Each entry is a small JSON file named after its key, so concurrent
+    git-suggest processes never corrupt each other's entries.
+    """
+
+    def __init__(self, directory=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        """Initialize the cache.
+
+        Args:
+            directory: Where entries are stored (default: ``get_cache_dir()``)
+            ttl: Seconds after which an entry expires
+            max_entries: Number of entries kept before the oldest are evicted
+        """
+        self.directory = Path(directory) if directory else get_cache_dir()
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the cache configured by ``cache_ttl`` and ``cache_max_entries``, unset (null) meaning the default."""
+        ttl = config.get('cache_ttl')
+        max_entries = config.get('cache_max_entries')
+        return cls(ttl=DEFAULT_TTL if ttl is None else ttl,
+                   max_entries=DEFAULT_MAX_ENTRIES if max_entries is None else max_entries)
+
+    def _path(self, key):
+        return self.directory / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl and time.time() - entry.get('created', 0) > self.ttl:
+            self._remove(path)
+            return None
+        return entry.get('value')
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``. Failures are ignored: caching is best effort."""
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """Store every ``key: value`` of ``items``, evicting once at the end."""
+        if not items:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for key, value in items.items():
+                path = self._path(key)
+                tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'created': time.time(), 'value': value}, f)
+                os.replace(tmp_path, path)
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop expired entries and the oldest ones beyond ``max_entries``."""
+        try:
+            entries = [(path.stat().st_mtime, path) for path in self.directory.glob('*.json')]
+        except OSError:
+            return
+
+        now = time.time()
+        entries.sort(reverse=True)
+        for index, (mtime, path) in enumerate(entries):
+            if index >= self.max_entries or (self.ttl and now - mtime > self.ttl):
+                self._remove(path)
+
+    def clear(self):
+        """Remove every entry."""
+        for path in self.directory.glob('*.json'):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
@@ -1,11 +1,53 @@
 """Command-line interface for git_autocommit."""
 
 import argparse
+import atexit
+import importlib
 import sys
+import threading
+import time
+_IMPORTS_STARTED = time.perf_counter()
 from .version import __version__
-from .git_utils import get_staged_diff_summary, commit_with_message
-from .ai_client import GeminiClient
+from .git_utils import get_staged_changes, summarize_diff, get_staged_tree, get_head, commit_with_message, estimate_tokens
+from .cache import ResponseCache, message_key
 from .config import Config
+from .exclude import ExclusionRules
+from .prompt import build_prompt
+from .git_backend import get_backend, select_backend
+from .usage import RunRecord, UsageLog
+from . import timings
+from .timings import phase
+_IMPORTS_SECONDS = time.perf_counter() - _IMPORTS_STARTED
+
+
+def _elapsed_ms(started):
+    return (time.perf_counter() - started) * 1000
+
+
+def _print_token(text):
+    print(text, end='', flush=True)
+
+
+class _BackgroundCall:
+    """Runs ``func`` on a daemon thread; ``result()`` waits for it and re-raises its error."""
+
+    def __init__(self, func, name):
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(func,), name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self, func):
+        try:
+            self._result = func()
+        except BaseException as e:
+            self._error = e
+
+    def result(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
 
 
 def get_user_confirmation(message):
@@ -36,8 +78,120 @@ def get_user_confirmation(message):
             print("Invalid choice. Please enter c, e, r, or a.")
 
 
-def main():
+def choose_candidate(candidates):
+    """Show numbered candidate messages and let the user pick, edit, regenerate or abort."""
+    print("\n" + "="*60)
+    print("Generated commit messages:")
+    print("="*60)
+    print()
+    for number, candidate in enumerate(candidates, 1):
+        print(f"  {number}. {candidate}")
+    print()
+    print("="*60)
+    
+    while True:
+        choice = input(f"\nOptions: [1-{len(candidates)}] commit, [e]dit, [r]egenerate, [a]bort: ").lower().strip()
+        
+        if choice.isdigit() and 1 <= int(choice) <= len(candidates):
+            return candidates[int(choice) - 1], True
+        elif choice == 'e':
+            print("\nEnter your commit message (press Enter when done):")
+            edited = input("> ").strip()
+            if edited:
+                return edited, True
+            print("Empty message, try again.")
+        elif choice == 'r':
+            return None, False  # Signal to regenerate
+        elif choice == 'a':
+            print("Commit aborted.")
+            sys.exit(0)
+        else:
+            print(f"Invalid choice. Please enter 1-{len(candidates)}, e, r, or a.")
+
+
+def _choose_from_candidates(client, diff_summary, count, run, cached=None, verbose=False):
+    """Run the numbered-menu interactive flow and return the chosen message.
+
+    The choice (picked, edited, regenerated) is noted in the ``RunRecord`` ``run``.
+    """
+    from .ai_client import CandidateGenerator
+    generator = CandidateGenerator(client, diff_summary, count)
+    
+    # A cached message can be shown right away while the first batch loads
+    batch = [cached] if cached else generator.next_batch()
+    run.message_ready('model')
+    while True:
+        if not batch:
+            run.update(source='failed')
+            print("Failed to generate commit messages.", file=sys.stderr)
+            sys.exit(1)
+        # Stays recorded if the user aborts (sys.exit) or interrupts the prompt
+        run.update(outcome='aborted')
+        message, should_commit = choose_candidate(batch)
+        if should_commit:
+            run.update(outcome='committed' if message in batch else 'edited')
+            return message
+        run.regenerated()
+        if verbose:
+            print("Regenerating commit messages...")
+        batch = generator.next_batch()
+
+
+def _report_timings(args):
+    """Print or save the phase timings when the run ends, however it ends."""
+    if args.timings:
+        timings.TIMINGS.print_table()
+    if args.timings_json:
+        try:
+            timings.TIMINGS.write_json(args.timings_json)
+        except OSError as e:
+            print(f"Error writing timings: {e}", file=sys.stderr)
+
+
+def _start_profile(path):
+    """Profile the rest of the run with cProfile and dump the stats to ``path`` at exit."""
+    import cProfile
+    profiler = cProfile.Profile()
+    
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Profile written to {path} (inspect with: python -m pstats {path})", file=sys.stderr)
+    
+    atexit.register(dump)
+    profiler.enable()
+
+
+def _commit(message, run, verbose=False):
+    if verbose:
+        print(f"Committing with message: {message}")
+    
+    success, output = commit_with_message(message)
+    if success:
+        print(output)
+    else:
+        run.update(outcome='commit failed')
+        print(f"Error committing: {output}", file=sys.stderr)
+        sys.exit(1)
+
+
+# Subcommands and the modules implementing them, imported only when used
+SUBCOMMANDS = {
+    'batch': '.batch',
+    'serve': '.daemon',
+    'hook': '.hooks',
+    'stats': '.usage',
+}
+
+
+def main(argv=None):
     """Main CLI entry point."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in SUBCOMMANDS:
+        module = importlib.import_module(SUBCOMMANDS[argv[0]], __package__)
+        return module.main(argv[1:])
+    
     parser = argparse.ArgumentParser(
         description='AI-powered git commit message generator using Google Gemini',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -46,7 +200,17 @@ Examples:
   git-suggest                    # Generate and commit with AI message
   git-suggest --dry-run          # Show message without committing
   git-suggest --interactive      # Review message before committing
+  git-suggest -i --candidates 3  # Pick from 3 messages generated in parallel
   git-suggest --config ~/.myconfig.yml  # Use custom config file
+  git-suggest -d --timings       # Show where the time goes, phase by phase
+  git-suggest --offline          # Infer the message locally, without a model
+
+Subcommands:
+  git-suggest batch --repos A B  # Messages for staged changes in many repos (JSONL)
+  git-suggest batch --range A..B # Messages for every commit in a range (JSONL)
+  git-suggest serve              # Keep a warm client running for faster calls
+  git-suggest hook install       # Precompute messages on 'git add', fill them in on commit
+  git-suggest stats              # Latency, prompt sizes and outcomes of past runs
 
 For more information, visit: https://github.com/LemonMantis5571/Git-AutoCommit
         """
@@ -70,26 +234,108 @@ For more information, visit: https://github.com/LemonMantis5571/Git-AutoCommit
         help='Review and optionally edit message before committing'
     )
     
+    parser.add_argument(
+        '--candidates', '-n',
+        type=int,
+        metavar='N',
+        help='In interactive mode, generate N candidate messages in parallel'
+    )
+    
     parser.add_argument(
         '--config', '-c',
         type=str,
         help='Path to custom configuration file'
     )
     
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always ask the model instead of reusing a cached message'
+    )
+    
+    parser.add_argument(
+        '--map-reduce',
+        action='store_true',
+        help='Summarize large changesets per directory in parallel, then combine the summaries'
+    )
+    
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Infer the message locally from the staged files and symbols, without calling a model'
+    )
+    
+    parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help='Generate in this process even if a git-suggest daemon is running'
+    )
+    
     parser.add_argument(
         '--verbose',
         action='store_true',
         help='Enable verbose output for debugging'
     )
     
-    args = parser.parse_args()
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help='Print how long each phase took, with token and byte counts, to stderr'
+    )
+    
+    parser.add_argument(
+        '--timings-json',
+        metavar='PATH',
+        help="Write the phase timings as JSON to PATH ('-' for stderr)"
+    )
+    
+    parser.add_argument(
+        '--profile',
+        metavar='PATH',
+        help='Profile the run with cProfile and save the stats to PATH'
+    )
     
-  
-    config = Config(args.config)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    
+    if args.timings or args.timings_json:
+        timings.enable(_IMPORTS_STARTED)
+        timings.TIMINGS.record('imports', _IMPORTS_SECONDS, started=_IMPORTS_STARTED)
+        # Registered first so it runs last, after the client is closed
+        atexit.register(_report_timings, args)
+    if args.profile:
+        _start_profile(args.profile)
+    
+    config_started = time.perf_counter()
+    with phase('config'):
+        config = Config(args.config)
+    config_seconds = time.perf_counter() - config_started
+    if args.map_reduce:
+        # Through the config, so the cache fingerprint tells the modes apart
+        config.config['map_reduce'] = True
+    
+    offline = args.offline or config.get('offline', False)
+    pipeline = config.get('pipeline', True)
+    
+    # The usage log (opt-in) takes its phase timings and sizes from the timings recorder
+    usage_log = UsageLog.from_config(config)
+    if usage_log and not timings.TIMINGS.enabled:
+        timings.enable(_IMPORTS_STARTED)
+        timings.TIMINGS.record('imports', _IMPORTS_SECONDS, started=_IMPORTS_STARTED)
+        timings.TIMINGS.record('config', config_seconds, started=config_started)
+    run = RunRecord(usage_log, config, _IMPORTS_STARTED)
+    # Written after the client is closed, before the timings are reported
+    atexit.register(run.write)
+    
+    try:
+        select_backend(config.get('git_backend', 'auto'))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     
     # Get API key
     api_key = config.get_api_key()
-    if not api_key:
+    if not api_key and config.get_provider() == 'gemini' and not offline:
         print("Error: API key not found.", file=sys.stderr)
         print("\nPlease set the 'api_key' environment variable:", file=sys.stderr)
         print("  Windows: setx api_key \"YOUR_API_KEY\"", file=sys.stderr)
@@ -98,65 +344,236 @@ For more information, visit: https://github.com/LemonMantis5571/Git-AutoCommit
         sys.exit(1)
     
    
-    if args.verbose:
-        print("Fetching staged changes...")
+    token_budget = config.get_token_budget()
+    candidates = 1 if offline else args.candidates or int(config.get('candidates', 1))
     
-    diff_summary = get_staged_diff_summary()
-    if diff_summary is None:
-        sys.exit(1)
+    # Fingerprint the index first: two tiny git calls instead of a full diff
+    with phase('fingerprint'):
+        if pipeline and get_backend().concurrent:
+            pending_head = _BackgroundCall(get_head, 'rev-parse')
+            tree = get_staged_tree()
+            head, head_tree = pending_head.result()
+        else:
+            tree = get_staged_tree()
+            head, head_tree = get_head()
+    if args.verbose:
+        print(f"Fingerprinted staged tree in {_elapsed_ms(started):.1f} ms")
     
-    if not diff_summary.strip():
+    if tree and tree == head_tree:
         print("No staged changes found. Use 'git add' to stage files.", file=sys.stderr)
         sys.exit(0)
     
+    # Identical staged trees get the same message back without a model call
+    cache = None
+    cache_key = None
+    if tree and config.get('cache', True) and not args.no_cache:
+        cache = ResponseCache.from_config(config)
+        cache_key = message_key(config, tree, head)
     
-    try:
-        model = config.get('model', 'gemini-2.5-flash')
-        client = GeminiClient(api_key, model=model)
-    except ValueError as e:
-        print(f"Error: {e}", file=sys.stderr)
-        sys.exit(1)
+    changes = None
+    diff_summary = None
+    client = None
+    warming = None
     
-    # Generate commit message
-    if args.verbose:
-        print("Generating commit message with AI...")
+    def analyze():
+        nonlocal changes
+        if changes is None:
+            changes = get_staged_changes(
+                stream=config.get('stream_diff', True),
+                token_budget=token_budget,
+                exclude=ExclusionRules.from_config(config),
+                symbols=config.get('symbols', True),
+                normalize=config.get('normalize', True),
+                pipeline=pipeline,
+            )
+            if changes is None:
+                sys.exit(1)
+        return changes
     
-    message = client.generate_commit_message(diff_summary)
-    if not message:
-        sys.exit(1)
+    def local_message():
+        from .heuristic import heuristic_message
+        return heuristic_message(*analyze())
+    
+    def summarize():
+        nonlocal diff_summary
+        if diff_summary is None:
+            if args.verbose:
+                print("Fetching staged changes...")
+            if config.get('map_reduce'):
+                from .mapreduce import get_map_reduce_summary
+                client = get_client()
+                with phase('map-reduce'):
+                    summarizer, diff_summary = get_map_reduce_summary(
+                        client, config, stream=config.get('stream_diff', True)
+                    )
+                if summarizer and args.verbose:
+                    print(f"Summarized {summarizer.groups} groups in {summarizer.seconds * 1000:.0f} ms; "
+                          f"summary cache: {summarizer.cache_hits}/{summarizer.groups} groups, "
+                          f"{summarizer.files_reused}/{summarizer.files} files reused")
+            else:
+                diff, file_symbols = analyze()
+                with phase('summarize'):
+                    diff_summary = summarize_diff(diff, config.get('max_diff_lines', 300), token_budget, file_symbols)
+            if diff_summary is None:
+                sys.exit(1)
+            timings.count('summary_tokens', estimate_tokens(diff_summary))
+            run.update(prompt_tokens=estimate_tokens(build_prompt(diff_summary)))
+            if args.verbose:
+                print(f"Diff summary: ~{estimate_tokens(diff_summary)} of {token_budget} budgeted tokens "
+                      f"({_elapsed_ms(started):.1f} ms)")
+            if not diff_summary.strip():
+                print("No staged changes found. Use 'git add' to stage files.", file=sys.stderr)
+                sys.exit(0)
+        return diff_summary
+    
+    def get_client():
+        nonlocal client, warming
+        if client is None and config.get('daemon', True) and not args.no_daemon:
+            with phase('daemon ping'):
+                from .daemon import DaemonClient
+                client = DaemonClient.connect(config)
+            if client and args.verbose:
+                print(f"Using git-suggest daemon on {client.path}")
+        if client is None:
+            # Deferred so cached and early-exit runs never import the SDK
+            try:
+                with phase('client setup'):
+                    from .ai_client import create_client
+                    client = create_client(config, api_key)
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            # Close connections cleanly however the run ends (sys.exit included)
+            atexit.register(client.close)
+        if warming is not None:
+            # The client's event loop is not shared with the warm-up thread
+            with phase('wait for connection'):
+                warming.result()
+            warming = None
+        return client
+    
+    def warm_client():
+        # The connection is opened while the diff is collected and summarized.
+        # The SDK import stays on this thread: it is CPU-bound, so under the
+        # GIL it gains nothing in the background and slows the diff down.
+        nonlocal warming
+        if pipeline and client is None:
+            warming = _BackgroundCall(get_client().warm, 'warm-up')
+    
+    def generate():
+        if offline:
+            return local_message()[0]
+        summary = summarize()
+        client = get_client()
+        if not args.interactive:
+            return client.generate_commit_message(summary)
+        
+        # Show the message as it streams in
+        print("\nGenerating: ", end='', flush=True)
+        message = client.generate_commit_message(summary, on_token=_print_token)
+        print()
+        return message
+    
+    if args.interactive and candidates > 1 and not args.dry_run:
+        warm_client()
+        summary = summarize()
+        message = _choose_from_candidates(
+            get_client(), summary, candidates, run,
+            cached=cache.get(cache_key) if cache else None,
+            verbose=args.verbose,
+        )
+        if cache:
+            cache.set(cache_key, message)
+        _commit(message, run, args.verbose)
+        return
+    
+    with phase('cache lookup'):
+        message = cache.get(cache_key) if cache else None
+    if message:
+        run.message_ready('cache')
+        if args.verbose:
+            print(f"Using cached commit message ({_elapsed_ms(started):.1f} ms)")
+    elif offline:
+        message = generate()
+        if not message:
+            print("No staged changes found. Use 'git add' to stage files.", file=sys.stderr)
+            sys.exit(0)
+        run.message_ready('local')
+        if args.verbose:
+            print(f"Inferred commit message locally ({_elapsed_ms(started):.1f} ms)")
+    else:
+        # Trivial changes (docs only, formatting, moves) need no model
+        if config.get('heuristic_shortcut', False) and not config.get('map_reduce'):
+            local, trivial = local_message()
+            if trivial:
+                message = local
+                run.message_ready('local')
+                if args.verbose:
+                    print(f"Trivial change, skipped the model ({_elapsed_ms(started):.1f} ms)")
+        
+        if not message:
+            warm_client()
+            summarize()
+            
+            # Generate commit message
+            if args.verbose:
+                print("Generating commit message with AI...")
+            
+            message = generate()
+            if args.verbose:
+                stats = client.stats
+                print(f"Model call: {stats.last_attempts} attempt(s), {stats.last_seconds * 1000:.0f} ms"
+                      + (f", {stats.hedges} hedged ({stats.hedges_won} won)" if stats.hedges else ""))
+            if message:
+                run.message_ready('model')
+            if message and cache:
+                cache.set(cache_key, message)
+            elif not message and config.get('heuristic_fallback', True):
+                # Not cached: the next run should try the model again
+                message = local_message()[0]
+                if message:
+                    run.message_ready('fallback')
+                    print("Model unavailable, using a locally inferred message.", file=sys.stderr)
+            if not message:
+                run.update(source='failed')
+                sys.exit(1)
+            if args.verbose:
+                print(f"Generated commit message ({_elapsed_ms(started):.1f} ms)")
     
     
     if args.dry_run:
+        run.update(outcome='dry-run')
         print(message)
         sys.exit(0)
     
+    run.update(outcome='committed')
     if args.interactive:
         final_message = message
         while True:
+            shown = final_message
+            # Stays recorded if the user aborts (sys.exit) or interrupts the prompt
+            run.update(outcome='aborted')
             final_message, should_commit = get_user_confirmation(final_message)
             if should_commit:
+                run.update(outcome='committed' if final_message == shown else 'edited')
                 message = final_message
                 break
-            # Regenerate if requested
+            run.regenerated()
+            # Regenerate if requested; always a fresh call, never the cache
             if args.verbose:
                 print("Regenerating commit message...")
-            new_message = client.generate_commit_message(diff_summary)
+            new_message = generate()
             if new_message:
                 final_message = new_message
+                if cache and not offline:
+                    cache.set(cache_key, new_message)
             else:
+                run.update(outcome='failed')
                 print("Failed to regenerate message.", file=sys.stderr)
                 sys.exit(1)
     
    
-    if args.verbose:
-        print(f"Committing with message: {message}")
-    
-    success, output = commit_with_message(message)
-    if success:
-        print(output)
-    else:
-        print(f"Error committing: {output}", file=sys.stderr)
-        sys.exit(1)
+    _commit(message, run, args.verbose)
 
 
 if __name__ == '__main__':
@@ -1,19 +1,64 @@
+import hashlib
+import json
 import os
 from pathlib import Path
 
-try:
-    import yaml
-    HAS_YAML = True
-except ImportError:
-    HAS_YAML = False
+from .timings import phase
 
 
 DEFAULT_CONFIG = {
+    'provider': 'gemini',
     'model': 'gemini-2.5-flash',
+    'base_url': None,
     'max_diff_lines': 300,
+    'stream_diff': True,
+    'symbols': True,
+    'normalize': True,
+    'offline': False,
+    'heuristic_fallback': True,
+    'heuristic_shortcut': False,
+    'git_backend': 'auto',
+    'pipeline': True,
+    'usage_log': False,
+    'usage_log_path': None,
+    'usage_log_max_bytes': 5 * 1024 * 1024,
+    'diff_token_budget': None,
+    'candidates': 1,
+    'cache': True,
+    'cache_ttl': 7 * 24 * 60 * 60,
+    'cache_max_entries': 500,
+    'timeout': 30,
+    'retries': 2,
+    'retry_backoff': 0.5,
+    'hedge': False,
+    'hedge_delay': None,
+    'daemon': True,
+    'daemon_socket': None,
+    'hook_timeout': 5,
+    'exclude': [],
+    'exclude_defaults': True,
+    'exclude_generated': True,
+    'exclude_max_bytes': 1024 * 1024,
+    'map_reduce': False,
+    'map_reduce_min_files': 20,
+    'map_reduce_group': 'directory',
+    'map_reduce_max_groups': 32,
+    'map_reduce_concurrency': 4,
+    'map_reduce_cache': True,
     'api_key_env': 'api_key',
 }
 
+# Default token budget for the diff summary per model. Larger models get
+# more room; unknown models fall back to DEFAULT_TOKEN_BUDGET.
+MODEL_TOKEN_BUDGETS = {
+    'gemini-2.5-flash': 8000,
+    'gemini-2.5-flash-lite': 4000,
+    'gemini-2.5-pro': 16000,
+    'gemini-3-flash-preview': 8000,
+    'gemini-3-pro-preview': 16000,
+}
+DEFAULT_TOKEN_BUDGET = 6000
+
 
 class Config:
     
@@ -33,12 +78,16 @@ class Config:
     
     def load_config(self, path):
         """Load configuration from YAML file."""
-        if not HAS_YAML:
+        # Imported lazily so runs without a config file never load PyYAML
+        try:
+            with phase('import yaml'):
+                import yaml
+        except ImportError:
             print(f"Warning: PyYAML not installed. Install with 'pip install pyyaml' to use config files.")
             return
         
         try:
-            with open(path, 'r') as f:
+            with open(path, 'r') as f, phase('parse config'):
                 user_config = yaml.safe_load(f)
                 if user_config:
                     self.config.update(user_config)
@@ -49,6 +98,33 @@ class Config:
         """Get configuration value."""
         return self.config.get(key, default)
     
+    def fingerprint(self):
+        """Short hash of the effective configuration, used in cache keys."""
+        data = json.dumps(self.config, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+    
+    def get_token_budget(self):
+        """Get the diff summary token budget, defaulting per model."""
+        budget = self.config.get('diff_token_budget')
+        if budget:
+            return int(budget)
+        return MODEL_TOKEN_BUDGETS.get(self.config.get('model'), DEFAULT_TOKEN_BUDGET)
+    
+    def get_provider(self):
+        """Get the model provider backend ('gemini' or 'openai')."""
+        return str(self.config.get('provider') or 'gemini').lower()
+    
+    def get_request_policy(self):
+        """Get the timeout, retry and hedging options for model clients."""
+        hedge_delay = self.config.get('hedge_delay')
+        return {
+            'timeout': float(self.config.get('timeout') or 0) or None,
+            'retries': max(0, int(self.config.get('retries') or 0)),
+            'backoff': float(self.config.get('retry_backoff') or 0),
+            'hedge': bool(self.config.get('hedge')),
+            'hedge_delay': float(hedge_delay) if hedge_delay else None,
+        }
+    
     def get_api_key(self):
         """Get API key from environment."""
         env_var = self.config.get('api_key_env', 'api_key')
@@ -0,0 +1,342 @@
+"""Background daemon keeping a warm model client between commits.
+
+``git-suggest serve`` listens on a Unix socket and answers generation
+requests with one long-lived client, so repeated runs (for example from a
+``prepare-commit-msg`` hook) skip the SDK import, config parsing and TLS
+handshake. The CLI talks to it through ``DaemonClient`` when it is running
+and works in-process otherwise.
+
+The protocol is one JSON object per line. A request is answered by zero or
+more ``{"token": ...}`` lines (streaming only) and one final object.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sys
+import time
+
+from .cache import get_cache_dir
+from .config import Config
+from .metrics import RequestStats
+from .timings import count, phase
+
+
+# Stop after this long without requests; a hook-started daemon should not linger forever
+DEFAULT_IDLE_TIMEOUT = 60 * 60
+
+# Connecting to a dead socket fails immediately; this only guards against a hung daemon
+CONNECT_TIMEOUT = 0.5
+
+
+def get_socket_path():
+    """Return the daemon socket path (``$XDG_RUNTIME_DIR/git-suggest.sock``)."""
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'git-suggest.sock')
+    return str(get_cache_dir() / 'daemon.sock')
+
+
+def config_fingerprint(config):
+    """Identify the settings a daemon must share with a CLI to answer for it."""
+    key = config.get_api_key() or ''
+    key_digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    return f"{config.fingerprint()}:{key_digest}"
+
+
+def _request(path, payload, timeout=None):
+    """Send one request and yield the response objects as they arrive."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path)
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        with sock.makefile('r', encoding='utf-8') as reader:
+            for line in reader:
+                yield json.loads(line)
+    finally:
+        sock.close()
+
+
+def ping(path, fingerprint=None):
+    """Return the daemon's reply to a ping, or None if nothing answers on ``path``."""
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    try:
+        return next(_request(path, {'op': 'ping', 'fingerprint': fingerprint}, timeout=CONNECT_TIMEOUT), None)
+    except (OSError, ValueError):
+        return None
+
+
+class DaemonClient:
+    """Forwards generation to a running daemon; mirrors the ``BaseClient`` sync API."""
+
+    provider_name = 'git-suggest daemon'
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.stats = RequestStats()
+
+    @classmethod
+    def connect(cls, config, path=None):
+        """Return a client for a daemon serving ``config``, or None if none is running."""
+        path = path or config.get('daemon_socket') or get_socket_path()
+        fingerprint = config_fingerprint(config)
+        reply = ping(path, fingerprint)
+        return cls(path, fingerprint) if reply and reply.get('ok') else None
+
+    def warm(self):
+        """Nothing to prepare: the daemon keeps its own connections warm."""
+
+    def _call(self, payload, on_token=None):
+        payload['fingerprint'] = self.fingerprint
+        count('bytes_sent', len(json.dumps(payload).encode('utf-8')) + 1)
+        try:
+            with phase('daemon request'):
+                for reply in _request(self.path, payload):
+                    if 'token' in reply:
+                        if on_token:
+                            on_token(reply['token'])
+                        continue
+                    return reply
+        except (OSError, ValueError) as e:
+            print(f"Error calling {self.provider_name}: {e}", file=sys.stderr)
+            return {}
+        print(f"Error calling {self.provider_name}: connection closed", file=sys.stderr)
+        return {}
+
+    def _record(self, reply):
+        count('model_calls')
+        self.stats.calls += 1
+        self.stats.last_attempts = reply.get('attempts', 0)
+        self.stats.last_seconds = reply.get('seconds', 0.0)
+        self.stats.attempts += self.stats.last_attempts
+        self.stats.hedges += reply.get('hedges', 0)
+        self.stats.hedges_won += reply.get('hedges_won', 0)
+        if 'error' in reply:
+            self.stats.failures += 1
+            print(f"Error from {self.provider_name}: {reply['error']}", file=sys.stderr)
+
+    def generate_commit_message(self, diff_summary, on_token=None):
+        """Generate a commit message through the daemon (None on failure)."""
+        reply = self._call({'op': 'generate', 'summary': diff_summary, 'stream': on_token is not None},
+                           on_token)
+        self._record(reply)
+        return reply.get('message')
+
+    def generate_candidates(self, diff_summary, count):
+        """Generate up to ``count`` distinct messages through the daemon."""
+        reply = self._call({'op': 'candidates', 'summary': diff_summary, 'count': count})
+        self._record(reply)
+        return reply.get('messages') or []
+
+    def generate_many(self, prompts, concurrency=4):
+        """Answer several complete prompts through the daemon (None for failures)."""
+        reply = self._call({'op': 'prompts', 'prompts': prompts, 'concurrency': concurrency})
+        self._record(reply)
+        return reply.get('messages') or [None] * len(prompts)
+
+    def stop(self):
+        """Ask the daemon to exit."""
+        self._call({'op': 'stop'})
+
+    def close(self):
+        pass
+
+
+class Daemon:
+    """Serves requests from ``DaemonClient`` with one warm model client."""
+
+    def __init__(self, client, fingerprint, path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.client = client
+        self.fingerprint = fingerprint
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.last_request = time.monotonic()
+        self.requests = 0
+        self._stopped = None
+
+    async def _write(self, writer, reply):
+        writer.write(json.dumps(reply).encode('utf-8') + b'\n')
+        await writer.drain()
+
+    async def _generate(self, request, writer):
+        stats = self.client.stats
+        hedges, hedges_won = stats.hedges, stats.hedges_won
+
+        def on_token(text):
+            # The transport sends right away; the final drain applies backpressure
+            writer.write(json.dumps({'token': text}).encode('utf-8') + b'\n')
+
+        if request['op'] == 'prompts':
+            messages = await self.client.agenerate_many(request['prompts'], int(request.get('concurrency', 4)))
+            reply = {'messages': messages}
+            if not any(messages):
+                reply['error'] = 'no message generated'
+        elif request['op'] == 'candidates':
+            messages = await self.client.agenerate_candidates(request['summary'], int(request.get('count', 1)))
+            reply = {'messages': messages}
+            if not messages:
+                reply['error'] = 'no message generated'
+        else:
+            message = await self.client.agenerate_commit_message(
+                request['summary'], on_token=on_token if request.get('stream') else None
+            )
+            reply = {'message': message}
+            if not message:
+                reply['error'] = 'no message generated'
+
+        reply.update(
+            attempts=stats.last_attempts,
+            seconds=round(stats.last_seconds, 4),
+            hedges=stats.hedges - hedges,
+            hedges_won=stats.hedges_won - hedges_won,
+        )
+        return reply
+
+    async def _handle(self, reader, writer):
+        self.last_request = time.monotonic()
+        self.requests += 1
+        try:
+            line = await reader.readline()
+            request = json.loads(line or b'{}')
+            op = request.get('op')
+
+            matches = request.get('fingerprint') == self.fingerprint
+            if op == 'ping':
+                reply = {'ok': matches, 'pid': os.getpid(), 'requests': self.requests}
+            elif op == 'stop':
+                reply = {'ok': True}
+                self._stopped.set()
+            elif not matches:
+                reply = {'error': 'daemon was started with a different configuration'}
+            elif op in ('generate', 'candidates', 'prompts'):
+                reply = await self._generate(request, writer)
+            else:
+                reply = {'error': f"unknown operation {op!r}"}
+            await self._write(writer, reply)
+
+        except (ValueError, KeyError) as e:
+            await self._write(writer, {'error': f"bad request: {e}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self.last_request = time.monotonic()
+
+    async def _watch_idle(self):
+        import asyncio
+        while not self._stopped.is_set():
+            await asyncio.sleep(min(60, self.idle_timeout))
+            if time.monotonic() - self.last_request >= self.idle_timeout:
+                self._stopped.set()
+
+    async def serve(self):
+        """Serve until stopped or idle for ``idle_timeout`` seconds."""
+        import asyncio
+        self._stopped = asyncio.Event()
+
+        # The socket grants use of the API key: only the owner may connect
+        old_umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.path)
+        finally:
+            os.umask(old_umask)
+
+        watcher = asyncio.ensure_future(self._watch_idle()) if self.idle_timeout else None
+        try:
+            await self._stopped.wait()
+        finally:
+            if watcher:
+                watcher.cancel()
+            server.close()
+            await server.wait_closed()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+def main(argv=None):
+    """Entry point for ``git-suggest serve``."""
+    parser = argparse.ArgumentParser(
+        prog='git-suggest serve',
+        description='Keep a warm model client running for fast repeated git-suggest calls'
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help=f'Unix socket to listen on (default: {get_socket_path()})'
+    )
+    parser.add_argument(
+        '--idle-timeout',
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        metavar='SECONDS',
+        help=f'Exit after this long without requests; 0 never exits (default: {DEFAULT_IDLE_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--stop',
+        action='store_true',
+        help='Stop the running daemon'
+    )
+    parser.add_argument(
+        '--config', '-c',
+        type=str,
+        help='Path to custom configuration file'
+    )
+    args = parser.parse_args(argv)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print("Error: the daemon needs Unix domain sockets, which this platform lacks.", file=sys.stderr)
+        sys.exit(1)
+
+    config = Config(args.config)
+    path = args.socket or config.get('daemon_socket') or get_socket_path()
+    fingerprint = config_fingerprint(config)
+    running = ping(path, fingerprint)
+
+    if args.stop:
+        if not running:
+            print(f"No daemon is running on {path}", file=sys.stderr)
+            sys.exit(1)
+        DaemonClient(path, fingerprint).stop()
+        print(f"Stopped daemon on {path}")
+        return
+    if running:
+        if running.get('ok'):
+            print(f"Daemon already running on {path} (pid {running.get('pid')})")
+            return
+        print(f"Error: a daemon with a different configuration is running on {path}.", file=sys.stderr)
+        print("Stop it with 'git-suggest serve --stop' or pick another --socket.", file=sys.stderr)
+        sys.exit(1)
+
+    api_key = config.get_api_key()
+    if not api_key and config.get_provider() == 'gemini':
+        print("Error: API key not found.", file=sys.stderr)
+        sys.exit(1)
+
+    from .ai_client import create_client
+    try:
+        client = create_client(config, api_key)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Nothing answers on the path, so any socket file is left over from a crash
+    if os.path.exists(path):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    daemon = Daemon(client, config_fingerprint(config), path, idle_timeout=args.idle_timeout)
+    print(f"git-suggest daemon listening on {path}", file=sys.stderr)
+    try:
+        client.run(daemon.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
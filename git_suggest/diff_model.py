@@ -0,0 +1,272 @@
+"""Parsed representation of a staged diff.
+
+The combined ``git diff --raw --stat --patch`` output is parsed once into
+``DiffFile``/``Hunk``/``DiffLine`` objects that the summarizer and any other
+consumer work on, instead of rescanning the raw text.
+"""
+
+import re
+
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$')
+
+# Upper bound on the number of diff lines kept in memory. Beyond it lines are
+# still counted (and sized) but their content is dropped. The bound is shared
+# between files, each keeping at least MIN_RETAINED_PER_FILE lines.
+MAX_RETAINED_LINES = 5000
+MIN_RETAINED_PER_FILE = 50
+
+
+class DiffLine:
+    """A single line inside a hunk."""
+
+    __slots__ = ('kind', 'content')
+
+    def __init__(self, kind, content):
+        self.kind = kind          # '+', '-', ' ' or '\\'
+        self.content = content
+
+    @property
+    def is_change(self):
+        return self.kind == '+' or self.kind == '-'
+
+    def __str__(self):
+        return self.kind + self.content
+
+    def __repr__(self):
+        return f"DiffLine({self.kind!r}, {self.content!r})"
+
+
+class Hunk:
+    """A hunk of a file diff, with counters that survive line truncation."""
+
+    __slots__ = (
+        'header', 'old_start', 'old_count', 'new_start', 'new_count', 'section',
+        'lines', 'added', 'removed', 'line_count', 'char_count',
+    )
+
+    def __init__(self, header):
+        self.header = header
+        match = HUNK_HEADER.match(header)
+        if match:
+            old_start, old_count, new_start, new_count, section = match.groups()
+            self.old_start = int(old_start)
+            self.old_count = int(old_count) if old_count is not None else 1
+            self.new_start = int(new_start)
+            self.new_count = int(new_count) if new_count is not None else 1
+            self.section = section
+        else:
+            self.old_start = self.old_count = self.new_start = self.new_count = 0
+            self.section = ''
+        self.lines = []
+        self.added = 0
+        self.removed = 0
+        self.line_count = 0
+        self.char_count = 0
+
+    @property
+    def truncated(self):
+        return len(self.lines) < self.line_count
+
+    def __repr__(self):
+        return f"Hunk({self.header!r}, +{self.added} -{self.removed})"
+
+
+class DiffFile:
+    """One changed file: its name-status entry, extended headers and hunks."""
+
+    __slots__ = (
+        'status', 'old_path', 'path', 'old_mode', 'new_mode', 'old_oid', 'new_oid',
+        'header', 'hunks', 'binary',
+    )
+
+    def __init__(self, status, path, old_path=None, old_mode=None, new_mode=None,
+                 old_oid=None, new_oid=None):
+        self.status = status
+        self.path = path
+        self.old_path = old_path or path
+        self.old_mode = old_mode
+        self.new_mode = new_mode
+        self.old_oid = old_oid
+        self.new_oid = new_oid
+        self.header = []
+        self.hunks = []
+        self.binary = False
+
+    @classmethod
+    def from_raw(cls, line):
+        """Build a file from a ``git diff --raw`` record."""
+        meta, paths = line.split('\t', 1)
+        old_mode, new_mode, old_oid, new_oid, status = meta[1:].split(' ')
+        paths = paths.split('\t')
+        return cls(status, paths[-1], old_path=paths[0], old_mode=old_mode,
+                   new_mode=new_mode, old_oid=old_oid, new_oid=new_oid)
+
+    @property
+    def name_status(self):
+        if self.old_path != self.path:
+            return f"{self.status}\t{self.old_path}\t{self.path}"
+        return f"{self.status}\t{self.path}"
+
+    @property
+    def git_header(self):
+        """The ``diff --git`` line git prints for this file."""
+        return f"diff --git {_prefixed('a/', self.old_path)} {_prefixed('b/', self.path)}"
+
+    @property
+    def insertions(self):
+        return sum(hunk.added for hunk in self.hunks)
+
+    @property
+    def deletions(self):
+        return sum(hunk.removed for hunk in self.hunks)
+
+    @property
+    def line_count(self):
+        return len(self.header) + sum(hunk.line_count + 1 for hunk in self.hunks)
+
+    @property
+    def char_count(self):
+        """Size of this file's patch text, newlines included."""
+        size = sum(len(line) + 1 for line in self.header)
+        for hunk in self.hunks:
+            size += len(hunk.header) + 1 + hunk.char_count + hunk.line_count
+        return size
+
+    def __repr__(self):
+        return f"DiffFile({self.status!r}, {self.path!r}, +{self.insertions} -{self.deletions})"
+
+
+class StagedDiff:
+    """All staged changes: the files, the raw stat block and line totals."""
+
+    __slots__ = ('files', 'name_status', 'stats', 'total_lines', 'truncated', 'collapsed')
+
+    def __init__(self, files=None, name_status='', stats='', total_lines=0, truncated=False, collapsed=None):
+        self.files = files if files is not None else []
+        self.name_status = name_status
+        self.stats = stats
+        self.total_lines = total_lines
+        self.truncated = truncated
+        # One line per mechanical change taken out of the files (see normalize.py)
+        self.collapsed = collapsed if collapsed is not None else []
+
+    def patch_lines(self):
+        """Yield the patch back as text lines (complete unless truncated)."""
+        for file in self.files:
+            yield from file.header
+            for hunk in file.hunks:
+                yield hunk.header
+                for line in hunk.lines:
+                    yield str(line)
+
+    def __bool__(self):
+        return bool(self.files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+
+def _prefixed(prefix, path):
+    # Quoted paths keep their quotes around the prefix: "a/\303\274.py"
+    if path.startswith('"'):
+        return f'"{prefix}{path[1:]}'
+    return prefix + path
+
+
+def parse_diff(lines, max_retained=MAX_RETAINED_LINES, on_files=None):
+    """Parse ``git diff --raw --stat --patch`` output into a ``StagedDiff``.
+
+    Args:
+        lines: Iterable of output lines without trailing newlines, such as
+            ``output.split('\\n')`` or a backend's ``diff_lines(stream=True)``
+        max_retained: Approximate number of hunk lines to retain, split
+            evenly between files; ``None`` keeps all
+        on_files: Called with the files of the raw records as soon as they
+            are read, while git may still be producing the patch
+
+    Returns:
+        StagedDiff
+    """
+    diff = StagedDiff()
+    name_status = []
+    stats = []
+    by_header = {}
+    per_file = None
+    retained = 0
+    total = 0
+    file = None
+    hunk = None
+    in_patch = False
+
+    for line in lines:
+        if not in_patch:
+            if line.startswith(':'):
+                entry = DiffFile.from_raw(line)
+                diff.files.append(entry)
+                by_header.setdefault(entry.git_header, entry)
+                name_status.append(line.split(' ', 4)[4])
+                continue
+            if line.startswith(' '):
+                stats.append(line)
+                continue
+            in_patch = True
+            if on_files:
+                on_files(list(diff.files))
+            if max_retained is not None:
+                per_file = max(max_retained // max(len(diff.files), 1), MIN_RETAINED_PER_FILE)
+            if line == '' and stats:
+                # Blank separator between the stat block and the patch
+                continue
+
+        total += 1
+
+        if line.startswith('diff --git '):
+            file = by_header.get(line)
+            if file is None:
+                # Not announced in the raw records; keep it rather than lose it
+                file = DiffFile('?', line.rsplit(' b/', 1)[-1])
+                diff.files.append(file)
+            elif file.header:
+                # Type changes are printed as a deletion followed by a creation
+                second = DiffFile(file.status, file.path, old_path=file.old_path,
+                                  old_mode=file.old_mode, new_mode=file.new_mode,
+                                  old_oid=file.old_oid, new_oid=file.new_oid)
+                diff.files.insert(diff.files.index(file) + 1, second)
+                file = second
+            by_header[line] = file
+            file.header.append(line)
+            hunk = None
+            retained = 0
+        elif line.startswith('@@'):
+            if file is None:
+                continue
+            hunk = Hunk(line)
+            file.hunks.append(hunk)
+        elif hunk is not None and line:
+            kind = line[0]
+            hunk.line_count += 1
+            hunk.char_count += len(line)
+            if kind == '+':
+                hunk.added += 1
+            elif kind == '-':
+                hunk.removed += 1
+            if per_file is None or retained < per_file:
+                hunk.lines.append(DiffLine(kind, line[1:]))
+                retained += 1
+            else:
+                diff.truncated = True
+        elif file is not None and line:
+            file.header.append(line)
+            if line.startswith('Binary files '):
+                file.binary = True
+
+    if on_files and not in_patch:
+        on_files(list(diff.files))
+    diff.name_status = ''.join(f"{line}\n" for line in name_status)
+    diff.stats = ''.join(f"{line}\n" for line in stats)
+    diff.total_lines = total
+    return diff
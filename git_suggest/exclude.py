@@ -0,0 +1,108 @@
+"""Rules keeping generated files, lockfiles and huge blobs out of the patch.
+
+Excluded files are still listed in the name-status and stat sections; git
+is only told, through exclude pathspecs, not to diff their contents.
+"""
+
+import fnmatch
+import posixpath
+import subprocess
+
+
+# Files whose contents say little about a change but can dwarf everything else
+DEFAULT_EXCLUDE_PATTERNS = [
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'bun.lockb',
+    'poetry.lock', 'Pipfile.lock', 'uv.lock', 'Cargo.lock', 'composer.lock', 'Gemfile.lock',
+    'go.sum', 'flake.lock', 'packages.lock.json',
+    '*.min.js', '*.min.css', '*.map', '*.snap', '__snapshots__/*',
+]
+
+# Attribute values marking files as not worth diffing (``path linguist-generated``
+# or ``path -diff`` in .gitattributes)
+ATTRIBUTE_PATHSPECS = [
+    ':(exclude,attr:linguist-generated)',
+    ':(exclude,attr:linguist-generated=true)',
+    ':(exclude,attr:-diff)',
+]
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+NULL_OID = '0' * 40
+
+
+def _unquote(path):
+    return path[1:-1] if path.startswith('"') else path
+
+
+class ExclusionRules:
+    """Decides which staged files are diffed and builds the matching pathspecs."""
+
+    def __init__(self, patterns=None, attributes=True, max_bytes=DEFAULT_MAX_BYTES):
+        """Initialize the rules.
+
+        Args:
+            patterns: Globs matched against the whole path and, without a
+                slash, against the file name (like .gitignore); default:
+                ``DEFAULT_EXCLUDE_PATTERNS``
+            attributes: Honour ``linguist-generated`` and ``-diff`` from .gitattributes
+            max_bytes: Files whose old or new version is larger are not diffed (0: no limit)
+        """
+        self.patterns = list(DEFAULT_EXCLUDE_PATTERNS if patterns is None else patterns)
+        self.attributes = attributes
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the rules from the ``exclude*`` settings; None if nothing is excluded."""
+        patterns = list(DEFAULT_EXCLUDE_PATTERNS) if config.get('exclude_defaults', True) else []
+        patterns.extend(config.get('exclude') or [])
+        attributes = bool(config.get('exclude_generated', True))
+        max_bytes = int(config.get('exclude_max_bytes') or 0)
+        if not (patterns or attributes or max_bytes):
+            return None
+        return cls(patterns, attributes, max_bytes)
+
+    def matches(self, path):
+        """Whether ``path`` matches one of the glob patterns."""
+        path = _unquote(path)
+        name = posixpath.basename(path)
+        for pattern in self.patterns:
+            target = path if '/' in pattern else name
+            if fnmatch.fnmatchcase(target, pattern) or fnmatch.fnmatchcase(path, f"*/{pattern}"):
+                return True
+        return False
+
+    def _too_large(self, files, cwd=None):
+        """Paths of the files with a blob over ``max_bytes``, from one ``git cat-file`` call."""
+        oids = {}
+        for file in files:
+            for oid in (file.old_oid, file.new_oid):
+                if oid and oid != NULL_OID:
+                    oids.setdefault(oid, []).append(file.path)
+        if not oids:
+            return set()
+
+        result = subprocess.run(
+            ["git", "cat-file", "--batch-check=%(objectname) %(objectsize)"],
+            cwd=cwd,
+            input=''.join(f"{oid}\n" for oid in oids),
+            capture_output=True,
+            text=True,
+        )
+        large = set()
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit() and int(parts[1]) > self.max_bytes:
+                large.update(oids.get(parts[0], ()))
+        return large
+
+    def pathspecs(self, files, cwd=None):
+        """Return the exclude pathspecs keeping the files not worth diffing out of a diff of ``files``."""
+        excluded = {file.path for file in files if self.matches(file.path)}
+        if self.max_bytes:
+            excluded |= self._too_large(files, cwd)
+
+        specs = list(ATTRIBUTE_PATHSPECS) if self.attributes else []
+        # Quoted paths cannot be used literally; globs still catch most of them
+        specs.extend(f":(exclude,top,literal){path}" for path in sorted(excluded) if not path.startswith('"'))
+        return specs
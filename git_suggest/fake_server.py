@@ -0,0 +1,197 @@
+"""Local stand-in for an OpenAI-compatible model server.
+
+Serves ``POST /v1/chat/completions`` (streaming and non-streaming) with a
+canned commit message, a configurable time to first token and token rate,
+and optionally a delay on every new connection standing in for the TCP and
+TLS handshakes of a remote API, so the whole pipeline can be benchmarked and
+exercised offline::
+
+    python -m git_suggest.fake_server --port 8765 --latency 0.4 --tokens-per-second 50 --handshake 0.1
+
+and in ``.gitcommit.yml``::
+
+    provider: openai
+    base_url: http://127.0.0.1:8765/v1
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# A body after the subject line lets clients show early termination pays off
+DEFAULT_MESSAGE = (
+    "feat: update staged changes\n\n"
+    "This body is never needed because only the first line is used as the "
+    "commit message, so a streaming client should hang up before it arrives."
+)
+
+TOKEN = re.compile(r'\S+\s*|\s+')
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Nothing is read from a new connection before its "handshake" is over
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def do_HEAD(self):
+        # Lets clients open their connection ahead of the first request
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        received = time.time()
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            request = {}
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f"Unknown endpoint {self.path}"}})
+            return
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.request_times.append(received)
+            failing = server.requests <= server.failures
+        if failing:
+            self._send_json(503, {'error': {'message': "Simulated overload"}})
+            return
+        time.sleep(server.latency)
+
+        if request.get('stream'):
+            self._stream(request.get('model', 'fake'))
+        else:
+            self._send_json(200, {
+                'object': 'chat.completion',
+                'model': request.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': server.message},
+                    'finish_reason': 'stop',
+                }],
+            })
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, model):
+        server = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        delay = 1.0 / server.tokens_per_second if server.tokens_per_second else 0.0
+        try:
+            for token in TOKEN.findall(server.message):
+                if delay:
+                    time.sleep(delay)
+                event = {
+                    'object': 'chat.completion.chunk',
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}],
+                }
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                with server.lock:
+                    server.tokens_sent += 1
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early, which is exactly what it should do
+            self.close_connection = True
+
+
+class FakeModelServer(ThreadingHTTPServer):
+    """HTTP server with the fake model's settings and counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, tokens_per_second=0.0, message=DEFAULT_MESSAGE, failures=0,
+                 handshake=0.0):
+        super().__init__(address, FakeModelHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.message = message
+        self.failures = failures
+        self.handshake = handshake
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.tokens_sent = 0
+        # Wall-clock arrival of each completion request, for time-to-first-request
+        self.request_times = []
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_server(host='127.0.0.1', port=0, latency=0.0, tokens_per_second=0.0, message=DEFAULT_MESSAGE,
+                 failures=0, handshake=0.0):
+    """Start a fake server on a background thread and return it.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free one; see ``server.url``)
+        latency: Seconds to wait before the first token
+        tokens_per_second: Streaming rate; 0 sends everything at once
+        message: Response text
+        failures: Number of initial requests answered with 503, to exercise retries
+        handshake: Seconds added to every new connection, like a remote API's
+            TCP and TLS handshakes
+
+    Call ``server.shutdown()`` when done.
+    """
+    server = FakeModelServer((host, port), latency, tokens_per_second, message, failures, handshake)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fake OpenAI-compatible server for offline benchmarks')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind (default: 8765)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help='Streaming rate (0: unlimited)')
+    parser.add_argument('--message', default=DEFAULT_MESSAGE, help='Response text')
+    parser.add_argument('--failures', type=int, default=0, help='Answer the first N requests with 503')
+    parser.add_argument('--handshake', type=float, default=0.0,
+                        help='Seconds added to every new connection (TCP and TLS handshakes)')
+    args = parser.parse_args(argv)
+
+    server = FakeModelServer((args.host, args.port), args.latency, args.tokens_per_second, args.message,
+                             args.failures, args.handshake)
+    print(f"Fake model server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
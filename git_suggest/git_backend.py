@@ -0,0 +1,687 @@
+"""How git-suggest talks to the repository: git subprocesses or libgit2 in-process.
+
+``SubprocessBackend`` runs the git executable for every operation and is
+always available. ``Pygit2Backend`` reads the index, trees and blobs
+through libgit2 when the optional pygit2 package (1.14 or later) is
+installed, so a run no longer forks git for the tree, HEAD, the diff, the
+blobs of the changed symbols and the commit, and the index is read once
+instead of once per process. Whatever the in-process backend cannot do
+exactly like git (pathspecs, commit hooks, signing...) it hands back to
+the subprocess implementation it inherits from.
+
+The backend is chosen with ``select_backend`` (``git_backend`` in the
+config): ``auto`` uses pygit2 when it can be imported.
+"""
+
+import itertools
+import os
+import subprocess
+import tempfile
+import threading
+
+from .diff_model import _prefixed, parse_diff
+from .timings import phase
+
+
+BACKENDS = ('auto', 'pygit2', 'subprocess')
+
+# Object ID of the empty tree, the "parent" of a root commit
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+# Hooks ``git commit`` runs; a commit made in-process would skip them
+COMMIT_HOOKS = ('pre-commit', 'prepare-commit-msg', 'commit-msg', 'post-commit', 'reference-transaction')
+
+# Settings changing what ``git commit -m`` writes; with any of them set the commit is left to git
+COMMIT_SETTINGS = ('commit.cleanup', 'core.hooksPath', 'i18n.commitEncoding')
+
+# Set by git for hooks and by ``git commit -a``/``git commit <paths>`` (a temporary
+# index); libgit2 ignores them, so with any of them set only git sees the right repository
+GIT_LOCATION_ENV = ('GIT_DIR', 'GIT_WORK_TREE', 'GIT_INDEX_FILE')
+
+
+def _diff_command(revisions=None, paths=None, patch=True, records=True, pathspecs=None):
+    command = ["git", "diff"] if revisions else ["git", "diff", "--staged"]
+    # The headers parse_diff matches, whatever diff.mnemonicPrefix, diff.noprefix,
+    # diff.external or color.diff the user has set
+    command += ["--src-prefix=a/", "--dst-prefix=b/", "--no-ext-diff", "--no-color"]
+    # Moved and copied files become one record instead of a full deletion and addition
+    command += ["--find-renames", "--find-copies"]
+    if records:
+        command += ["--no-abbrev", "--raw", "--stat"]
+    if patch:
+        command.append("--patch")
+    command += revisions or []
+    if paths or pathspecs:
+        # Paths from git's own output: relative to the top level, never globs
+        command += ["--", *(f":(top,literal){path}" for path in paths or []), *(pathspecs or [])]
+    return command
+
+
+def _stream_lines(command, cwd=None):
+    """Yield the output lines of ``command`` as it writes them.
+
+    Lines come without their trailing newline, exactly like the elements of
+    ``output.split('\\n')``, so they can be fed straight to ``parse_diff``
+    without ever holding the whole output in memory.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            command,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            text=True,
+            encoding='utf-8',
+            errors='replace'
+        )
+        try:
+            ended_with_newline = True
+            for line in process.stdout:
+                ended_with_newline = line.endswith('\n')
+                yield line[:-1] if ended_with_newline else line
+            if ended_with_newline:
+                yield ''
+
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise subprocess.CalledProcessError(
+                    process.returncode,
+                    command,
+                    stderr=stderr.read().decode('utf-8', errors='replace')
+                )
+        finally:
+            # The consumer may stop early; never leave git running behind us
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+
+def _output_lines(command, cwd=None, stream=False):
+    if stream:
+        return _stream_lines(command, cwd)
+    result = subprocess.run(
+        command,
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        check=True
+    )
+    return result.stdout.split('\n')
+
+
+class SubprocessBackend:
+    """Runs the git executable for every operation."""
+
+    name = 'subprocess'
+    # Every call is its own git process, so calls may run on several threads at once
+    concurrent = True
+
+    def __init__(self, cwd=None):
+        self.cwd = cwd
+
+    def write_tree(self):
+        """Return the tree OID of the index, or None if it cannot be written (conflicts)."""
+        try:
+            result = subprocess.run(
+                ["git", "write-tree"],
+                cwd=self.cwd,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+        except subprocess.CalledProcessError:
+            return None
+        return result.stdout.strip() or None
+
+    def head(self):
+        """Return ``(commit OID, tree OID)`` of HEAD, or ``(None, None)`` on an unborn branch."""
+        try:
+            result = subprocess.run(
+                ["git", "rev-parse", "HEAD", "HEAD^{tree}"],
+                cwd=self.cwd,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+        except subprocess.CalledProcessError:
+            return None, None
+        commit, tree = result.stdout.split()
+        return commit, tree
+
+    def diff_lines(self, revisions=None, paths=None, patch=True, exclude=None, stream=False):
+        """Return the lines of ``git diff --raw --stat --patch`` for the staged changes.
+
+        Lines come without their trailing newline, ready for ``parse_diff``.
+
+        Args:
+            revisions: Diff these revisions instead of the index against HEAD
+            paths: Limit the diff to these paths
+            patch: Include the patch, not only the raw records and stats
+            exclude: ``ExclusionRules``; matching files are listed but not diffed
+            stream: Yield lines as git writes them instead of buffering the output
+
+        Raises:
+            subprocess.CalledProcessError: If git fails
+        """
+        if exclude is None or not patch:
+            return _output_lines(_diff_command(revisions, paths, patch), self.cwd, stream)
+
+        # Records and stats of every file first, then the patch of those worth
+        # diffing; together they read exactly like the output of a single call
+        records = _output_lines(_diff_command(revisions, paths, patch=False), self.cwd)
+        files = parse_diff(records, max_retained=0).files
+        if not files:
+            return records
+
+        pathspecs = exclude.pathspecs(files, self.cwd)
+        if not paths:
+            pathspecs.insert(0, ':(top)')
+        patch_lines = _output_lines(
+            _diff_command(revisions, paths, records=False, pathspecs=pathspecs), self.cwd, stream
+        )
+        return itertools.chain(records, patch_lines)
+
+    def read_blobs(self, oids, max_bytes=None):
+        """Return ``{oid: bytes}`` for ``oids``, from one ``git cat-file --batch`` call.
+
+        Missing objects and blobs over ``max_bytes`` are left out.
+        """
+        result = subprocess.run(
+            ["git", "cat-file", "--batch"],
+            cwd=self.cwd,
+            input=''.join(f"{oid}\n" for oid in oids).encode('ascii'),
+            capture_output=True,
+        )
+        output = result.stdout
+        blobs = {}
+        pos = 0
+        while pos < len(output):
+            end = output.find(b'\n', pos)
+            if end == -1:
+                break
+            header = output[pos:end].split()
+            pos = end + 1
+            if len(header) != 3 or not header[2].isdigit():
+                continue  # "<oid> missing"
+            size = int(header[2])
+            if max_bytes is None or size <= max_bytes:
+                blobs[header[0].decode('ascii')] = output[pos:pos + size]
+            pos += size + 1
+        return blobs
+
+    def commit(self, message):
+        """Commit the index with ``message``; returns ``(success, git's output or error)``."""
+        try:
+            result = subprocess.run(
+                ["git", "commit", "-m", message],
+                cwd=self.cwd,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                check=True
+            )
+            return True, result.stdout
+        except subprocess.CalledProcessError as e:
+            return False, e.stderr
+
+
+def _quote_path(path):
+    """Quote ``path`` the way git prints it with the default ``core.quotePath``."""
+    if all(' ' <= char < '\x7f' and char not in '"\\' for char in path):
+        return path
+    escaped = []
+    for byte in path.encode('utf-8', errors='surrogateescape'):
+        char = chr(byte)
+        if char in '"\\':
+            escaped.append('\\' + char)
+        elif char == '\t':
+            escaped.append('\\t')
+        elif char == '\n':
+            escaped.append('\\n')
+        elif ' ' <= char < '\x7f':
+            escaped.append(char)
+        else:
+            escaped.append(f"\\{byte:03o}")
+    return f'"{"".join(escaped)}"'
+
+
+def _rename_name(old, new):
+    """``dir/{old => new}`` the way ``--stat`` names a renamed file."""
+    if _quote_path(old) != old or _quote_path(new) != new:
+        return f"{_quote_path(old)} => {_quote_path(new)}"
+    prefix = 0
+    for i, (a, b) in enumerate(zip(old, new)):
+        if a != b:
+            break
+        if a == '/':
+            prefix = i + 1
+    suffix = 0
+    for i in range(1, min(len(old), len(new)) - prefix + 1):
+        if old[-i] != new[-i]:
+            break
+        if old[-i] == '/':
+            suffix = i
+    middle_old = old[prefix:len(old) - suffix]
+    middle_new = new[prefix:len(new) - suffix]
+    if not (prefix or suffix):
+        return f"{old} => {new}"
+    return f"{old[:prefix]}{{{middle_old} => {middle_new}}}{old[len(old) - suffix:]}"
+
+
+def _scale(value, width, max_change):
+    return 1 + value * (width - 1) // max_change if value else 0
+
+
+def _stat_lines(entries, width=80):
+    """Render ``git diff --stat`` for ``(name, added, deleted, binary sizes or None)`` entries.
+
+    Follows git's layout for non-terminal output: an 80 column budget, a
+    graph scaled down to fit it and long names shortened from the left.
+    """
+    max_len = max((len(name) for name, *_ in entries), default=0)
+    max_change = max((added + deleted for _, added, deleted, sizes in entries if sizes is None), default=0)
+    number_width = 3 if any(sizes is not None for *_, sizes in entries) else 0
+    bin_width = max((14 + len(str(sizes[0])) + len(str(sizes[1])) for *_, sizes in entries if sizes is not None),
+                    default=0)
+    number_width = max(len(str(max_change)), number_width)
+    width = max(width, 16 + 6 + number_width)
+
+    graph_width = max_change if max_change + 4 > bin_width else bin_width - 4
+    name_width = max_len
+    if name_width + number_width + 6 + graph_width > width:
+        if graph_width > width * 3 // 8 - number_width - 6:
+            graph_width = max(width * 3 // 8 - number_width - 6, 6)
+        if name_width > width - number_width - 6 - graph_width:
+            name_width = width - number_width - 6 - graph_width
+        else:
+            graph_width = width - number_width - 6 - name_width
+
+    lines = []
+    insertions = deletions = 0
+    for name, added, deleted, sizes in entries:
+        prefix = ''
+        if len(name) > name_width:
+            prefix = '...'
+            name = name[len(name) - max(name_width - 3, 0):]
+            slash = name.find('/')
+            if slash != -1:
+                name = name[slash:]
+        label = f" {prefix}{name}".ljust(name_width + 1) + ' |'
+        if sizes is not None:
+            old_size, new_size = sizes
+            lines.append(f"{label} {'Bin':>{number_width}}" + (f" {old_size} -> {new_size} bytes" if sizes != (0, 0) else ''))
+            continue
+        insertions += added
+        deletions += deleted
+        total = added + deleted
+        if graph_width <= max_change:
+            scaled = _scale(total, graph_width, max_change)
+            if scaled < 2 and added and deleted:
+                scaled = 2
+            if added < deleted:
+                added = _scale(added, graph_width, max_change)
+                deleted = scaled - added
+            else:
+                deleted = _scale(deleted, graph_width, max_change)
+                added = scaled - deleted
+        lines.append(f"{label} {total:>{number_width}}{' ' if total else ''}{'+' * added}{'-' * deleted}")
+
+    files = len(entries)
+    summary = f" {files} file{'s' if files != 1 else ''} changed"
+    if insertions or not deletions:
+        summary += f", {insertions} insertion{'s' if insertions != 1 else ''}(+)"
+    if deletions or not insertions:
+        summary += f", {deletions} deletion{'s' if deletions != 1 else ''}(-)"
+    lines.append(summary)
+    return lines
+
+
+def _clean_message(message):
+    """Tidy ``message`` like ``git commit -m`` does (``--cleanup=whitespace``)."""
+    lines = [line.rstrip() for line in message.splitlines()]
+    cleaned = []
+    for line in lines:
+        if line or (cleaned and cleaned[-1]):
+            cleaned.append(line)
+    while cleaned and not cleaned[-1]:
+        cleaned.pop()
+    return '\n'.join(cleaned) + '\n' if cleaned else ''
+
+
+def _header_names(delta):
+    """The ``a/``-``b/`` names of ``delta``'s two sides in a patch header, ``/dev/null`` for a missing one."""
+    status = delta.status_char()
+    old = '/dev/null' if status == 'A' else _prefixed('a/', _quote_path(delta.old_file.path))
+    new = '/dev/null' if status == 'D' else _prefixed('b/', _quote_path(delta.new_file.path))
+    return old, new
+
+
+def _patch_lines(file_patch):
+    """A file's patch text as the lines ``git diff`` would print.
+
+    libgit2 differs in a few details: it applies ``diff.mnemonicPrefix`` and
+    ``diff.noprefix``, which ``_diff_command`` overrides for git; git follows
+    names containing spaces with a tab on the ``---``/``+++`` lines, prints
+    no such lines for empty files and no "Binary files differ" for unchanged
+    binaries. Line breaks are translated like the subprocess backend's text
+    mode does.
+    """
+    delta = file_patch.delta
+    text = (file_patch.text or '').replace('\r\n', '\n').replace('\r', '\n')
+    lines = text.rstrip('\n').split('\n')
+    old, new = _header_names(delta)
+    for i, line in enumerate(lines):
+        if line.startswith('@@'):
+            break
+        if line.startswith('diff --git '):
+            lines[i] = f"diff --git {_prefixed('a/', _quote_path(delta.old_file.path))} " \
+                       f"{_prefixed('b/', _quote_path(delta.new_file.path))}"
+        elif line.startswith('--- '):
+            lines[i] = f"--- {old}"
+        elif line.startswith('+++ '):
+            lines[i] = f"+++ {new}"
+        elif line.startswith('Binary files ') and line.endswith(' differ'):
+            lines[i] = f"Binary files {old} and {new} differ"
+    if not file_patch.hunks:
+        unchanged = delta.old_file.id == delta.new_file.id
+        return [line for line in lines
+                if not line.startswith(('--- ', '+++ ')) and not (unchanged and line.startswith('Binary files '))]
+    for i, line in enumerate(lines):
+        if line.startswith('@@'):
+            break
+        if line.startswith(('--- a/', '--- "a/')) and ' ' in delta.old_file.path:
+            lines[i] += '\t'
+        elif line.startswith(('+++ b/', '+++ "b/')) and ' ' in delta.new_file.path:
+            lines[i] += '\t'
+    return lines
+
+
+class Pygit2Backend(SubprocessBackend):
+    """Reads and writes the repository in-process through libgit2."""
+
+    name = 'pygit2'
+    # One libgit2 repository handle is not shared between threads
+    concurrent = False
+
+    def __init__(self, repository, cwd=None):
+        super().__init__(cwd)
+        self.repository = repository
+        import pygit2
+        self._pygit2 = pygit2
+
+    @classmethod
+    def open(cls, cwd=None):
+        """Open the repository containing ``cwd``; None if pygit2 or the repository is unavailable."""
+        if any(os.environ.get(name) for name in GIT_LOCATION_ENV):
+            return None
+        try:
+            with phase('import pygit2'):
+                import pygit2
+                import pygit2.enums  # noqa: F401  (pygit2 1.14+)
+        except ImportError:
+            return None
+        try:
+            with phase('open repository'):
+                path = pygit2.discover_repository(cwd or os.getcwd())
+                if path is None:
+                    return None
+                repository = pygit2.Repository(path)
+        except (pygit2.GitError, OSError):
+            return None
+        if repository.is_bare:
+            return None
+        return cls(repository, cwd)
+
+    def _index(self):
+        index = self.repository.index
+        # Another process (git add, a hook) may have changed it since it was loaded
+        index.read(False)
+        return index
+
+    def _head_commit(self):
+        if self.repository.head_is_unborn:
+            return None
+        return self.repository.head.peel(self._pygit2.Commit)
+
+    def write_tree(self):
+        try:
+            return str(self._index().write_tree())
+        except self._pygit2.GitError:
+            return None
+
+    def head(self):
+        try:
+            commit = self._head_commit()
+        except (self._pygit2.GitError, KeyError):
+            return super().head()
+        if commit is None:
+            return None, None
+        return str(commit.id), str(commit.tree_id)
+
+    def _tree(self, revision):
+        # libgit2 has no object for the empty tree git knows implicitly
+        if revision == EMPTY_TREE:
+            return None
+        return self.repository.revparse_single(revision).peel(self._pygit2.Tree)
+
+    def _diff_trees(self, old, new):
+        """Diff two trees, either of which may be None for the empty tree."""
+        if old is None and new is None:
+            raise ValueError('nothing to diff')
+        if old is None:
+            return new.diff_to_tree(swap=True)
+        return old.diff_to_tree(new) if new is not None else old.diff_to_tree()
+
+    def _diff(self, revisions):
+        from pygit2.enums import DiffFind
+
+        if revisions:
+            diff = self._diff_trees(*(self._tree(revision) for revision in revisions))
+        else:
+            commit = self._head_commit()
+            if commit is not None:
+                diff = self._index().diff_to_tree(commit.tree)
+            else:
+                # Nothing to compare the index with but the tree it would commit
+                diff = self._diff_trees(None, self.repository[self._index().write_tree()])
+        diff.find_similar(flags=DiffFind.FIND_RENAMES | DiffFind.FIND_COPIES)
+        return diff
+
+    def diff_lines(self, revisions=None, paths=None, patch=True, exclude=None, stream=False):
+        # Pathspecs and ranges are git's business; two revisions or the index are ours
+        if paths or (revisions and len(revisions) != 2):
+            return super().diff_lines(revisions, paths, patch, exclude, stream)
+        try:
+            diff = self._diff(revisions)
+        except (self._pygit2.GitError, KeyError, ValueError):
+            return super().diff_lines(revisions, paths, patch, exclude, stream)
+        if self._pairs_differently(diff):
+            return super().diff_lines(revisions, paths, patch, exclude, stream)
+        return self._lines(diff, patch, exclude)
+
+    def _pairs_differently(self, diff):
+        """Whether git could report the renames and copies of ``diff`` differently.
+
+        libgit2 scores similarity its own way (often a point above git) and
+        reports every copy of a deleted file as a rename. Only exact renames
+        of distinct files, with no added and deleted files left to pair up,
+        are sure to come out as git prints them.
+        """
+        sources = set()
+        added = deleted = False
+        for delta in diff.deltas:
+            status = delta.status_char()
+            if status == 'C':
+                return True
+            if status == 'R':
+                if delta.old_file.id != delta.new_file.id or delta.old_file.path in sources:
+                    return True
+                sources.add(delta.old_file.path)
+            added = added or status == 'A'
+            deleted = deleted or status == 'D'
+        return added and deleted
+
+    def _lines(self, diff, patch, exclude):
+        """The lines git would print for ``diff``, excluded files listed but not diffed."""
+        patches = list(diff)
+        if not patches:
+            return ['']
+
+        lines = []
+        stats = []
+        for file_patch in patches:
+            delta = file_patch.delta
+            old, new = delta.old_file, delta.new_file
+            status = delta.status_char()
+            if status in ('R', 'C'):
+                status += f"{delta.similarity:03d}"
+                lines.append(f":{old.mode:06o} {new.mode:06o} {old.id} {new.id} {status}\t"
+                             f"{_quote_path(old.path)}\t{_quote_path(new.path)}")
+                name = _rename_name(old.path, new.path)
+            else:
+                lines.append(f":{old.mode:06o} {new.mode:06o} {old.id} {new.id} {status}\t{_quote_path(new.path)}")
+                name = _quote_path(new.path)
+            if delta.is_binary:
+                sizes = (0, 0) if old.id == new.id else (old.size, new.size)
+                stats.append((name, 0, 0, sizes))
+            else:
+                _, added, deleted = file_patch.line_stats
+                stats.append((name, added, deleted, None))
+        lines.extend(_stat_lines(stats))
+        lines.append('')
+        if not patch:
+            return lines
+
+        for file_patch in patches:
+            if exclude is not None and self._excluded(file_patch.delta, exclude):
+                continue
+            lines.extend(_patch_lines(file_patch))
+        lines.append('')
+        return lines
+
+    def _excluded(self, delta, exclude):
+        path = delta.new_file.path
+        if exclude.matches(path):
+            return True
+        if exclude.max_bytes and max(delta.old_file.size, delta.new_file.size) > exclude.max_bytes:
+            return True
+        if exclude.attributes:
+            if self.repository.get_attr(path, 'linguist-generated') in (True, 'true'):
+                return True
+            if self.repository.get_attr(path, 'diff') is False:
+                return True
+        return False
+
+    def read_blobs(self, oids, max_bytes=None):
+        blobs = {}
+        for oid in oids:
+            try:
+                blob = self.repository.get(oid)
+            except (ValueError, self._pygit2.GitError):
+                continue
+            if blob is None or blob.type_str != 'blob':
+                continue
+            if max_bytes is None or blob.size <= max_bytes:
+                blobs[oid] = blob.data
+        return blobs
+
+    def _commit_needs_git(self):
+        """Why this commit must go through ``git commit``, or None if it can be written here."""
+        from pygit2.enums import RepositoryState
+
+        config = self.repository.config
+        if any(setting in config for setting in COMMIT_SETTINGS):
+            return 'commit settings'
+        if 'commit.gpgsign' in config and config.get_bool('commit.gpgsign'):
+            return 'signing'
+        if any(name.startswith(('GIT_AUTHOR_', 'GIT_COMMITTER_')) for name in os.environ):
+            return 'identity from the environment'
+        if self.repository.state() != RepositoryState.NONE:
+            return 'merge or rebase in progress'
+        hooks = os.path.join(self._common_dir(), 'hooks')
+        if any(os.access(os.path.join(hooks, hook), os.X_OK) for hook in COMMIT_HOOKS):
+            return 'commit hooks'
+        return None
+
+    def _common_dir(self):
+        # Linked worktrees keep their hooks in the main repository
+        path = self.repository.path
+        try:
+            with open(os.path.join(path, 'commondir'), encoding='utf-8') as f:
+                return os.path.join(path, f.read().strip())
+        except OSError:
+            return path
+
+    def commit(self, message):
+        """Commit the index in-process, or with ``git commit`` when ``_commit_needs_git`` gives a reason.
+
+        The in-process path skips what ``git commit`` does around the
+        commit itself: it neither refreshes the index nor runs ``git gc --auto``.
+        """
+        from pygit2.enums import DiffStatsFormat
+
+        cleaned = _clean_message(message)
+        try:
+            if not cleaned or self._commit_needs_git():
+                return super().commit(message)
+            parent = self._head_commit()
+            tree = self._index().write_tree()
+            if parent is not None and parent.tree_id == tree:
+                # Nothing to commit: let git say so in its own words
+                return super().commit(message)
+            signature = self.repository.default_signature
+        except (self._pygit2.GitError, KeyError):
+            return super().commit(message)
+
+        oid = self.repository.create_commit(
+            'HEAD', signature, signature, cleaned, tree, [parent.id] if parent is not None else []
+        )
+        stats = self._diff_trees(parent.tree if parent is not None else None, self.repository[tree]).stats
+        branch = 'detached HEAD' if self.repository.head_is_detached else self.repository.head.shorthand
+        root = ' (root-commit)' if parent is None else ''
+        subject = cleaned.split('\n', 1)[0]
+        summary = stats.format(DiffStatsFormat.SHORT | DiffStatsFormat.INCLUDE_SUMMARY, 80)
+        return True, f"[{branch}{root} {str(oid)[:7]}] {subject}\n{summary}"
+
+
+_preference = 'auto'
+# Bumped by select_backend so every thread drops the backends it opened before
+_generation = 0
+# Backends by repository, per thread: a libgit2 repository handle must not
+# be used from two threads (batch workers) at once
+_local = threading.local()
+
+
+def select_backend(name):
+    """Choose the backend used from now on: ``auto``, ``pygit2`` or ``subprocess``."""
+    global _preference, _generation
+    if name not in BACKENDS:
+        raise ValueError(f"unknown git backend {name!r}: use one of {', '.join(BACKENDS)}")
+    _preference = name
+    _generation += 1
+
+
+def get_backend(cwd=None):
+    """Return the backend for the repository at ``cwd`` (default: current directory).
+
+    ``pygit2`` and ``auto`` fall back to the subprocess backend when pygit2
+    is missing or cannot open the repository, and when ``GIT_DIR``,
+    ``GIT_WORK_TREE`` or ``GIT_INDEX_FILE`` is set. Each thread gets its
+    own backend.
+    """
+    if getattr(_local, 'generation', None) != _generation:
+        _local.generation = _generation
+        _local.backends = {}
+    backends = _local.backends
+    key = os.path.abspath(cwd or os.getcwd())
+    backend = backends.get(key)
+    if backend is None:
+        if _preference != 'subprocess':
+            backend = Pygit2Backend.open(cwd)
+        backend = backend or SubprocessBackend(cwd)
+        backends[key] = backend
+    return backend
@@ -1,96 +1,359 @@
 """Git operations utilities."""
 
+import os
+import re
 import subprocess
 import sys
+import threading
 
+from .config import DEFAULT_TOKEN_BUDGET
+from .diff_model import MAX_RETAINED_LINES, parse_diff
+from .git_backend import EMPTY_TREE, get_backend
+from .timings import count, phase
+
+
+# Diffs longer than this many lines are summarized instead of sent in full
+SUMMARY_THRESHOLD = 300
+
+CHARS_PER_TOKEN = 4
+
+IMPORT_KEYWORDS = ['import ', 'export ', 'from ', 'require(']
+DEFINITION_KEYWORDS = ['function ', 'class ', 'def ', 'const ', 'let ', 'var ', 'async ', 'interface ', 'type ']
+
+IMPORT_PATTERN = re.compile('|'.join(map(re.escape, IMPORT_KEYWORDS)))
+DEFINITION_PATTERN = re.compile('|'.join(map(re.escape, DEFINITION_KEYWORDS)))
+STRUCTURAL_PREFIXES = ('diff --git', '---', '+++')
+
+
+def get_staged_diff(stream=False, max_retained=MAX_RETAINED_LINES, revisions=None, cwd=None, paths=None,
+                    patch=True, exclude=None, on_files=None):
+    """Collect and parse the staged changes into a ``StagedDiff``.
+
+    Args:
+        stream: Read git's output incrementally instead of buffering the
+            whole diff, keeping memory bounded on huge changesets.
+        max_retained: Number of diff lines to keep in memory (see ``parse_diff``)
+        revisions: Diff these revisions instead of the index against HEAD
+        cwd: Repository to run in (default: current directory)
+        paths: Limit the diff to these paths
+        patch: Include the patch; without it only the files and stats are known
+        exclude: ``ExclusionRules``; matching files are listed but not diffed
+        on_files: Called with the changed files before the patch is parsed
+            (see ``parse_diff``)
+
+    Raises:
+        subprocess.CalledProcessError: If git fails
+    """
+    backend = get_backend(cwd)
+    with phase('git diff + parse'):
+        diff = parse_diff(backend.diff_lines(revisions, paths, patch, exclude, stream), max_retained, on_files)
+    count('diff_files', len(diff.files))
+    count('diff_lines', diff.total_lines)
+    return diff
+
+
+def estimate_tokens(text):
+    """Cheap local estimate of the number of model tokens in ``text``."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _line_tokens(line):
+    # The trailing newline is part of what gets sent
+    return len(line) // CHARS_PER_TOKEN + 1
+
+
+def _structural_lines(file):
+    """Lines that describe the shape of a file's diff: file and hunk headers."""
+    lines = [line for line in file.header if line.startswith(STRUCTURAL_PREFIXES)]
+    lines.extend(hunk.header for hunk in file.hunks)
+    return lines
 
-def get_staged_diff_summary():
-    """Gets a smart summary of staged changes including stats and meaningful content."""
-    try:
-        # Get file stats (which files changed and how much)
-        stat_result = subprocess.run(
-            ["git", "diff", "--staged", "--stat"],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=True
-        )
-        stats = stat_result.stdout
-
-        diff_result = subprocess.run(
-            ["git", "diff", "--staged"],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=True
-        )
-        full_diff = diff_result.stdout
-
-        name_status_result = subprocess.run(
-            ["git", "diff", "--staged", "--name-status"],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=True
-        )
-        name_status = name_status_result.stdout
-
-        summary = f"=== FILE CHANGES ===\n{name_status}\n\n=== STATS ===\n{stats}\n\n"
-        
-        lines = full_diff.split('\n')
-        total_lines = len(lines)
-        
-        if total_lines > 300:
-            important_lines = []
-            
-            for i, line in enumerate(lines):
-                if line.startswith('diff --git') or line.startswith('+++') or line.startswith('---') or line.startswith('@@'):
-                    important_lines.append(line)
-                    continue
-                
-                if any(keyword in line for keyword in ['import ', 'export ', 'from ', 'require(']):
-                    important_lines.append(line)
-                    continue
-                
-                if any(keyword in line for keyword in ['function ', 'class ', 'def ', 'const ', 'let ', 'var ', 'async ', 'interface ', 'type ']):
-                    important_lines.append(line)
-                    for j in range(i + 1, min(i + 3, total_lines)):
-                        if lines[j].strip():
-                            important_lines.append(lines[j])
-                    continue
-                
-                if (line.startswith('+') or line.startswith('-')) and not line.startswith('+++') and not line.startswith('---'):
-                    if len(important_lines) < 200 or i % 3 == 0:  # Sample every 3rd change if too many
-                        important_lines.append(line)
-            
-            summary += "=== KEY CHANGES (Summarized) ===\n"
-            summary += '\n'.join(important_lines[:250])  # Limit to 250 lines of important content
-            summary += f"\n\n[Note: Full diff has {total_lines} lines. Above shows key structural changes.]"
-        else:
-            summary += "=== FULL DIFF ===\n"
-            summary += full_diff
 
+def _content_candidates(file, symbols=None):
+    """Rank a file's hunk lines as ``(priority, hunk index, line index)`` tuples.
+
+    Definitions, imports and the two lines following a definition come first,
+    every other added or removed line after them. Context lines are skipped.
+    With the file's ``FileSymbols`` the definitions and imports are the ones
+    its parser found; otherwise they are recognized by keywords.
+    """
+    if symbols is not None:
+        return _symbol_candidates(file, symbols.key_lines)
+
+    candidates = []
+    for h, hunk in enumerate(file.hunks):
+        lines = hunk.lines
+        for i, line in enumerate(lines):
+            if IMPORT_PATTERN.search(line.content):
+                candidates.append((0, h, i))
+            elif DEFINITION_PATTERN.search(line.content):
+                candidates.append((0, h, i))
+                for j in range(i + 1, min(i + 3, len(lines))):
+                    if lines[j].content.strip():
+                        candidates.append((1, h, j))
+            elif line.is_change:
+                candidates.append((2, h, i))
+    candidates.sort()
+    return candidates
+
+
+def _symbol_candidates(file, key_lines):
+    """``_content_candidates`` for files whose definition and import lines are known by number."""
+    candidates = []
+    for h, hunk in enumerate(file.hunks):
+        old, new = hunk.old_start, hunk.new_start
+        for i, line in enumerate(hunk.lines):
+            if line.kind == '-':
+                candidates.append((key_lines.get(('-', old), 2), h, i))
+                old += 1
+            elif line.kind == '+':
+                candidates.append((key_lines.get(('+', new), 2), h, i))
+                new += 1
+            elif line.kind == ' ':
+                old += 1
+                new += 1
+    candidates.sort()
+    return candidates
+
+
+def _render_file(file, budget, symbols=None):
+    """Render a file's structural lines plus as much content as ``budget`` allows.
+
+    Returns the rendered lines and the number of tokens left unused.
+    """
+    selected = set()
+    for _, h, i in _content_candidates(file, symbols):
+        if (h, i) in selected:
+            continue
+        cost = _line_tokens(str(file.hunks[h].lines[i]))
+        if cost <= budget:
+            selected.add((h, i))
+            budget -= cost
+
+    rendered = [line for line in file.header if line.startswith(STRUCTURAL_PREFIXES)]
+    for h, hunk in enumerate(file.hunks):
+        rendered.append(hunk.header)
+        rendered.extend(str(line) for i, line in enumerate(hunk.lines) if (h, i) in selected)
+    return rendered, budget
+
+
+def summarize_diff(diff, max_lines=SUMMARY_THRESHOLD, token_budget=DEFAULT_TOKEN_BUDGET, symbols=None):
+    """Render a parsed diff as the text summary sent to the model.
+
+    Diffs within both ``max_lines`` and ``token_budget`` are included in full.
+    Larger ones are summarized: file and hunk headers come first, and the
+    remaining budget is shared between files in proportion to their size,
+    spent on definitions and imports before ordinary changed lines.
+
+    ``symbols`` maps paths to the ``FileSymbols`` of their change (see
+    ``symbols.get_file_symbols``); they are listed before the diff, up to a
+    quarter of the budget.
+    """
+    summary = f"=== FILE CHANGES ===\n{diff.name_status}\n\n=== STATS ===\n{diff.stats}\n\n"
+    if diff.collapsed:
+        summary += "=== MECHANICAL CHANGES (not shown below) ===\n" + '\n'.join(diff.collapsed) + "\n\n"
+    # Files excluded from the patch (lockfiles, generated...) have no diff header
+    excluded = [file.path for file in diff.files if not file.header]
+    if excluded:
+        summary += "=== NOT DIFFED (generated, lockfiles, large files) ===\n" + '\n'.join(excluded) + "\n\n"
+    symbols = symbols or {}
+    if symbols:
+        from .symbols import render_symbols
+        listed = []
+        remaining = token_budget // 4
+        for line in render_symbols(symbols.get(file.path) for file in diff.files if file.path in symbols):
+            remaining -= _line_tokens(line)
+            if remaining < 0:
+                break
+            listed.append(line)
+        if listed:
+            summary += "=== CHANGED SYMBOLS ===\n" + '\n'.join(listed) + "\n\n"
+    full_tokens = sum(file.char_count for file in diff.files) // CHARS_PER_TOKEN
+
+    if (diff.total_lines <= max_lines and not diff.truncated
+            and estimate_tokens(summary) + full_tokens <= token_budget):
+        summary += "=== FULL DIFF ===\n"
+        summary += '\n'.join([*diff.patch_lines(), ''])
         return summary
 
+    count('summarized_diffs')
+    summary += "=== KEY CHANGES (Summarized) ===\n"
+    note = f"\n\n[Note: Full diff has {diff.total_lines} lines. Above shows key structural changes.]"
+    remaining = token_budget - estimate_tokens(summary) - estimate_tokens(note)
+
+    # Headers are prioritized: spend on them first, in file order
+    structure = []
+    for file in diff.files:
+        lines = _structural_lines(file)
+        cost = sum(_line_tokens(line) for line in lines)
+        if cost > remaining:
+            break
+        remaining -= cost
+        structure.append(file)
+
+    # Share what is left in proportion to each file's size, handing whatever
+    # a file does not use on to the files after it
+    needs = [max(file.char_count // CHARS_PER_TOKEN, 1) for file in structure]
+    remaining_need = sum(needs)
+    rendered = []
+    for file, need in zip(structure, needs):
+        share = remaining if remaining_need <= remaining else remaining * need // remaining_need
+        lines, unused = _render_file(file, share, symbols.get(file.path))
+        rendered.extend(lines)
+        remaining -= share - unused
+        remaining_need -= need
+
+    summary += '\n'.join(rendered)
+    summary += note
+    return summary
+
+
+class _SymbolPrefetch:
+    """``parse_diff`` callback that starts loading symbol tables on a background thread.
+
+    The raw records come first in git's output, so the blobs are read and
+    parsed while git is still producing the patch and the parser consumes it.
+    """
+
+    def __init__(self, cwd):
+        self.cwd = cwd
+        self.thread = None
+        self.result = None
+        self.error = None
+
+    def __call__(self, files):
+        self.thread = threading.Thread(target=self._load, args=(files,), name='symbols', daemon=True)
+        self.thread.start()
+
+    def _load(self, files):
+        from .symbols import load_symbol_tables
+        try:
+            self.result = load_symbol_tables(files, self.cwd)
+        except BaseException as e:
+            self.error = e
+
+    def tables(self):
+        """The loaded tables, once ready (None if the records never arrived)."""
+        if self.thread is None:
+            return None
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def get_staged_changes(stream=False, token_budget=DEFAULT_TOKEN_BUDGET, revisions=None, cwd=None, exclude=None,
+                       symbols=False, normalize=False, pipeline=False):
+    """Collect the staged changes and analyse them, ready for ``summarize_diff``.
+
+    Args:
+        stream: Read git's output incrementally instead of buffering the
+            whole diff. Produces the same summary with bounded memory.
+        token_budget: Approximate number of tokens the summary may use
+        revisions: Diff these revisions instead
+        cwd: Repository to run in (default: current directory)
+        exclude: ``ExclusionRules`` for files that are listed but not diffed
+        symbols: Find the functions, classes... the change adds, removes and
+            modifies (see ``symbols.py``)
+        normalize: Collapse moves, mass renames, repeated edits and
+            whitespace-only hunks into one line each (see ``normalize.py``)
+        pipeline: Load the symbol tables while the patch is still being read
+            and parsed, when the git backend allows concurrent calls
+
+    Returns:
+        ``(StagedDiff, {path: FileSymbols} or None)``, or None if git fails
+    """
+    prefetch = _SymbolPrefetch(cwd) if symbols and pipeline and get_backend(cwd).concurrent else None
+    try:
+        diff = get_staged_diff(stream=stream, max_retained=max(MAX_RETAINED_LINES, token_budget),
+                               revisions=revisions, cwd=cwd, exclude=exclude, on_files=prefetch)
+        if normalize:
+            from .normalize import normalize_diff
+            with phase('normalize'):
+                diff = normalize_diff(diff)
+        file_symbols = None
+        if symbols:
+            from .symbols import get_file_symbols
+            tables = None
+            if prefetch:
+                with phase('wait for symbols'):
+                    tables = prefetch.tables()
+            file_symbols = get_file_symbols(diff.files, cwd, tables=tables)
+        return diff, file_symbols
     except subprocess.CalledProcessError as e:
         print(f"Error running git command: {e.stderr}", file=sys.stderr)
         return None
 
 
-def commit_with_message(message):
-  
-    try:
-        result = subprocess.run(
-            ["git", "commit", "-m", message],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=True
-        )
-        return True, result.stdout
-    except subprocess.CalledProcessError as e:
-        return False, e.stderr
+def get_staged_diff_summary(stream=False, max_lines=SUMMARY_THRESHOLD, token_budget=DEFAULT_TOKEN_BUDGET,
+                            revisions=None, cwd=None, exclude=None, symbols=False, normalize=False):
+    """Gets a smart summary of staged changes including stats and meaningful content.
+
+    Takes the arguments of ``get_staged_changes``, plus ``max_lines``: diffs
+    with more lines than this are summarized. Returns None if git fails.
+    """
+    changes = get_staged_changes(stream, token_budget, revisions, cwd, exclude, symbols, normalize)
+    if changes is None:
+        return None
+    diff, file_symbols = changes
+    with phase('summarize'):
+        summary = summarize_diff(diff, max_lines, token_budget, file_symbols)
+    count('summary_tokens', estimate_tokens(summary))
+    return summary
+
+
+def get_staged_tree(cwd=None):
+    """Return the tree OID of the index (``git write-tree``), or None if unavailable.
+
+    Writing the tree fails while there are unresolved merge conflicts.
+    """
+    backend = get_backend(cwd)
+    with phase('git write-tree'):
+        return backend.write_tree()
+
+
+def get_head(cwd=None):
+    """Return ``(commit OID, tree OID)`` of HEAD, or ``(None, None)`` on an unborn branch."""
+    backend = get_backend(cwd)
+    with phase('git rev-parse HEAD'):
+        return backend.head()
+
+
+def get_hooks_dir(cwd=None):
+    """Return the absolute path of the repository's hooks directory (honours ``core.hooksPath``)."""
+    result = subprocess.run(
+        ["git", "rev-parse", "--git-path", "hooks"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return os.path.abspath(os.path.join(cwd or os.getcwd(), result.stdout.strip()))
+
+
+def list_commits(revision_range, cwd=None):
+    """List ``(commit, parent)`` pairs in ``revision_range``, oldest first.
+
+    The parent of a root commit is the empty tree. Merge commits are
+    compared against their first parent.
+    """
+    result = subprocess.run(
+        ["git", "rev-list", "--reverse", "--parents", revision_range],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    commits = []
+    for line in result.stdout.splitlines():
+        oids = line.split()
+        commits.append((oids[0], oids[1] if len(oids) > 1 else EMPTY_TREE))
+    return commits
+
+
+def commit_with_message(message, cwd=None):
+    """Commit the staged changes; returns ``(success, git's output or error)``."""
+    backend = get_backend(cwd)
+    with phase('git commit'):
+        return backend.commit(message)
+
@@ -0,0 +1,221 @@
+"""Local, deterministic commit messages inferred from the staged diff.
+
+No model is involved: the conventional-commit type comes from what the
+changed paths are (tests, docs, CI, build files...), the name-status
+letters and the mechanical changes found by ``normalize``; the scope from
+the directory or module the files share; the description from the
+symbols added, removed or modified. Instant and offline, it backs
+``--offline``, stands in when the model fails, and can answer on its own
+for trivial changes such as a docs-only edit.
+"""
+
+import fnmatch
+import posixpath
+
+
+MAX_LENGTH = 72
+
+# Symbol names listed in a description before "and N more"
+MAX_NAMES = 2
+
+# Path categories, checked in order; patterns match like .gitignore globs
+CATEGORIES = [
+    ('ci', ['.github/workflows/*', '.gitlab-ci.yml', '.circleci/*', '.travis.yml', 'Jenkinsfile',
+            'azure-pipelines.yml', '.pre-commit-config.yaml', 'tox.ini', 'noxfile.py']),
+    ('test', ['test/*', 'tests/*', '__tests__/*', 'spec/*', 'test_*.py', '*_test.py', '*_test.go',
+              '*.test.js', '*.test.ts', '*.test.tsx', '*.spec.js', '*.spec.ts', '*.spec.tsx', 'conftest.py']),
+    ('docs', ['docs/*', 'doc/*', '*.md', '*.rst', '*.adoc', 'LICENSE*', 'AUTHORS*', 'CHANGELOG*', 'NOTICE*']),
+    ('build', ['setup.py', 'setup.cfg', 'pyproject.toml', 'MANIFEST.in', 'requirements*.txt', 'Pipfile',
+               'package.json', 'go.mod', 'Cargo.toml', 'Gemfile', 'Makefile', 'CMakeLists.txt', 'Dockerfile',
+               'docker-compose*.yml', '*.lock', 'package-lock.json', 'go.sum', 'pnpm-lock.yaml']),
+    ('chore', ['.gitignore', '.gitattributes', '.editorconfig', '.dockerignore', '*.example']),
+]
+
+# Changes touching nothing but files of one of these categories can skip the model
+TRIVIAL_CATEGORIES = {'docs', 'ci', 'chore'}
+
+# Directory names too generic to be a scope
+GENERIC_DIRECTORIES = {'', '.', 'src', 'lib', 'app', 'pkg', 'internal', 'source', 'tests', 'test', 'docs', 'doc'}
+
+# File stems that say less than their directory
+GENERIC_STEMS = {'__init__', 'index', 'main', 'mod', 'readme', 'conftest'}
+
+STATUS_VERBS = {'A': 'add', 'D': 'remove', 'R': 'rename', 'C': 'copy', 'M': 'update', 'T': 'update'}
+
+
+def _unquote(path):
+    return path[1:-1] if path.startswith('"') else path
+
+
+def category_of(path):
+    """Return what kind of file ``path`` is ('test', 'docs', 'ci', 'build', 'chore'), or None for code."""
+    path = _unquote(path)
+    name = posixpath.basename(path)
+    for category, patterns in CATEGORIES:
+        for pattern in patterns:
+            if '/' in pattern:
+                if fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(path, f"*/{pattern}"):
+                    return category
+            elif fnmatch.fnmatch(name, pattern):
+                return category
+    return None
+
+
+def _stem(path):
+    stem = posixpath.splitext(posixpath.basename(_unquote(path)))[0]
+    for affix in ('test_', '_test', '.test', '.spec'):
+        stem = stem[len(affix):] if stem.startswith(affix) else stem
+        stem = stem[:-len(affix)] if stem.endswith(affix) else stem
+    return stem
+
+
+def infer_scope(paths):
+    """Return the module or directory the ``paths`` share, or None."""
+    paths = [_unquote(path) for path in paths]
+    if not paths:
+        return None
+    if len(paths) == 1:
+        stem = _stem(paths[0])
+        if stem.lower() not in GENERIC_STEMS and not stem.startswith('.'):
+            return stem
+    common = posixpath.commonpath(paths) if len(paths) > 1 else posixpath.dirname(paths[0])
+    # A common path that is itself one of the files is its directory
+    if common in paths:
+        common = posixpath.dirname(common)
+    for part in reversed(common.split('/')):
+        if part.lower() not in GENERIC_DIRECTORIES:
+            return part
+    return None
+
+
+def _describe(name, kind):
+    return f"{name}()" if kind in ('function', 'method') else name
+
+
+def _list(items, limit=MAX_NAMES):
+    items = list(dict.fromkeys(items))
+    if len(items) > limit:
+        return f"{', '.join(items[:limit])} and {len(items) - limit} more"
+    if len(items) > 1:
+        return f"{', '.join(items[:-1])} and {items[-1]}"
+    return items[0] if items else ''
+
+
+def _file_name(path):
+    return posixpath.basename(_unquote(path))
+
+
+def _symbol_description(file_symbols):
+    added, removed, modified = [], [], []
+    for symbols in file_symbols:
+        added.extend(_describe(name, kind) for name, kind in symbols.added)
+        removed.extend(_describe(name, kind) for name, kind in symbols.removed)
+        modified.extend(_describe(name, kind) for name, kind in symbols.modified)
+    if added and not removed:
+        return 'feat', f"add {_list(added)}"
+    if removed and not added:
+        return 'refactor', f"remove {_list(removed)}"
+    if added and removed:
+        return 'refactor', f"replace {_list(removed)} with {_list(added)}"
+    if modified:
+        return None, f"update {_list(modified)}"
+    return None, None
+
+
+def _file_description(files, statuses):
+    if len(files) == 1:
+        file = files[0]
+        verb = STATUS_VERBS.get(file.status[:1], 'update')
+        if file.status[:1] in ('R', 'C'):
+            old, new = _file_name(file.old_path), _file_name(file.path)
+            if old == new:
+                verb, old, new = ('move' if verb == 'rename' else verb), _unquote(file.old_path), _unquote(file.path)
+            return f"{verb} {old} to {new}"
+        return f"{verb} {_file_name(file.path)}"
+    if len(statuses) == 1:
+        verb = STATUS_VERBS.get(next(iter(statuses)), 'update')
+        return f"{verb} {_list([_file_name(file.path) for file in files])}"
+    return f"update {_list([_file_name(file.path) for file in files])}"
+
+
+def _mechanical_description(line):
+    """Turn a ``normalize`` line such as ``renamed `a` -> `b` in 3 files`` into ``rename a to b``."""
+    kind = line.split(' ', 1)[0]
+    if kind == 'whitespace-only':
+        return 'reformat code'
+    if kind == 'moved':
+        _, _, directories = line.partition(' from ')
+        return f"move {directories.replace('`', '')}"
+    if kind == 'renamed':
+        renames = line[len('renamed '):].split(' in ', 1)[0]
+        return f"rename {renames.replace('`', '').replace(' -> ', ' to ')}"
+    # "same edit in 12 files (14 hunks): `-old` `+new`"
+    where = line.split(' in ', 1)[-1].split(':', 1)[0].split(' (', 1)[0]
+    return f"apply the same edit in {where}"
+
+
+def _fit(prefix, description):
+    """Shorten ``description`` so ``prefix + description`` fits ``MAX_LENGTH``."""
+    message = f"{prefix}{description}"
+    if len(message) <= MAX_LENGTH:
+        return message
+    return message[:MAX_LENGTH - 3].rstrip(' ,') + '...'
+
+
+def heuristic_message(diff, file_symbols=None):
+    """Infer a conventional commit message for ``diff`` without a model.
+
+    Args:
+        diff: ``StagedDiff``, preferably normalized (see ``normalize_diff``)
+        file_symbols: ``{path: FileSymbols}`` from ``symbols.get_file_symbols``
+
+    Returns:
+        ``(message, trivial)``; ``trivial`` means the change is simple enough
+        (docs, CI or config files only, whitespace or moves only) for the
+        message to be as good as a model's. The message is None when nothing
+        is staged.
+    """
+    collapsed = list(diff.collapsed)
+    files = list(diff.files)
+    if not files and not collapsed:
+        return None, False
+
+    paths = [file.path for file in files]
+    categories = {category_of(path) for path in paths}
+    statuses = {file.status[:1] for file in files}
+
+    # Only mechanical changes were staged
+    if not files:
+        kinds = {line.split(' ', 1)[0] for line in collapsed}
+        commit_type = 'style' if kinds == {'whitespace-only'} else 'refactor'
+        trivial = kinds <= {'whitespace-only', 'moved', 'renamed'}
+        return _fit(f"{commit_type}: ", _mechanical_description(collapsed[0])), trivial
+
+    scope = infer_scope(paths)
+    category = next(iter(categories)) if len(categories) == 1 else None
+    # Pure renames have no hunks: nothing in them for a model to read
+    moves_only = all(file.status[:1] == 'R' and not file.hunks for file in files)
+    trivial = (category in TRIVIAL_CATEGORIES or moves_only) and not collapsed
+
+    symbol_type, description = _symbol_description(
+        file_symbols[path] for path in paths if file_symbols and path in file_symbols
+    )
+    if category is not None:
+        commit_type = category
+    elif symbol_type:
+        commit_type = symbol_type
+    elif statuses == {'A'}:
+        commit_type = 'feat'
+    elif statuses <= {'D', 'R'}:
+        commit_type = 'refactor'
+    else:
+        commit_type = 'chore'
+
+    if category == 'docs' and len(files) == 1 and files[0].status[:1] == 'M':
+        description = f"update {_file_name(files[0].path)}"
+        scope = None
+    elif not description or (category is not None and category != 'test') or moves_only:
+        description = _file_description(files, statuses)
+
+    prefix = f"{commit_type}({scope}): " if scope and scope not in description else f"{commit_type}: "
+    return _fit(prefix, description), trivial
@@ -0,0 +1,297 @@
+"""Git hook integration: messages precomputed while staging, read at commit time.
+
+``git-suggest hook install`` adds two hooks to the current repository:
+
+* ``post-index-change`` runs whenever the index is written (``git add``,
+  ``git rm``...) and starts a detached worker that generates the message
+  for the new staged tree and stores it in the response cache.
+* ``prepare-commit-msg`` looks the staged tree up in the cache and fills in
+  the message, waiting up to ``hook_timeout`` seconds for a worker that is
+  still running. It never fails the commit.
+"""
+
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from .cache import ResponseCache, get_cache_dir, message_key
+from .config import Config
+from .exclude import ExclusionRules
+from .git_backend import select_backend
+from .git_utils import get_head, get_hooks_dir, get_staged_diff_summary, get_staged_tree
+
+
+HOOK_MARKER = '# Installed by git-suggest'
+
+# Hook name -> ``git-suggest hook`` action it runs
+HOOKS = {
+    'post-index-change': 'index-changed',
+    'prepare-commit-msg': 'prepare-commit-msg',
+}
+
+# Set in workers so the index writes they trigger do not start more workers
+WORKER_ENV = 'GIT_SUGGEST_WORKER'
+
+# A worker older than this is assumed dead
+PENDING_MAX_AGE = 5 * 60
+
+POLL_INTERVAL = 0.05
+
+
+def hook_script(action):
+    """Return the shell script for a hook running ``git-suggest hook <action>``."""
+    return (
+        "#!/bin/sh\n"
+        f"{HOOK_MARKER}\n"
+        f"exec {shlex.quote(sys.executable)} -m git_suggest hook {action} \"$@\"\n"
+    )
+
+
+def install(force=False, cwd=None):
+    """Install the hooks into the repository at ``cwd``; return False if one is in the way."""
+    hooks_dir = get_hooks_dir(cwd)
+    paths = {name: os.path.join(hooks_dir, name) for name in HOOKS}
+
+    for name, path in paths.items():
+        if os.path.exists(path) and not force:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                if HOOK_MARKER not in f.read():
+                    print(f"Error: {path} already exists. Use --force to replace it.", file=sys.stderr)
+                    return False
+
+    os.makedirs(hooks_dir, exist_ok=True)
+    for name, path in paths.items():
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(hook_script(HOOKS[name]))
+        os.chmod(path, 0o755)
+        print(f"✓ Installed {path}")
+    return True
+
+
+def uninstall(cwd=None):
+    """Remove the hooks installed by git-suggest, leaving any others alone."""
+    hooks_dir = get_hooks_dir(cwd)
+    for name in HOOKS:
+        path = os.path.join(hooks_dir, name)
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                ours = HOOK_MARKER in f.read()
+        except OSError:
+            continue
+        if ours:
+            os.unlink(path)
+            print(f"✓ Removed {path}")
+
+
+def _pending_path(key):
+    return get_cache_dir() / 'pending' / f"{key}.pid"
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _is_pending(key):
+    """Whether a live worker is generating the message for ``key``."""
+    path = _pending_path(key)
+    try:
+        age = time.time() - path.stat().st_mtime
+        pid = int(path.read_text().strip() or 0)
+    except (OSError, ValueError):
+        return False
+    if age > PENDING_MAX_AGE:
+        return False
+    if os.name == 'posix':
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+    return True
+
+
+def _claim(key):
+    """Mark ``key`` as being generated by this process; False if another worker has it."""
+    path = _pending_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            if _is_pending(key):
+                return False
+            _unlink(path)
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+
+def spawn_worker(cwd=None):
+    """Start a detached ``git-suggest hook precompute`` and return without waiting."""
+    env = dict(os.environ, **{WORKER_ENV: '1'})
+    options = {}
+    if os.name == 'nt':
+        options['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options['start_new_session'] = True
+    subprocess.Popen(
+        [sys.executable, '-m', 'git_suggest', 'hook', 'precompute'],
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **options
+    )
+
+
+def _staged_key(config):
+    """Return the cache key for the staged tree, or None if nothing is staged."""
+    tree = get_staged_tree()
+    head, head_tree = get_head()
+    if not tree or tree == head_tree:
+        return None
+    return message_key(config, tree, head)
+
+
+def index_changed(config):
+    """``post-index-change``: start a worker unless the message is cached or on its way."""
+    if os.environ.get(WORKER_ENV):
+        return
+    key = _staged_key(config)
+    if key is None or _is_pending(key) or ResponseCache.from_config(config).get(key):
+        return
+    spawn_worker()
+
+
+def precompute(config):
+    """Generate and cache the message for the staged tree (the worker started by the hooks)."""
+    key = _staged_key(config)
+    if key is None:
+        return
+    cache = ResponseCache.from_config(config)
+    if cache.get(key) or not _claim(key):
+        return
+
+    client = None
+    try:
+        summary = get_staged_diff_summary(
+            stream=config.get('stream_diff', True),
+            max_lines=config.get('max_diff_lines', 300),
+            token_budget=config.get_token_budget(),
+            exclude=ExclusionRules.from_config(config),
+            symbols=config.get('symbols', True),
+            normalize=config.get('normalize', True),
+        )
+        if not summary or not summary.strip():
+            return
+
+        if config.get('daemon', True):
+            from .daemon import DaemonClient
+            client = DaemonClient.connect(config)
+        if client is None:
+            from .ai_client import create_client
+            client = create_client(config, config.get_api_key())
+
+        message = client.generate_commit_message(summary)
+        if message:
+            cache.set(key, message)
+    finally:
+        if client is not None:
+            client.close()
+        _unlink(_pending_path(key))
+
+
+def prepare_commit_msg(config, message_file, source=None):
+    """``prepare-commit-msg``: put the precomputed message at the top of ``message_file``.
+
+    Args:
+        config: Configuration
+        message_file: File git opens in the editor
+        source: Where git's message came from; any source (``-m``, a template,
+            a merge, ``--amend``...) means the user already has one
+    """
+    if source:
+        return
+    key = _staged_key(config)
+    if key is None:
+        return
+
+    cache = ResponseCache.from_config(config)
+    message = cache.get(key)
+    if not message:
+        # Staged without the hook (e.g. ``commit -a``): start now and wait
+        if not _is_pending(key):
+            spawn_worker()
+        deadline = time.monotonic() + float(config.get('hook_timeout', 5))
+        while not message and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            message = cache.get(key)
+
+    if not message:
+        print("git-suggest: no message ready yet, write your own.", file=sys.stderr)
+        return
+
+    with open(message_file, 'r', encoding='utf-8') as f:
+        existing = f.read()
+    with open(message_file, 'w', encoding='utf-8') as f:
+        f.write(f"{message}\n{existing}")
+
+
+def main(argv=None):
+    """Entry point for ``git-suggest hook``."""
+    parser = argparse.ArgumentParser(
+        prog='git-suggest hook',
+        description='Precompute commit messages while staging and fill them in at commit time'
+    )
+    parser.add_argument(
+        '--config', '-c',
+        type=str,
+        help='Path to custom configuration file'
+    )
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    install_parser = actions.add_parser('install', help='Install the hooks in the current repository')
+    install_parser.add_argument('--force', action='store_true', help='Replace existing hooks')
+    actions.add_parser('uninstall', help='Remove the hooks installed by git-suggest')
+    actions.add_parser('precompute', help='Generate and cache the message for the staged tree')
+
+    changed_parser = actions.add_parser('index-changed', help=argparse.SUPPRESS)
+    changed_parser.add_argument('flags', nargs='*')
+    prepare_parser = actions.add_parser('prepare-commit-msg', help=argparse.SUPPRESS)
+    prepare_parser.add_argument('message_file')
+    prepare_parser.add_argument('source', nargs='?')
+    prepare_parser.add_argument('commit', nargs='?')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.action == 'install':
+            sys.exit(0 if install(force=args.force) else 1)
+        if args.action == 'uninstall':
+            uninstall()
+            return
+    except subprocess.CalledProcessError as e:
+        print(f"Error: not a git repository? {e.stderr.strip()}", file=sys.stderr)
+        sys.exit(1)
+
+    # Hooks must never get in the way of git itself
+    try:
+        config = Config(args.config)
+        select_backend(config.get('git_backend', 'auto'))
+        if args.action == 'index-changed':
+            index_changed(config)
+        elif args.action == 'prepare-commit-msg':
+            prepare_commit_msg(config, args.message_file, args.source)
+        else:
+            precompute(config)
+    except Exception as e:
+        print(f"git-suggest: {e}", file=sys.stderr)
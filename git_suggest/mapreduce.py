@@ -0,0 +1,217 @@
+"""Map-reduce summarization for changesets too large for a single prompt.
+
+The staged files are split into groups (one per directory, or per file),
+each group is summarized in one sentence by its own model call, with a
+bounded number in flight, and the final message is generated from those
+summaries plus the complete file list.
+
+Summaries are cached by the (old blob, new blob) OID pairs of their files,
+as listed by ``git diff --raw``. Staging a few more files therefore only
+re-summarizes the groups they belong to, and the patch is only read for
+those; with ``map_reduce_group: file`` every file is its own cached piece.
+"""
+
+import posixpath
+import subprocess
+import sys
+import time
+
+from .cache import ResponseCache, get_cache_dir, make_key
+from .diff_model import MAX_RETAINED_LINES, StagedDiff
+from .exclude import ExclusionRules
+from .git_utils import get_staged_diff, summarize_diff
+from .normalize import normalize_diff
+from .prompt import PROMPT_VERSION, build_group_prompt
+from .symbols import get_file_symbols
+
+
+DEFAULT_CONCURRENCY = 4
+
+# More groups than this are merged into their parent directories
+DEFAULT_MAX_GROUPS = 32
+
+# Tokens of diff sent with each group
+GROUP_TOKEN_BUDGET = 2000
+GROUP_MAX_LINES = 200
+
+GROUP_CACHE_MAX_ENTRIES = 5000
+
+ROOT_GROUP = '(root)'
+
+
+def _unquote(path):
+    return path[1:-1] if path.startswith('"') else path
+
+
+def group_files(files, by='directory', max_groups=DEFAULT_MAX_GROUPS):
+    """Split ``files`` into ``(name, files)`` groups, in first-seen order.
+
+    Args:
+        files: ``DiffFile`` objects
+        by: ``'file'`` for one group per file, ``'directory'`` for one per
+            directory. Either falls back to shallower directories until there
+            are at most ``max_groups`` groups.
+        max_groups: Upper bound on the number of groups (and model calls)
+    """
+    files = list(files)
+    if by == 'file' and len(files) <= max_groups:
+        groups = {}
+        for file in files:
+            groups.setdefault(_unquote(file.path), []).append(file)
+        return list(groups.items())
+
+    directories = [posixpath.dirname(_unquote(file.path)).split('/') for file in files]
+    depth = max((len(parts) for parts in directories), default=0)
+    while True:
+        groups = {}
+        for file, parts in zip(files, directories):
+            name = '/'.join(parts[:depth]) or ROOT_GROUP
+            groups.setdefault(name, []).append(file)
+        if len(groups) <= max_groups or depth == 0:
+            return list(groups.items())
+        depth -= 1
+
+
+def _group_diff(files, truncated):
+    return StagedDiff(
+        files=files,
+        name_status=''.join(f"{file.name_status}\n" for file in files),
+        total_lines=sum(len(file.header) + file.line_count for file in files),
+        truncated=truncated,
+    )
+
+
+class MapReduceSummarizer:
+    """Turns a large ``StagedDiff`` into a summary made of per-group model summaries."""
+
+    def __init__(self, client, model, by='directory', concurrency=DEFAULT_CONCURRENCY,
+                 max_groups=DEFAULT_MAX_GROUPS, cache=True, symbols=False):
+        """Initialize the summarizer.
+
+        Args:
+            client: Model client; anything with ``generate_many``
+            model: Model name, part of the group cache key
+            by: Grouping, ``'directory'`` or ``'file'``
+            concurrency: Group summaries requested at once
+            max_groups: Upper bound on the number of groups
+            cache: Reuse summaries of unchanged groups
+            symbols: List the symbols each group's files change
+        """
+        self.client = client
+        self.model = model
+        self.by = by
+        self.concurrency = concurrency
+        self.max_groups = max_groups
+        self.cache = ResponseCache(get_cache_dir() / 'groups', max_entries=GROUP_CACHE_MAX_ENTRIES) if cache else None
+        self.symbols = symbols
+        self.groups = 0
+        self.cache_hits = 0
+        self.files = 0
+        self.files_reused = 0
+        self.seconds = 0.0
+
+    def _key(self, name, files):
+        versions = [(file.status, file.old_path, file.path, file.old_oid, file.new_oid) for file in files]
+        return make_key('summary', self.model, PROMPT_VERSION, self.symbols, name, *sorted(versions))
+
+    def summarize_groups(self, diff, load_patches=None):
+        """Return ``(name, files, summary)`` triples; the summary is None where the model failed.
+
+        Args:
+            diff: The staged changes; its files only need their raw records
+                when ``load_patches`` is given
+            load_patches: Called with the paths of the files whose group is
+                not cached; returns a ``StagedDiff`` with their patches
+        """
+        started = time.perf_counter()
+        groups = group_files(diff.files, self.by, self.max_groups)
+        keys = [self._key(name, files) for name, files in groups]
+        summaries = [self.cache.get(key) if self.cache else None for key in keys]
+        missing = [i for i, summary in enumerate(summaries) if not summary]
+
+        if missing:
+            patched = diff
+            if load_patches:
+                paths = {path for i in missing for file in groups[i][1] for path in (file.old_path, file.path)}
+                # Quoted paths would need unquoting to be pathspecs; read everything instead
+                patched = load_patches(None if any(path.startswith('"') for path in paths) else sorted(paths))
+            file_symbols = get_file_symbols(patched.files) if self.symbols else None
+            versions = {}
+            for file in patched.files:
+                versions.setdefault((file.old_path, file.path), []).append(file)
+
+            prompts = []
+            for i in missing:
+                name, files = groups[i]
+                files = [version for file in dict.fromkeys((f.old_path, f.path) for f in files)
+                         for version in versions.get(file, [])]
+                prompts.append(build_group_prompt(name, summarize_diff(
+                    _group_diff(files, patched.truncated), GROUP_MAX_LINES, GROUP_TOKEN_BUDGET, file_symbols
+                )))
+
+            answers = self.client.generate_many(prompts, self.concurrency)
+            for i, answer in zip(missing, answers):
+                summaries[i] = answer
+                if answer and self.cache:
+                    self.cache.set(keys[i], answer)
+
+        self.groups = len(groups)
+        self.cache_hits = len(groups) - len(missing)
+        self.files = len(diff.files)
+        self.files_reused = len(diff.files) - sum(len(groups[i][1]) for i in missing)
+        self.seconds = time.perf_counter() - started
+        return [(name, files, summary) for (name, files), summary in zip(groups, summaries)]
+
+    def summarize(self, diff, load_patches=None):
+        """Render the reduce-step summary: file list, stats and one line per group."""
+        lines = [
+            f"- {name}: {summary or f'{len(files)} file(s) changed'}"
+            for name, files, summary in self.summarize_groups(diff, load_patches)
+        ]
+
+        return (
+            f"=== FILE CHANGES ===\n{diff.name_status}\n\n"
+            f"=== STATS ===\n{diff.stats}\n\n"
+            f"=== CHANGES BY COMPONENT ({len(lines)} groups) ===\n" + '\n'.join(lines) + '\n'
+        )
+
+
+def get_map_reduce_summary(client, config, stream=False):
+    """Summarize the staged changes, map-reducing them if there are enough files.
+
+    Changesets with fewer than ``map_reduce_min_files`` files get the usual
+    single-prompt summary. Returns the summarizer used (None for those) and
+    the summary, which is None if git fails.
+    """
+    token_budget = config.get_token_budget()
+    max_groups = int(config.get('map_reduce_max_groups') or DEFAULT_MAX_GROUPS)
+
+    exclude = ExclusionRules.from_config(config)
+
+    def load_patches(paths=None):
+        return get_staged_diff(stream=stream, paths=paths, exclude=exclude,
+                               max_retained=max(MAX_RETAINED_LINES, GROUP_TOKEN_BUDGET // 4 * max_groups))
+
+    try:
+        # Raw records and stats only; patches are read for uncached groups alone
+        overview = get_staged_diff(patch=False)
+        if len(overview.files) < int(config.get('map_reduce_min_files') or 0):
+            diff = get_staged_diff(stream=stream, max_retained=max(MAX_RETAINED_LINES, token_budget), exclude=exclude)
+            if config.get('normalize', True):
+                diff = normalize_diff(diff)
+            file_symbols = get_file_symbols(diff.files) if config.get('symbols', True) else None
+            return None, summarize_diff(diff, config.get('max_diff_lines', 300), token_budget, file_symbols)
+
+        summarizer = MapReduceSummarizer(
+            client,
+            config.get('model', 'gemini-2.5-flash'),
+            by=config.get('map_reduce_group', 'directory'),
+            concurrency=int(config.get('map_reduce_concurrency') or DEFAULT_CONCURRENCY),
+            max_groups=max_groups,
+            cache=config.get('map_reduce_cache', True),
+            symbols=config.get('symbols', True),
+        )
+        return summarizer, summarizer.summarize(overview, load_patches)
+    except subprocess.CalledProcessError as e:
+        print(f"Error running git command: {e.stderr}", file=sys.stderr)
+        return None, None
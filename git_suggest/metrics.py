@@ -0,0 +1,39 @@
+"""Small statistics helpers shared by batch mode, the clients and reports."""
+
+import math
+
+
+def percentile(values, q):
+    """Return the ``q``-th percentile (0-100) of ``values`` by nearest rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class RequestStats:
+    """Attempt counts and latencies of the requests made by a client."""
+
+    # Latencies kept for the p95 estimate
+    WINDOW = 200
+
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.latencies = []
+        self.last_attempts = 0
+        self.last_seconds = 0.0
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+        del self.latencies[:-self.WINDOW]
+
+    def p95(self, min_samples=1):
+        """95th percentile of recent successful attempts, or None with fewer than ``min_samples``."""
+        if len(self.latencies) < max(1, min_samples):
+            return None
+        return percentile(self.latencies, 95)
@@ -0,0 +1,250 @@
+"""Collapse mechanical changes before a diff is summarized.
+
+Directory moves, codebase-wide renames of an identifier, the same edit
+pasted into many files and re-indentation carry little information per
+line but can fill the whole prompt. ``normalize_diff`` fingerprints every
+hunk, takes out the hunks and pure renames that repeat a pattern, and
+describes each pattern in one line, e.g.
+``renamed `foo` -> `bar` in 312 files (540 hunks)``.
+"""
+
+import re
+
+from .diff_model import DiffFile, StagedDiff
+from .git_backend import _rename_name
+
+
+# A pattern is collapsed once it repeats this many times
+MIN_REPEATS = 3
+
+# More distinct substitutions than this in one hunk is not a rename
+MAX_SUBSTITUTIONS = 3
+
+# Characters of an example line shown for a repeated edit
+EXAMPLE_CHARS = 80
+
+_TOKEN = re.compile(r'\w+|\S')
+_WHITESPACE = re.compile(r'\s+')
+_IDENTIFIER = re.compile(r'[A-Za-z_]\w*$')
+
+# Patterns in at most this many files name them
+MAX_NAMED_FILES = 3
+
+# Files whose indentation is syntax: re-indenting them is never whitespace-only
+INDENTED_EXTENSIONS = ('.py', '.pyi', '.pyx', '.yaml', '.yml', '.coffee', '.haml', '.pug', '.sass', '.styl', '.mk')
+INDENTED_NAMES = ('Makefile', 'GNUmakefile', 'makefile')
+
+_QUOTES = re.compile(r'[\'"`]')
+
+
+def _changed(hunk):
+    removed = [line.content for line in hunk.lines if line.kind == '-']
+    added = [line.content for line in hunk.lines if line.kind == '+']
+    return removed, added
+
+
+def _substitutions(removed, added):
+    """Identifier replacements turning ``removed`` into ``added`` line by line, or None."""
+    if len(removed) != len(added):
+        return None
+    substitutions = set()
+    for old, new in zip(removed, added):
+        old_tokens = _TOKEN.findall(old)
+        new_tokens = _TOKEN.findall(new)
+        if len(old_tokens) != len(new_tokens):
+            return None
+        for old_token, new_token in zip(old_tokens, new_tokens):
+            if old_token != new_token:
+                if not (_IDENTIFIER.match(old_token) and _IDENTIFIER.match(new_token)):
+                    return None
+                substitutions.add((old_token, new_token))
+                if len(substitutions) > MAX_SUBSTITUTIONS:
+                    return None
+    return tuple(sorted(substitutions)) or None
+
+
+def _indentation_matters(path):
+    name = _unquote(path or '').rsplit('/', 1)[-1]
+    return name in INDENTED_NAMES or name.endswith(INDENTED_EXTENSIONS)
+
+
+def _whitespace_only(removed, added, keep_indentation):
+    """Whether each removed line becomes the added line at its position by whitespace alone.
+
+    Leading and trailing whitespace may change (unless ``keep_indentation``);
+    spacing inside a line only on lines without quotes, whose string
+    literals it could change.
+    """
+    if len(removed) != len(added):
+        return False
+    for old, new in zip(removed, added):
+        if old == new:
+            continue
+        if keep_indentation and old[:len(old) - len(old.lstrip())] != new[:len(new) - len(new.lstrip())]:
+            return False
+        if old.strip() == new.strip():
+            continue
+        if _QUOTES.search(old) or _QUOTES.search(new) or _TOKEN.findall(old) != _TOKEN.findall(new):
+            return False
+    return True
+
+
+def fingerprint(hunk, path=None):
+    """Return the edit pattern of ``hunk`` as a hashable tuple, or None if it cannot be told.
+
+    * ``('whitespace',)``: the hunk only changes whitespace, line by line
+      (indentation counts as code in the files of ``INDENTED_EXTENSIONS``)
+    * ``('rename', ((old, new), ...))``: it only replaces identifiers
+    * ``('edit', removed, added)``: anything else, by its stripped lines
+    """
+    if hunk.truncated or not (hunk.added or hunk.removed):
+        return None
+    removed, added = _changed(hunk)
+    if _whitespace_only(removed, added, _indentation_matters(path)):
+        return ('whitespace',)
+    substitutions = _substitutions(removed, added)
+    if substitutions:
+        return ('rename', substitutions)
+    return ('edit', tuple(line.strip() for line in removed), tuple(line.strip() for line in added))
+
+
+def _unquote(path):
+    return path[1:-1] if path.startswith('"') else path
+
+
+def _move(file):
+    """The ``(old directory, new directory)`` of a file renamed without edits, or None."""
+    if not file.status.startswith('R') or file.hunks or file.binary:
+        return None
+    old, new = _unquote(file.old_path), _unquote(file.path)
+    # The longest common suffix is the part that moved along
+    old_parts, new_parts = old.split('/'), new.split('/')
+    while len(old_parts) > 1 and len(new_parts) > 1 and old_parts[-1] == new_parts[-1]:
+        old_parts.pop()
+        new_parts.pop()
+    if old_parts == new_parts:
+        return None
+    return '/'.join(old_parts), '/'.join(new_parts)
+
+
+def _stat_name(file):
+    """The name ``git diff --stat`` gives a renamed ``file``: ``src/{old => new}/a.py``."""
+    if file.old_path.startswith('"') or file.path.startswith('"'):
+        return f"{file.old_path} => {file.path}"
+    return _rename_name(file.old_path, file.path)
+
+
+class _StatNames:
+    """Matches stat lines against file names, including names git shortened to ``...tail``."""
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.tails = {}
+
+    def __contains__(self, line):
+        name = line.rsplit('|', 1)[0].strip()
+        if not name.startswith('...'):
+            return name in self.names
+        tail = name[3:]
+        if len(tail) not in self.tails:
+            self.tails[len(tail)] = {name[-len(tail):] for name in self.names if len(name) >= len(tail)}
+        return tail in self.tails[len(tail)]
+
+
+def _example(line):
+    line = line.strip()
+    return line if len(line) <= EXAMPLE_CHARS else line[:EXAMPLE_CHARS - 3] + '...'
+
+
+def _describe(pattern, hunks, files):
+    if len(files) <= MAX_NAMED_FILES:
+        where = f"in {', '.join(files)}"
+    else:
+        where = f"in {len(files)} files ({hunks} hunks)"
+    if pattern[0] == 'whitespace':
+        return f"whitespace-only changes {where}"
+    if pattern[0] == 'rename':
+        renames = ', '.join(f"`{old}` -> `{new}`" for old, new in pattern[1])
+        return f"renamed {renames} {where}"
+    _, removed, added = pattern
+    parts = [f"`-{_example(removed[0])}`" if removed else '', f"`+{_example(added[0])}`" if added else '']
+    more = len(removed) + len(added) - bool(removed) - bool(added)
+    return f"same edit {where}: {' '.join(part for part in parts if part)}" + (f" (+{more} lines)" if more else '')
+
+
+def normalize_diff(diff, min_repeats=MIN_REPEATS):
+    """Return ``diff`` with its mechanical changes collapsed into ``collapsed`` lines.
+
+    Whitespace-only hunks, identifier renames, identical edits and moves
+    between the same two directories go once they repeat ``min_repeats``
+    times. Files left with nothing else to show are dropped from the file
+    and stat lists, and collapsed moves from the name-status list too; the
+    stat totals still count them.
+    """
+    patterns = {}
+    for file in diff.files:
+        for hunk in file.hunks:
+            pattern = fingerprint(hunk, file.path)
+            if pattern is not None:
+                patterns.setdefault(pattern, []).append((file, hunk))
+    moves = {}
+    for file in diff.files:
+        move = _move(file)
+        if move:
+            moves.setdefault(move, []).append(file)
+
+    collapsed_hunks = set()
+    collapsed = []
+    for pattern, occurrences in patterns.items():
+        if len(occurrences) >= min_repeats:
+            collapsed_hunks.update(id(hunk) for _, hunk in occurrences)
+            files = list(dict.fromkeys(file.path for file, _ in occurrences))
+            collapsed.append((len(occurrences), _describe(pattern, len(occurrences), files)))
+    moved = set()
+    for (old, new), files in moves.items():
+        if len(files) >= min_repeats:
+            moved.update(id(file) for file in files)
+            collapsed.append((len(files), f"moved {len(files)} files from `{old or '.'}/` to `{new or '.'}/`"))
+
+    if not collapsed:
+        return diff
+
+    files = []
+    dropped = []
+    removed_lines = 0
+    for file in diff.files:
+        hunks = [hunk for hunk in file.hunks if id(hunk) not in collapsed_hunks]
+        removed_lines += sum(hunk.line_count + 1 for hunk in file.hunks if id(hunk) in collapsed_hunks)
+        if id(file) in moved or (file.hunks and not hunks):
+            # Everything about it is described by a pattern
+            removed_lines += len(file.header)
+            dropped.append(file)
+            continue
+        if len(hunks) < len(file.hunks):
+            kept = DiffFile(file.status, file.path, old_path=file.old_path, old_mode=file.old_mode,
+                            new_mode=file.new_mode, old_oid=file.old_oid, new_oid=file.new_oid)
+            kept.header = file.header
+            kept.binary = file.binary
+            kept.hunks = hunks
+            file = kept
+        files.append(file)
+
+    # A file whose hunks all collapsed still changed: only moves are fully described
+    entries = {file.name_status for file in dropped if id(file) in moved}
+    paths = {file.path for file in dropped}
+    name_status = ''.join(line + '\n' for line in diff.name_status.splitlines() if line not in entries)
+    moved_names = _StatNames(_stat_name(file) for file in dropped if id(file) in moved)
+    stats = ''.join(
+        line + '\n' for line in diff.stats.splitlines()
+        if line.split('|')[0].strip() not in paths and line not in moved_names
+    )
+
+    return StagedDiff(
+        files=files,
+        name_status=name_status,
+        stats=stats,
+        total_lines=max(diff.total_lines - removed_lines, 0),
+        truncated=diff.truncated,
+        # Most frequent patterns first
+        collapsed=[line for _, line in sorted(collapsed, key=lambda item: -item[0])],
+    )
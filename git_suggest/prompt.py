@@ -0,0 +1,57 @@
+"""Prompt assembly and response cleanup shared by all model clients."""
+
+
+# Bump whenever SYSTEM_PROMPT or the way the prompt is assembled changes, so
+# cached responses generated from an older prompt are not reused.
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = """You are an expert programmer who writes concise and professional git commit messages.
+Based on the following git changes, generate a commit message.
+
+Guidelines:
+- Follow the "Conventional Commits" standard (e.g., 'feat:', 'fix:', 'docs:', 'style:', 'refactor:', 'test:').
+- The message should be a single line, 72 characters or less.
+- Do NOT include any extra text, explanations, or markdown formatting.
+- Just return the raw commit message.
+- Focus on WHAT changed and WHY, not implementation details.
+
+EXAMPLE:
+feat: add user login endpoint
+
+Here are the changes:
+"""
+
+
+# Map step of map-reduce summarization: one short description per component
+GROUP_PROMPT = """You are an expert programmer reviewing one component of a large change.
+Describe what changed in the files below and why, in one plain sentence of at most 20 words.
+Do NOT include a prefix, markdown or any other text.
+
+Component: {name}
+
+Here are the changes:
+"""
+
+
+def build_prompt(diff_summary):
+    """Assemble the full prompt sent to the model."""
+    return f"{SYSTEM_PROMPT}\n\n{diff_summary}"
+
+
+def build_group_prompt(name, diff_summary):
+    """Assemble the prompt asking for a one-line summary of one component."""
+    return f"{GROUP_PROMPT.format(name=name)}\n\n{diff_summary}"
+
+
+def extract_message(text):
+    """Return the first non-empty line of a model response, markdown removed."""
+    text = text.replace("`", "").replace("**", "")
+    for line in text.split('\n'):
+        if line.strip():
+            return line.strip()
+    return ''
+
+
+def first_line_complete(text):
+    """Whether a (partial) response already contains a full first line."""
+    return '\n' in text.replace("`", "").replace("**", "").lstrip()
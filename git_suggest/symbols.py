@@ -0,0 +1,491 @@
+"""Symbols added, removed and modified by a change, found without the model.
+
+Both versions of each changed file are read from git by blob OID and
+broken into a symbol table: functions, classes, methods, types and
+top-level variables with their line ranges, plus import lines. Python is
+parsed with ``ast`` (``tokenize`` when it does not parse, and on Python
+3.7, whose syntax trees have no end positions), JavaScript,
+TypeScript and Go with line-anchored regular expressions. Comparing the
+two tables, and the ranges against the changed lines of the hunks, tells
+which symbols the change adds, removes or modifies.
+
+Symbol tables only depend on blob contents, so they are cached by blob
+OID: a file that is staged again only has its new version parsed.
+"""
+
+import ast
+import io
+import posixpath
+import re
+import sys
+import threading
+import tokenize
+
+from .cache import ResponseCache, get_cache_dir, make_key
+from .exclude import NULL_OID
+from .git_backend import get_backend
+from .timings import count, phase
+
+
+# Bumped whenever extraction changes, so cached symbol tables are rebuilt
+EXTRACTOR_VERSION = 1
+
+# Larger changesets are left to the plain summary (or map-reduce)
+MAX_FILES = 300
+MAX_BLOB_BYTES = 256 * 1024
+
+SYMBOL_CACHE_MAX_ENTRIES = 20000
+
+# Before Python 3.12 the AST constructor keeps its recursion depth in
+# interpreter-wide state, so parses on two threads (batch workers, the
+# symbol prefetch) can fail with SystemError; they take turns instead
+_AST_LOCK = threading.Lock()
+
+# ``end_lineno``, which gives the ranges, appeared in Python 3.8
+_AST_RANGES = sys.version_info >= (3, 8)
+
+# Names listed per file and kind before "N more"
+MAX_NAMES = 12
+
+LANGUAGES = {
+    '.py': 'python', '.pyi': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'typescript', '.tsx': 'typescript', '.mts': 'typescript', '.cts': 'typescript',
+    '.go': 'go',
+}
+
+# Ranking of changed lines in the summary (lower first)
+DEFINITION_PRIORITY = 0
+SIGNATURE_PRIORITY = 1
+
+_JS_IDENTIFIER = r'[A-Za-z_$][\w$]*'
+_JS_DEFINITIONS = [
+    (re.compile(rf'^(\s*)(?:export\s+(?:default\s+)?)?(?:declare\s+)?(?:abstract\s+)?class\s+({_JS_IDENTIFIER})'),
+     'class'),
+    (re.compile(rf'^(\s*)(?:export\s+(?:default\s+)?)?(?:declare\s+)?(?:async\s+)?function\s*\*?\s*({_JS_IDENTIFIER})'),
+     'function'),
+    (re.compile(rf'^(\s*)(?:export\s+)?(?:declare\s+)?(?:const\s+)?(?:interface|enum|type)\s+({_JS_IDENTIFIER})'),
+     'type'),
+    (re.compile(rf'^(\s*)(?:export\s+)?(?:const|let|var)\s+({_JS_IDENTIFIER})\s*(?::[^=]+)?=\s*(?:async\s+)?'
+                rf'(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|{_JS_IDENTIFIER}\s*=>)'),
+     'function'),
+    (re.compile(rf'^()(?:export\s+)?(?:declare\s+)?(?:const|let|var)\s+({_JS_IDENTIFIER})'), 'variable'),
+]
+_JS_METHOD = re.compile(
+    rf'^(\s+)(?:(?:public|private|protected|static|readonly|async|override|abstract|get|set)\s+)*\*?'
+    rf'(#?{_JS_IDENTIFIER})\s*(?:<[^>]*>)?\([^)]*\)\s*(?::\s*[^{{]+)?\{{?\s*$'
+)
+_JS_IMPORT = re.compile(r'^\s*(?:import\b|export\s.*\bfrom\b)|\brequire\(')
+_JS_NOT_METHODS = {'if', 'for', 'while', 'switch', 'catch', 'function', 'return', 'with'}
+
+_GO_IDENTIFIER = r'[A-Za-z_]\w*'
+_GO_METHOD = re.compile(rf'^func\s*\(\s*(?:{_GO_IDENTIFIER}\s+)?\*?\s*({_GO_IDENTIFIER})[^)]*\)\s*({_GO_IDENTIFIER})')
+_GO_FUNCTION = re.compile(rf'^func\s+({_GO_IDENTIFIER})')
+_GO_DECLARATION = re.compile(rf'^(type|var|const)\s+({_GO_IDENTIFIER})')
+_GO_BLOCK = re.compile(r'^(type|var|const|import)\s*\(\s*$')
+_GO_BLOCK_ENTRY = re.compile(rf'^\s+({_GO_IDENTIFIER})\b')
+_GO_KINDS = {'type': 'type', 'var': 'variable', 'const': 'variable'}
+
+_PYTHON_DEFINITION = re.compile(r'\s*(?:async\s+)?(def|class)\s+(\w+)')
+
+_CLOSERS = ('}', ')', ']')
+
+
+class FileSymbols:
+    """The symbols one file's change adds, removes and modifies."""
+
+    __slots__ = ('path', 'added', 'removed', 'modified', 'key_lines')
+
+    def __init__(self, path, added=None, removed=None, modified=None, key_lines=None):
+        self.path = path
+        self.added = added or []        # (name, kind) pairs
+        self.removed = removed or []
+        self.modified = modified or []
+        # (line kind, line number) -> priority of definition and import lines,
+        # numbered in the old version for '-' lines and the new one for '+'
+        self.key_lines = key_lines or {}
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def __repr__(self):
+        return f"FileSymbols({self.path!r}, +{len(self.added)} -{len(self.removed)} ~{len(self.modified)})"
+
+
+def language_of(path):
+    """Return the language extracted for ``path``, or None if unsupported."""
+    return LANGUAGES.get(posixpath.splitext(path)[1].lower())
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip(' \t'))
+
+
+def _close_ranges(lines, definitions):
+    """Turn ``(name, kind, line, indent)`` definitions into ``[name, kind, start, end, line]``.
+
+    A definition ends before the next non-blank line indented no deeper than
+    itself; a closing bracket on that line belongs to the definition.
+    """
+    symbols = []
+    for name, kind, line, indent in definitions:
+        end = len(lines)
+        for number in range(line + 1, len(lines) + 1):
+            text = lines[number - 1]
+            if text.strip() and _indent(text) <= indent:
+                end = number if text.lstrip().startswith(_CLOSERS) else number - 1
+                break
+        symbols.append([name, kind, line, max(end, line), line])
+    return symbols
+
+
+def _nest(symbols):
+    """Qualify symbols inside classes (``Class.method``) and drop those inside functions."""
+    nested = []
+    enclosing = []
+    for symbol in symbols:
+        while enclosing and enclosing[-1][3] < symbol[2]:
+            enclosing.pop()
+        if enclosing:
+            # Functions inside functions are implementation details
+            if enclosing[-1][1] not in ('class', 'type'):
+                continue
+            symbol[0] = f"{enclosing[-1][0]}.{symbol[0]}"
+            if symbol[1] == 'function':
+                symbol[1] = 'method'
+        nested.append(symbol)
+        enclosing.append(symbol)
+    return nested
+
+
+def _python_ast(source):
+    with _AST_LOCK:
+        tree = ast.parse(source)
+    symbols = []
+    imports = []
+
+    def visit(node, prefix, in_class):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = prefix + child.name
+                if isinstance(child, ast.ClassDef):
+                    kind = 'class'
+                else:
+                    kind = 'method' if in_class else 'function'
+                start = min([decorator.lineno for decorator in child.decorator_list] + [child.lineno])
+                symbols.append([name, kind, start, child.end_lineno, child.lineno])
+                # Like _nest, leaves out functions inside functions
+                if kind == 'class':
+                    visit(child, name + '.', True)
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                imports.extend(range(child.lineno, child.end_lineno + 1))
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and not prefix:
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        symbols.append([target.id, 'variable', child.lineno, child.end_lineno, child.lineno])
+            elif not isinstance(child, (ast.expr, ast.Lambda)):
+                # if/try/with blocks at module or class level
+                visit(child, prefix, in_class)
+
+    visit(tree, '', False)
+    return symbols, imports
+
+
+def _python_tokens(source, lines):
+    """Fallback for sources ``ast`` rejects: ``def``/``class`` tokens at the start of a line."""
+    definitions = []
+    imports = []
+    previous = None
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.NAME and previous in (None, tokenize.NEWLINE, tokenize.NL,
+                                                            tokenize.INDENT, tokenize.DEDENT):
+                line = token.start[0]
+                match = _PYTHON_DEFINITION.match(lines[line - 1])
+                if token.string in ('def', 'class', 'async') and match:
+                    kind = 'class' if match.group(1) == 'class' else 'function'
+                    definitions.append((match.group(2), kind, line, token.start[1]))
+                elif token.string in ('import', 'from'):
+                    imports.append(line)
+            if token.type != tokenize.COMMENT:
+                previous = token.type
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass
+    return _nest(_close_ranges(lines, definitions)), imports
+
+
+def _python(source, lines):
+    if _AST_RANGES:
+        try:
+            return _python_ast(source)
+        except (SyntaxError, ValueError, RecursionError, SystemError):
+            pass
+    return _python_tokens(source, lines)
+
+
+def _javascript(lines):
+    definitions = []
+    imports = []
+    classes = []
+    in_comment = False
+    for number, text in enumerate(lines, 1):
+        stripped = text.strip()
+        if in_comment:
+            in_comment = '*/' not in stripped
+            continue
+        if stripped.startswith('/*'):
+            in_comment = '*/' not in stripped
+            continue
+        if not stripped or stripped.startswith('//'):
+            continue
+        if _JS_IMPORT.search(text):
+            imports.append(number)
+            continue
+
+        indent = _indent(text)
+        while classes and classes[-1] >= indent:
+            classes.pop()
+        for pattern, kind in _JS_DEFINITIONS:
+            match = pattern.match(text)
+            if match:
+                definitions.append((match.group(2), kind, number, indent))
+                if kind == 'class':
+                    classes.append(indent)
+                break
+        else:
+            match = _JS_METHOD.match(text)
+            if match and classes and match.group(2) not in _JS_NOT_METHODS:
+                definitions.append((match.group(2), 'function', number, indent))
+    return _nest(_close_ranges(lines, definitions)), imports
+
+
+def _go(lines):
+    definitions = []
+    imports = []
+    block = None
+    for number, text in enumerate(lines, 1):
+        if block:
+            if text.startswith(')'):
+                block = None
+            elif block == 'import':
+                imports.append(number)
+            else:
+                match = _GO_BLOCK_ENTRY.match(text)
+                if match and _indent(text) == 1:
+                    definitions.append((match.group(1), _GO_KINDS[block], number, 1))
+            continue
+
+        match = _GO_BLOCK.match(text)
+        if match:
+            block = match.group(1)
+            if block == 'import':
+                imports.append(number)
+            continue
+        if text.startswith('import'):
+            imports.append(number)
+            continue
+        match = _GO_METHOD.match(text)
+        if match:
+            definitions.append((f"{match.group(1)}.{match.group(2)}", 'method', number, 0))
+            continue
+        match = _GO_FUNCTION.match(text)
+        if match:
+            definitions.append((match.group(1), 'function', number, 0))
+            continue
+        match = _GO_DECLARATION.match(text)
+        if match:
+            definitions.append((match.group(2), _GO_KINDS[match.group(1)], number, 0))
+    return _close_ranges(lines, definitions), imports
+
+
+def extract_symbols(source, language):
+    """Return the symbol table of a file's ``source``.
+
+    Returns:
+        ``{'symbols': [[name, kind, start, end, line], ...], 'imports': [line, ...]}``
+        where ``start``/``end`` span the definition (decorators included) and
+        ``line`` is the one naming it; lines are numbered from 1.
+    """
+    lines = source.splitlines()
+    if language == 'python':
+        symbols, imports = _python(source, lines)
+    elif language in ('javascript', 'typescript'):
+        symbols, imports = _javascript(lines)
+    elif language == 'go':
+        symbols, imports = _go(lines)
+    else:
+        symbols, imports = [], []
+    return {'symbols': symbols, 'imports': imports}
+
+
+def _read_blobs(oids, cwd=None):
+    """Return ``{oid: text}`` for ``oids``, skipping blobs over ``MAX_BLOB_BYTES``."""
+    blobs = get_backend(cwd).read_blobs(oids, MAX_BLOB_BYTES)
+    return {oid: data.decode('utf-8', errors='replace') for oid, data in blobs.items()}
+
+
+def _changed_lines(file):
+    """Return the old line numbers a file's change removes and the new ones it adds.
+
+    Hunks whose lines were dropped to bound memory count as changed throughout.
+    """
+    removed = set()
+    added = set()
+    for hunk in file.hunks:
+        if hunk.truncated:
+            removed.update(range(hunk.old_start, hunk.old_start + hunk.old_count))
+            added.update(range(hunk.new_start, hunk.new_start + hunk.new_count))
+            continue
+        old, new = hunk.old_start, hunk.new_start
+        for line in hunk.lines:
+            if line.kind == '-':
+                removed.add(old)
+                old += 1
+            elif line.kind == '+':
+                added.add(new)
+                new += 1
+            elif line.kind == ' ':
+                old += 1
+                new += 1
+    return removed, added
+
+
+def _touches(symbol, lines):
+    return any(number in lines for number in range(symbol[2], symbol[3] + 1))
+
+
+def _key_lines(table, kind, key_lines):
+    for symbol in table['symbols']:
+        line = symbol[4]
+        key_lines[(kind, line)] = DEFINITION_PRIORITY
+        for number in (line + 1, line + 2):
+            key_lines.setdefault((kind, number), SIGNATURE_PRIORITY)
+    for line in table['imports']:
+        key_lines[(kind, line)] = DEFINITION_PRIORITY
+
+
+def compare_symbols(file, old, new):
+    """Compare a file's old and new symbol tables against the lines its hunks change."""
+    removed_lines, added_lines = _changed_lines(file)
+    old_symbols = {symbol[0]: symbol for symbol in old['symbols']}
+    new_symbols = {symbol[0]: symbol for symbol in new['symbols']}
+
+    added = [(name, symbol[1]) for name, symbol in new_symbols.items() if name not in old_symbols]
+    removed = [(name, symbol[1]) for name, symbol in old_symbols.items() if name not in new_symbols]
+    modified = [
+        (name, symbol[1]) for name, symbol in new_symbols.items()
+        if name in old_symbols and (_touches(symbol, added_lines) or _touches(old_symbols[name], removed_lines))
+    ]
+    # A class is not worth listing next to the methods that explain its change
+    changed = [name for name, _ in added + removed + modified]
+    modified = [(name, kind) for name, kind in modified
+                if not any(other.startswith(name + '.') for other in changed)]
+
+    key_lines = {}
+    _key_lines(old, '-', key_lines)
+    _key_lines(new, '+', key_lines)
+    return FileSymbols(file.path, added, removed, modified, key_lines)
+
+
+def _cache_key(oid, language):
+    return make_key('symbols', EXTRACTOR_VERSION, language, oid)
+
+
+def load_symbol_tables(files, cwd=None, cache=True, tables=None):
+    """Parse the old and new versions of the supported files among ``files``.
+
+    Only the raw records are needed, so this can run while git is still
+    producing the patch (see ``parse_diff``'s ``on_files``).
+
+    Args:
+        files: ``DiffFile`` objects with their raw records
+        cwd: Repository the blobs are read from
+        cache: Reuse and store symbol tables by blob OID
+        tables: Tables loaded earlier; only the missing ones are added
+
+    Returns:
+        ``{(oid, language): table}``, None for blobs that could not be read
+    """
+    tables = {} if tables is None else tables
+    files = [file for file in files if file.old_oid != file.new_oid and language_of(file.path)]
+    if not files or len(files) > MAX_FILES:
+        return tables
+
+    with phase('symbols'):
+        store = ResponseCache(get_cache_dir() / 'symbols', max_entries=SYMBOL_CACHE_MAX_ENTRIES) if cache else None
+        wanted = {}
+        for file in files:
+            language = language_of(file.path)
+            for oid in (file.old_oid, file.new_oid):
+                if not oid or oid == NULL_OID or (oid, language) in tables:
+                    continue
+                table = store.get(_cache_key(oid, language)) if store else None
+                if table is None:
+                    wanted[oid] = language
+                tables[(oid, language)] = table
+
+        if wanted:
+            blobs = _read_blobs(wanted, cwd)
+            fresh = {}
+            for oid, language in wanted.items():
+                if oid in blobs:
+                    table = extract_symbols(blobs[oid], language)
+                    tables[(oid, language)] = table
+                    fresh[_cache_key(oid, language)] = table
+            count('symbol_tables_parsed', len(fresh))
+            if store:
+                store.set_many(fresh)
+    return tables
+
+
+def get_file_symbols(files, cwd=None, cache=True, tables=None):
+    """Return ``{path: FileSymbols}`` for the supported files among ``files``.
+
+    Args:
+        files: ``DiffFile`` objects with their raw records and hunks
+        cwd: Repository the blobs are read from
+        cache: Reuse and store symbol tables by blob OID
+        tables: Tables from an earlier ``load_symbol_tables`` call
+    """
+    files = [file for file in files if file.hunks and not file.binary and language_of(file.path)]
+    if not files or len(files) > MAX_FILES:
+        return {}
+
+    tables = load_symbol_tables(files, cwd, cache, tables)
+    with phase('compare symbols'):
+        empty = {'symbols': [], 'imports': []}
+        result = {}
+        for file in files:
+            language = language_of(file.path)
+            old = tables.get((file.old_oid, language)) or empty
+            new = tables.get((file.new_oid, language)) or empty
+            result[file.path] = compare_symbols(file, old, new)
+        return result
+
+
+def _describe(name, kind):
+    if kind in ('function', 'method'):
+        return f"{name}()"
+    if kind in ('class', 'type'):
+        return f"{kind} {name}"
+    return name
+
+
+def _names(symbols):
+    names = [_describe(name, kind) for name, kind in symbols]
+    if len(names) > MAX_NAMES:
+        names = names[:MAX_NAMES] + [f"{len(names) - MAX_NAMES} more"]
+    return ', '.join(names)
+
+
+def render_symbols(file_symbols):
+    """Render one line per file with changed symbols, e.g. ``a.py: added f(); modified class A``."""
+    lines = []
+    for symbols in file_symbols:
+        if not symbols:
+            continue
+        parts = [f"{label} {_names(items)}" for label, items in
+                 (('added', symbols.added), ('modified', symbols.modified), ('removed', symbols.removed)) if items]
+        lines.append(f"{symbols.path}: {'; '.join(parts)}")
+    return lines
@@ -0,0 +1,141 @@
+"""Phase timings and counters behind ``--timings`` and ``--timings-json``.
+
+Instrumented code wraps its phases in ``phase(name)`` and reports sizes
+with ``count(name, value)``. Both are no-ops until ``enable()`` is called,
+so the instrumentation costs nothing on normal runs.
+"""
+
+import json
+import sys
+import threading
+import time
+
+
+class _Phase:
+    __slots__ = ('timings', 'name', 'started')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.record(self.name, time.perf_counter() - self.started, self.started)
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class Timings:
+    """Collects how long each phase of a run took, plus counters such as tokens sent."""
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.perf_counter()
+        self.phases = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        """Context manager timing the enclosed block as ``name``."""
+        return _Phase(self, name) if self.enabled else _NO_PHASE
+
+    def record(self, name, seconds, started=None):
+        """Record a phase measured elsewhere (``started``: its ``perf_counter`` start)."""
+        if self.enabled:
+            if started is None:
+                started = time.perf_counter() - seconds
+            entry = {'name': name, 'seconds': seconds, 'start': started - self.started}
+            thread = threading.current_thread()
+            if thread is not threading.main_thread():
+                entry['thread'] = thread.name
+            self.phases.append(entry)
+
+    def count(self, name, value=1):
+        """Add ``value`` to the counter ``name``."""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        """Phases in the order they started, each with the number of phases enclosing it."""
+        phases = []
+        enclosing = {}
+        # Nesting follows from the time spans, so concurrent requests need no
+        # bookkeeping; phases on background threads only nest among themselves.
+        for entry in sorted(self.phases, key=lambda entry: (entry['start'], -entry['seconds'])):
+            end = entry['start'] + entry['seconds']
+            stack = enclosing.setdefault(entry.get('thread'), [])
+            while stack and stack[-1] < end:
+                stack.pop()
+            phases.append(dict(entry, depth=len(stack)))
+            stack.append(end)
+        return {
+            'total_seconds': time.perf_counter() - self.started,
+            'phases': phases,
+            'counters': dict(self.counters),
+        }
+
+    def print_table(self, file=None):
+        """Print the phases in the order they started, nested phases indented."""
+        file = file or sys.stderr
+        data = self.to_dict()
+        total = data['total_seconds']
+        print("\n" + "="*60, file=file)
+        print(f"{'Phase':<40} {'ms':>10} {'%':>7}", file=file)
+        print("="*60, file=file)
+        for entry in data['phases']:
+            name = '  ' * entry['depth'] + entry['name'] + (f" [{entry['thread']}]" if 'thread' in entry else '')
+            share = entry['seconds'] / total * 100 if total else 0.0
+            print(f"{name:<40} {entry['seconds'] * 1000:>10.1f} {share:>6.1f}%", file=file)
+        print("-"*60, file=file)
+        print(f"{'total (since start)':<40} {total * 1000:>10.1f}", file=file)
+        if data['counters']:
+            print("", file=file)
+            for name, value in sorted(data['counters'].items()):
+                print(f"{name:<40} {value:>10}", file=file)
+        print("="*60, file=file)
+
+    def write_json(self, path):
+        """Write the timings as JSON to ``path`` (``-`` for stderr, keeping stdout clean)."""
+        if path == '-':
+            json.dump(self.to_dict(), sys.stderr, indent=2)
+            print(file=sys.stderr)
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+# The process-wide recorder used by the instrumented modules
+TIMINGS = Timings()
+
+
+def phase(name):
+    """Time the enclosed block as ``name`` (no-op unless enabled)."""
+    return TIMINGS.phase(name)
+
+
+def count(name, value=1):
+    """Add ``value`` to the counter ``name`` (no-op unless enabled)."""
+    TIMINGS.count(name, value)
+
+
+def enable(started=None):
+    """Start recording; ``started`` backdates the run start (e.g. to before imports)."""
+    TIMINGS.enabled = True
+    if started is not None:
+        TIMINGS.started = started
@@ -0,0 +1,349 @@
+"""Local log of per-run metrics, and the ``git-suggest stats`` report.
+
+With ``usage_log: true`` (it is off by default), every run that gets as
+far as producing a message appends one JSON line to ``usage.jsonl`` in the
+cache directory: the repository and model, how the message was obtained
+(model, cache, local inference), the diff and prompt sizes, the time spent
+in each phase, and what the user did with the message. No diff content or
+message text is stored, and nothing leaves the machine. ``git-suggest stats`` reads the log back and reports
+percentiles and trends per repository and model::
+
+    git-suggest stats --since 30 --by model
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from .cache import get_cache_dir
+from .config import Config
+from .metrics import percentile
+from .timings import TIMINGS
+from .version import __version__
+
+
+LOG_NAME = 'usage.jsonl'
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+
+# Timings counters copied into each entry
+COUNTERS = ('diff_files', 'diff_lines', 'summary_tokens', 'response_tokens', 'model_calls', 'attempts')
+
+# Phases whose percentiles ``stats`` reports, besides the time to the message
+REPORT_PHASES = ('git diff + parse', 'summarize', 'client setup', 'model request', 'first token')
+
+PERIODS = {
+    'day': '%Y-%m-%d',
+    'week': '%G-W%V',
+    'month': '%Y-%m',
+}
+
+
+def find_repo_root(cwd=None):
+    """Return the top directory of the repository containing ``cwd``, without running git."""
+    path = Path(cwd or os.getcwd()).resolve()
+    for directory in (path, *path.parents):
+        if (directory / '.git').exists():
+            return str(directory)
+    return str(path)
+
+
+class UsageLog:
+    """Append-only JSON lines file, rotated to ``<name>.1`` once it passes ``max_bytes``."""
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path).expanduser() if path else get_cache_dir() / LOG_NAME
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls, config):
+        """The log configured by ``usage_log_path`` and ``usage_log_max_bytes``, or None if ``usage_log`` is off."""
+        if not config.get('usage_log', False):
+            return None
+        return cls(config.get('usage_log_path'), config.get('usage_log_max_bytes') or DEFAULT_MAX_BYTES)
+
+    @property
+    def rotated_path(self):
+        return self.path.with_name(self.path.name + '.1')
+
+    def append(self, entry):
+        """Append ``entry``. Failures are ignored: the log is best effort."""
+        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+                os.replace(self.path, self.rotated_path)
+            # One write on an O_APPEND descriptor: concurrent runs never interleave lines
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    def read(self):
+        """Return every entry, oldest first, skipping lines that cannot be parsed."""
+        entries = []
+        for path in (self.rotated_path, self.path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+        return entries
+
+
+class RunRecord:
+    """The metrics of the current run, appended to the log when the process exits.
+
+    Fields are filled in as the run goes. Runs that end before a message is
+    produced (nothing staged, invalid configuration) are not recorded, and
+    nothing is with ``log`` None (``usage_log: false``).
+    """
+
+    def __init__(self, log, config, started):
+        """Initialize the record.
+
+        Args:
+            log: ``UsageLog`` to append to, or None
+            config: ``Config`` of the run
+            started: ``perf_counter`` value at process start
+        """
+        self.log = log
+        self.started = started
+        self.fields = {
+            'time': time.time(),
+            'version': __version__,
+            'provider': config.get_provider(),
+            'model': config.get('model', 'gemini-2.5-flash'),
+            'max_diff_lines': config.get('max_diff_lines', 300),
+            'source': None,
+            'outcome': None,
+            'regenerations': 0,
+        }
+
+    def update(self, **fields):
+        self.fields.update(fields)
+
+    def regenerated(self):
+        self.fields['regenerations'] += 1
+
+    def message_ready(self, source):
+        """Note how the message was obtained, and how long it took."""
+        self.update(source=source, message_seconds=round(time.perf_counter() - self.started, 4))
+
+    def write(self):
+        """Append the record, with the counters and phase timings collected by ``timings``."""
+        if self.log is None or self.fields['source'] is None:
+            return
+        data = TIMINGS.to_dict()
+        counters = data['counters']
+        phases = {}
+        for entry in data['phases']:
+            # Background work overlaps the phases below; only the critical path is kept
+            if 'thread' not in entry:
+                phases[entry['name']] = phases.get(entry['name'], 0.0) + entry['seconds']
+        entry = dict(self.fields, repo=find_repo_root())
+        entry.update((name, counters[name]) for name in COUNTERS if name in counters)
+        entry['summarized'] = counters.get('summarized_diffs', 0) > 0
+        entry['seconds'] = round(data['total_seconds'], 4)
+        entry['phases'] = {name: round(seconds, 4) for name, seconds in phases.items()}
+        self.log.append(entry)
+
+
+def _group_key(entry, by):
+    return tuple(entry.get(field) or '?' for field in by)
+
+
+def _share(entries, predicate):
+    return 100.0 * sum(1 for entry in entries if predicate(entry)) / len(entries) if entries else 0.0
+
+
+def _distribution(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p95': percentile(values, 95),
+        'max': max(values),
+    }
+
+
+def summarize_group(entries, period='week'):
+    """Percentiles, rates and per-period trend for one group of entries."""
+    model_runs = [entry for entry in entries if entry.get('model_calls')]
+    summary = {
+        'runs': len(entries),
+        'latency': _distribution([entry.get('message_seconds') for entry in entries]),
+        'phases': {},
+        'diff_lines': _distribution([entry.get('diff_lines') for entry in entries]),
+        'summary_tokens': _distribution([entry.get('summary_tokens') for entry in entries]),
+        'prompt_tokens': _distribution([entry.get('prompt_tokens') for entry in model_runs]),
+        'summarized_percent': _share(entries, lambda entry: entry.get('summarized')),
+        'sources': {},
+        'outcomes': {},
+        'regenerations_per_run': sum(entry.get('regenerations', 0) for entry in entries) / len(entries),
+        'trend': [],
+    }
+    for name in REPORT_PHASES:
+        distribution = _distribution([entry.get('phases', {}).get(name) for entry in entries])
+        if distribution:
+            summary['phases'][name] = distribution
+    for field, target in (('source', summary['sources']), ('outcome', summary['outcomes'])):
+        for entry in entries:
+            value = entry.get(field) or 'none'
+            target[value] = target.get(value, 0) + 1
+
+    buckets = {}
+    for entry in entries:
+        buckets.setdefault(time.strftime(PERIODS[period], time.localtime(entry.get('time', 0))), []).append(entry)
+    for label in sorted(buckets):
+        bucket = buckets[label]
+        latency = _distribution([entry.get('message_seconds') for entry in bucket])
+        prompt = _distribution([entry.get('prompt_tokens') for entry in bucket if entry.get('model_calls')])
+        summary['trend'].append({
+            'period': label,
+            'runs': len(bucket),
+            'latency_p50': latency['p50'] if latency else None,
+            'prompt_tokens_p50': prompt['p50'] if prompt else None,
+            'cache_percent': _share(bucket, lambda entry: entry.get('source') == 'cache'),
+        })
+    return summary
+
+
+def build_report(entries, by=('repo', 'model'), period='week'):
+    """Group ``entries`` by the ``by`` fields and summarize each group, largest first."""
+    groups = {}
+    for entry in entries:
+        groups.setdefault(_group_key(entry, by), []).append(entry)
+    report = []
+    for key, group in sorted(groups.items(), key=lambda item: -len(item[1])):
+        report.append(dict(summarize_group(group, period), group=dict(zip(by, key))))
+    return report
+
+
+def _seconds(distribution):
+    if not distribution:
+        return '-'
+    return (f"p50 {distribution['p50']:.2f} s  p90 {distribution['p90']:.2f} s  "
+            f"p95 {distribution['p95']:.2f} s")
+
+
+def _sizes(distribution):
+    if not distribution:
+        return '-'
+    return f"p50 {distribution['p50']:.0f}  p95 {distribution['p95']:.0f}  max {distribution['max']:.0f}"
+
+
+def _shares(counts, total):
+    return '  '.join(f"{name} {100.0 * value / total:.0f}%"
+                     for name, value in sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def print_report(report, periods=8, file=None):
+    """Print one block per group: latency percentiles, sizes, sources, outcomes and the recent trend."""
+    file = file or sys.stdout
+    for group in report:
+        label = ' · '.join(f"{field} {value}" for field, value in group['group'].items())
+        print(f"{label}: {group['runs']} run{'s' if group['runs'] != 1 else ''}", file=file)
+        print(f"  {'time to message':<18} {_seconds(group['latency'])}", file=file)
+        for name, distribution in group['phases'].items():
+            print(f"  {name:<18} {_seconds(distribution)}", file=file)
+        print(f"  {'diff lines':<18} {_sizes(group['diff_lines'])}  "
+              f"(summarized in {group['summarized_percent']:.0f}% of runs)", file=file)
+        print(f"  {'prompt tokens':<18} {_sizes(group['prompt_tokens'])}", file=file)
+        print(f"  {'message from':<18} {_shares(group['sources'], group['runs'])}", file=file)
+        print(f"  {'outcome':<18} {_shares(group['outcomes'], group['runs'])}  "
+              f"({group['regenerations_per_run']:.2f} regenerations per run)", file=file)
+        trend = group['trend'][-periods:]
+        if len(trend) > 1:
+            print(f"  {'trend':<18} {'runs':>6} {'p50 s':>8} {'tokens':>8} {'cached':>7}", file=file)
+            for row in trend:
+                latency = f"{row['latency_p50']:.2f}" if row['latency_p50'] is not None else '-'
+                tokens = f"{row['prompt_tokens_p50']:.0f}" if row['prompt_tokens_p50'] is not None else '-'
+                print(f"  {row['period']:<18} {row['runs']:>6} {latency:>8} {tokens:>8} "
+                      f"{row['cache_percent']:>6.0f}%", file=file)
+        print(file=file)
+
+
+def main(argv=None):
+    """Entry point for ``git-suggest stats``."""
+    parser = argparse.ArgumentParser(
+        prog='git-suggest stats',
+        description='Report latency, sizes and outcomes of past runs from the local usage log'
+    )
+    parser.add_argument(
+        '--by',
+        choices=['repo', 'model', 'repo,model'],
+        default='repo,model',
+        help='Group runs by repository, model or both (default: both)'
+    )
+    parser.add_argument(
+        '--since',
+        type=float,
+        metavar='DAYS',
+        help='Only include runs from the last DAYS days'
+    )
+    parser.add_argument(
+        '--here',
+        action='store_true',
+        help='Only include runs in the current repository'
+    )
+    parser.add_argument(
+        '--period',
+        choices=sorted(PERIODS),
+        default='week',
+        help='Bucket size of the trend (default: week)'
+    )
+    parser.add_argument(
+        '--periods',
+        type=int,
+        default=8,
+        help='Number of most recent periods shown in the trend (default: 8)'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the report as JSON'
+    )
+    parser.add_argument(
+        '--config', '-c',
+        type=str,
+        help='Path to custom configuration file'
+    )
+    args = parser.parse_args(argv)
+
+    config = Config(args.config)
+    log = UsageLog(config.get('usage_log_path'))
+    entries = log.read()
+    if args.since is not None:
+        cutoff = time.time() - args.since * 24 * 60 * 60
+        entries = [entry for entry in entries if entry.get('time', 0) >= cutoff]
+    if args.here:
+        repo = find_repo_root()
+        entries = [entry for entry in entries if entry.get('repo') == repo]
+
+    report = build_report(entries, tuple(args.by.split(',')), args.period)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    if not entries:
+        print(f"No runs recorded in {log.path}", file=sys.stderr)
+        if not config.get('usage_log', False):
+            print("The usage log is off: set usage_log: true to record runs.", file=sys.stderr)
+        return
+
+    first = time.strftime('%Y-%m-%d', time.localtime(min(entry.get('time', 0) for entry in entries)))
+    last = time.strftime('%Y-%m-%d', time.localtime(max(entry.get('time', 0) for entry in entries)))
+    print(f"{len(entries)} runs from {first} to {last} ({log.path})\n")
+    print_report(report, args.periods)
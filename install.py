@@ -179,6 +179,24 @@ def setup_git_alias():
             print("✗ Error: Failed to create git alias")
 
 
+def setup_commit_hooks():
+    """Offer to install the precomputing commit hooks into a repository"""
+    print()
+    repo = input("Install the commit hooks into a repository? Enter its path (leave empty to skip): ").strip()
+    
+    if repo:
+        try:
+            subprocess.run(
+                [sys.executable, "-m", "git_suggest", "hook", "install"],
+                cwd=os.path.expanduser(repo),
+                check=True
+            )
+            print("✓ Hooks installed: messages are prepared on 'git add' and filled in by 'git commit'")
+        except (subprocess.CalledProcessError, OSError):
+            print("✗ Error: Failed to install hooks")
+            print("   Run 'git-suggest hook install' inside the repository instead")
+
+
 def print_usage():
     """Print usage information"""
     print("\n" + "=" * 40)
@@ -191,6 +209,8 @@ def print_usage():
     print("  python -m git_suggest --help        # Show all options")
     print("\nOr use the git alias:")
     print("  git aic")
+    print("\nOr let 'git commit' fill in the message (per repository):")
+    print("  git-suggest hook install")
     print()
 
 
@@ -220,6 +240,9 @@ def main():
     # Setup git alias
     setup_git_alias()
     
+    # Setup commit hooks
+    setup_commit_hooks()
+    
     # Print usage
     print_usage()
 
@@ -75,6 +75,20 @@ if [ "$setup_alias" = "y" ] || [ "$setup_alias" = "Y" ]; then
     echo "  You can now use: git aic"
 fi
 
+echo ""
+
+# Setup commit hooks
+read -p "Install the commit hooks into a repository? Enter its path (leave empty to skip): " hook_repo
+
+if [ -n "$hook_repo" ]; then
+    if (cd "$hook_repo" && git-suggest hook install); then
+        echo "✓ Hooks installed: messages are prepared on 'git add' and filled in by 'git commit'"
+    else
+        echo "✗ Error: Failed to install hooks"
+        echo "  Run 'git-suggest hook install' inside the repository instead"
+    fi
+fi
+
 echo ""
 echo "======================================"
 echo "Installation Complete!"
@@ -89,3 +103,6 @@ echo ""
 echo "Or use the git alias:"
 echo "  git aic"
 echo ""
+echo "Or let 'git commit' fill in the message (per repository):"
+echo "  git-suggest hook install"
+echo ""
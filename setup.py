@@ -38,6 +38,10 @@ setup(
     ],
     python_requires=">=3.7",
     install_requires=requirements,
+    extras_require={
+        # In-process git access (see git_backend.py)
+        'pygit2': ['pygit2>=1.14'],
+    },
     entry_points={
         'console_scripts': [
             'git-suggest=git_suggest.cli:main',